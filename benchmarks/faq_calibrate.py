@@ -0,0 +1,103 @@
+"""
+Calibrate the direct FAQ answer threshold on a labelled eval set.
+
+Each line of the eval set (default benchmarks/data/faq_eval.jsonl) is
+{"lang": ..., "question": ..., "expected": <FAQ entry question or null>};
+null marks questions the FAQ does not cover, which must go to the LLM.
+
+For every candidate threshold the script reports:
+- hit rate: share of all questions answered locally,
+- precision: share of local answers that are the expected entry,
+- FAQ recall: share of FAQ questions answered locally.
+It recommends the lowest threshold whose precision reaches
+--target-precision, i.e. the most LLM calls saved without wrong answers,
+and prints the per-lookup latency.
+
+Usage (from the repository root):
+    python -m benchmarks.faq_calibrate
+    python -m benchmarks.faq_calibrate --target-precision 0.95 --show-errors
+"""
+
+import argparse
+import json
+import time
+from pathlib import Path
+
+from bot_core.faq_responder import FaqResponder
+
+DEFAULT_EVAL_SET = Path(__file__).parent / "data" / "faq_eval.jsonl"
+
+
+def load_eval_set(path: Path) -> list[dict]:
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def evaluate(samples: list[dict], scored: list[tuple[str | None, float]], threshold: float) -> dict[str, float]:
+    answered = correct = faq_total = faq_answered = 0
+    for sample, (predicted, confidence) in zip(samples, scored):
+        local = predicted is not None and confidence >= threshold
+        if sample["expected"] is not None:
+            faq_total += 1
+            faq_answered += local and predicted == sample["expected"]
+        if local:
+            answered += 1
+            correct += predicted == sample["expected"]
+    return {
+        "threshold": threshold,
+        "hit_rate": answered / len(samples),
+        "precision": correct / answered if answered else 1.0,
+        "recall": faq_answered / faq_total if faq_total else 0.0,
+        "wrong": answered - correct,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Calibrate FAQ_DIRECT_MIN_CONFIDENCE on a labelled eval set.")
+    parser.add_argument("--eval-set", type=Path, default=DEFAULT_EVAL_SET)
+    parser.add_argument("--target-precision", type=float, default=1.0)
+    parser.add_argument("--show-errors", action="store_true", help="list questions answered wrongly at the chosen threshold")
+    args = parser.parse_args()
+
+    samples = load_eval_set(args.eval_set)
+    responder = FaqResponder()
+
+    started = time.perf_counter()
+    matches = [responder.rank(s["lang"], s["question"]) for s in samples]
+    per_lookup_ms = (time.perf_counter() - started) / len(samples) * 1000
+    scored = [(m.entry.question if m.entry else None, m.confidence) for m in matches]
+
+    candidates = sorted({round(confidence, 2) for _, confidence in scored if confidence > 0})
+    results = [evaluate(samples, scored, threshold) for threshold in candidates]
+
+    print(f"{len(samples)} questions, {sum(s['expected'] is not None for s in samples)} covered by the FAQ")
+    print(f"lookup latency: {per_lookup_ms:.3f} ms\n")
+    print(" threshold  hit rate  precision  FAQ recall  wrong")
+    for r in results:
+        print(f"{r['threshold']:10.2f}  {r['hit_rate']:8.1%}  {r['precision']:9.1%}  {r['recall']:10.1%}  {r['wrong']:5d}")
+
+    eligible = [r for r in results if r["precision"] >= args.target_precision and r["hit_rate"] > 0]
+    if not eligible:
+        print(f"\nNo threshold reaches precision {args.target_precision:.0%}.")
+        return
+    best = eligible[0]
+    current = evaluate(samples, scored, responder.min_confidence)
+    print(
+        f"\nRecommended FAQ_DIRECT_MIN_CONFIDENCE={best['threshold']:g}: "
+        f"hit rate {best['hit_rate']:.1%}, precision {best['precision']:.1%}, FAQ recall {best['recall']:.1%}"
+    )
+    print(
+        f"Current ({responder.min_confidence:g}): "
+        f"hit rate {current['hit_rate']:.1%}, precision {current['precision']:.1%}, FAQ recall {current['recall']:.1%}"
+    )
+
+    if args.show_errors:
+        print("\nMisses and wrong answers at the recommended threshold:")
+        for sample, (predicted, confidence) in zip(samples, scored):
+            local = predicted is not None and confidence >= best["threshold"]
+            if (local and predicted != sample["expected"]) or (not local and sample["expected"] is not None):
+                print(f"  [{sample['lang']}] {confidence:5.2f} {sample['question']!r} → {predicted if local else 'LLM'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,312 @@
+"""
+Load test for the bot without Telegram or OpenAI.
+
+Setup:
+- benchmarks.mock_services runs in its own process and plays both the
+  OpenAI API (configurable latencies) and the Telegram Bot API.
+- Every workload runs in a fresh process that imports `bot` with
+  OPENAI_BASE_URL and the Bot API server pointed at the mocks, and with
+  the user store / TTS cache in a temporary directory.
+- Synthetic text or voice updates from `--users` users are fed straight
+  into the aiogram Dispatcher at `--rate` updates per second (open loop:
+  arrivals do not wait for earlier updates to finish).
+
+Report per workload: throughput, end-to-end latency percentiles
+(update fed → handler finished, including the voice reply), CPU time of
+the bot process and its ffmpeg children, peak RSS, per-stage latencies
+from the bot's own metrics and the number of upstream calls.
+
+Updates refused by admission control (rate-limited per user, or shed
+because the admission queue is full) and updates that raised are counted
+separately. They are left out of the throughput and latency figures:
+a refusal returns within milliseconds, and counting it would make an
+overloaded run look faster.
+
+Usage (from the repository root, ffmpeg on PATH):
+    python -m benchmarks.load_test --workload text,voice --rate 20 --duration 30
+    python -m benchmarks.load_test --workload voice --stt-latency 1.0 --tts-latency 1.5
+"""
+
+import argparse
+import asyncio
+import contextvars
+import json
+import multiprocessing
+import os
+import random
+import resource
+import statistics
+import tempfile
+import time
+import urllib.request
+
+from .mock_services import MockLatency, serve
+
+BOT_TOKEN = "123456:LOAD-TEST"
+
+QUESTIONS = {
+    "ru": [
+        "Как поменять пароль от вайфая?",
+        "Хочу приостановить интернет на время отпуска",
+        "Как перенести интернет на новый адрес?",
+        "До какого числа нужно оплатить счёт?",
+    ],
+    "kz": [
+        "Wi-Fi құпиясөзін қалай ауыстырамын?",
+        "Қызметті уақытша тоқтатуға бола ма?",
+    ],
+    "en": [
+        "How do I change my wifi password?",
+        "Can I pause my internet while I travel?",
+    ],
+}
+
+
+# Outcome of the update being fed in the current task, set by the admission hooks below
+_outcome: contextvars.ContextVar[list[str] | None] = contextvars.ContextVar("load_test_outcome", default=None)
+
+
+def _mark(outcome: str) -> None:
+    marks = _outcome.get()
+    if marks is not None:
+        marks.append(outcome)
+
+
+def _hook_admission(admission) -> None:
+    """Record, per update, whether admission control refused it (the middleware runs in the feeding task)."""
+    try_consume = admission.rate_limiter.try_consume
+    acquire = admission.queue.acquire
+
+    def _try_consume(user_id: int, cost: float):
+        allowed, notify = try_consume(user_id, cost)
+        if not allowed:
+            _mark("rate_limited")
+        return allowed, notify
+
+    async def _acquire() -> bool:
+        admitted = await acquire()
+        if not admitted:
+            _mark("shed")
+        return admitted
+
+    admission.rate_limiter.try_consume = _try_consume
+    admission.queue.acquire = _acquire
+
+
+def _percentile(sorted_values: list[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+def _make_update(update_id: int, user_id: int, lang: str, voice: bool, voice_seconds: int) -> dict:
+    message = {
+        "message_id": update_id,
+        "date": int(time.time()),
+        "chat": {"id": user_id, "type": "private"},
+        "from": {"id": user_id, "is_bot": False, "first_name": "Load"},
+    }
+    if voice:
+        message["voice"] = {
+            "file_id": f"in-voice-{update_id}",
+            "file_unique_id": f"in-{update_id}",
+            "duration": voice_seconds,
+            "mime_type": "audio/ogg",
+        }
+    else:
+        # The suffix keeps questions distinct so the answer cache does not hide the load.
+        message["text"] = f"{random.choice(QUESTIONS[lang])} ({update_id})"
+    return {"update_id": update_id, "message": message}
+
+
+async def _drive(args: argparse.Namespace, workload: str) -> dict:
+    from aiogram import Bot
+    from aiogram.client.session.aiohttp import AiohttpSession
+    from aiogram.client.telegram import TelegramAPIServer
+
+    import bot as app
+    from bot_core.metrics import registry
+
+    base_url = f"http://127.0.0.1:{args.port}"
+    bot = Bot(token=BOT_TOKEN, session=AiohttpSession(api=TelegramAPIServer.from_base(base_url)))
+    await app.dp.emit_startup(bot=bot, dispatcher=app.dp)
+    _hook_admission(app.admission)
+
+    langs = args.langs.split(",")
+    users = [(1_000_000 + i, langs[i % len(langs)]) for i in range(args.users)]
+    for user_id, lang in users:
+        await app.user_store.set_language(user_id, lang)
+
+    total = int(args.rate * args.duration)
+    latencies: list[float] = []
+    errors = 0
+    rejected = {"rate_limited": 0, "shed": 0}
+
+    async def _one(update_id: int) -> None:
+        nonlocal errors
+        user_id, lang = users[update_id % len(users)]
+        voice = workload == "voice" or (workload == "mixed" and random.random() < args.voice_share)
+        update = _make_update(update_id, user_id, lang, voice, args.voice_seconds)
+        marks: list[str] = []
+        _outcome.set(marks)
+        started = time.perf_counter()
+        try:
+            await app.dp.feed_raw_update(bot, update)
+        except Exception:
+            errors += 1
+            return
+        if marks:
+            rejected[marks[0]] += 1
+            return
+        latencies.append(time.perf_counter() - started)
+
+    usage_before = resource.getrusage(resource.RUSAGE_SELF)
+    children_before = resource.getrusage(resource.RUSAGE_CHILDREN)
+    started = time.perf_counter()
+    tasks = []
+    for update_id in range(1, total + 1):
+        delay = started + (update_id - 1) / args.rate - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(_one(update_id)))
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - started
+    usage_after = resource.getrusage(resource.RUSAGE_SELF)
+    children_after = resource.getrusage(resource.RUSAGE_CHILDREN)
+
+    stages = registry.stage_snapshot()
+    admission = app.admission.stats()
+    await app.dp.emit_shutdown(bot=bot, dispatcher=app.dp)
+    await bot.session.close()
+
+    latencies.sort()
+    return {
+        "workload": workload,
+        "updates": total,
+        "completed": len(latencies),
+        "errors": errors,
+        **rejected,
+        "elapsed": elapsed,
+        "throughput": len(latencies) / elapsed,
+        "mean": statistics.mean(latencies) if latencies else 0.0,
+        "p50": _percentile(latencies, 0.50),
+        "p95": _percentile(latencies, 0.95),
+        "p99": _percentile(latencies, 0.99),
+        "cpu_bot": (usage_after.ru_utime + usage_after.ru_stime) - (usage_before.ru_utime + usage_before.ru_stime),
+        "cpu_children": (
+            (children_after.ru_utime + children_after.ru_stime)
+            - (children_before.ru_utime + children_before.ru_stime)
+        ),
+        "max_rss_mb": usage_after.ru_maxrss / 1024,
+        "stages": stages,
+        "admission": admission,
+    }
+
+
+def _run_workload(args: argparse.Namespace, workload: str, results: multiprocessing.Queue) -> None:
+    with tempfile.TemporaryDirectory(prefix="bot-load-") as tmp:
+        os.environ.update({
+            "BOT_TOKEN": BOT_TOKEN,
+            "OPENAI_API_KEY": "load-test",
+            "OPENAI_BASE_URL": f"http://127.0.0.1:{args.port}/v1",
+            "USER_STORE_PATH": os.path.join(tmp, "users.sqlite3"),
+            "TTS_CACHE_DIR": os.path.join(tmp, "tts_cache"),
+            "METRICS_PORT": "0",
+            "BOT_MODE": "polling",
+            # The mock voice note is a steady tone; silence trimming is measured only on request.
+            "STT_VAD": os.environ.get("STT_VAD", "0"),
+        })
+        results.put(asyncio.run(_drive(args, workload)))
+
+
+def _print_report(report: dict, upstream: dict) -> None:
+    print(f"\n=== {report['workload']} ===")
+    print(
+        f"updates {report['updates']} in {report['elapsed']:.1f}s: completed {report['completed']}, "
+        f"rate-limited {report['rate_limited']}, shed {report['shed']}, errors {report['errors']}"
+    )
+    print(f"throughput {report['throughput']:.1f} completed updates/s")
+    print(
+        f"end-to-end latency of completed updates: mean {report['mean']:.2f}s  p50 {report['p50']:.2f}s  "
+        f"p95 {report['p95']:.2f}s  p99 {report['p99']:.2f}s"
+    )
+    print(
+        f"CPU: bot {report['cpu_bot']:.1f}s, ffmpeg {report['cpu_children']:.1f}s "
+        f"({(report['cpu_bot'] + report['cpu_children']) / max(1, report['updates']) * 1000:.1f} ms/update), "
+        f"peak RSS {report['max_rss_mb']:.0f} MB"
+    )
+    print(f"admission: {report['admission']}")
+    print("stages (p50 / p95 / p99, bucket upper bounds):")
+    for stage, snap in sorted(report["stages"].items()):
+        print(f"  {stage:28s} n={snap['count']:<6d} {snap['p50']:g} / {snap['p95']:g} / {snap['p99']:g}s")
+    print(f"upstream calls: {json.dumps(upstream, sort_keys=True)}")
+
+
+def _fetch_stats(port: int) -> dict:
+    with urllib.request.urlopen(f"http://127.0.0.1:{port}/stats") as resp:
+        return json.load(resp)
+
+
+def _wait_ready(port: int, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            _fetch_stats(port)
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.2)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Load test the bot against local mock services.")
+    parser.add_argument("--workload", default="text,voice", help="comma-separated: text, voice, mixed")
+    parser.add_argument("--rate", type=float, default=10.0, help="updates per second")
+    parser.add_argument("--duration", type=float, default=20.0, help="seconds of arrivals per workload")
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--langs", default="ru,kz,en")
+    parser.add_argument("--voice-share", type=float, default=0.3, help="voice fraction for the mixed workload")
+    parser.add_argument("--voice-seconds", type=int, default=5, help="duration of incoming voice notes")
+    parser.add_argument("--answer-sentences", type=int, default=6)
+    parser.add_argument("--chat-first-token", type=float, default=0.4)
+    parser.add_argument("--chat-latency", type=float, default=1.5)
+    parser.add_argument("--stt-latency", type=float, default=0.6)
+    parser.add_argument("--tts-latency", type=float, default=0.8)
+    parser.add_argument("--telegram-latency", type=float, default=0.05)
+    parser.add_argument("--port", type=int, default=18081, help="port of the mock services")
+    args = parser.parse_args()
+
+    ctx = multiprocessing.get_context("spawn")
+    latency = MockLatency(
+        chat_first_token=args.chat_first_token,
+        chat_total=args.chat_latency,
+        stt=args.stt_latency,
+        tts=args.tts_latency,
+        telegram=args.telegram_latency,
+    )
+    mocks = ctx.Process(
+        target=serve,
+        args=(args.port, latency, args.answer_sentences, args.voice_seconds),
+        daemon=True,
+    )
+    mocks.start()
+    try:
+        _wait_ready(args.port)
+        for workload in args.workload.split(","):
+            calls_before = _fetch_stats(args.port)
+            results = ctx.Queue()
+            worker = ctx.Process(target=_run_workload, args=(args, workload, results))
+            worker.start()
+            report = results.get()
+            worker.join()
+            calls_after = _fetch_stats(args.port)
+            upstream = {k: v - calls_before.get(k, 0) for k, v in calls_after.items() if v != calls_before.get(k, 0)}
+            _print_report(report, upstream)
+    finally:
+        mocks.terminate()
+        mocks.join()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+"""
+Local stand-ins for the OpenAI API and the Telegram Bot API, for load tests.
+
+OpenAI (under /v1, point OPENAI_BASE_URL at it):
+- chat/completions — plain and streaming (SSE, with usage when requested).
+  The answer has `answer_sentences` sentences and quotes the question, so
+  answers (and therefore TTS cache keys) differ per question.
+- audio/transcriptions — returns a unique transcript after `stt_latency`.
+- audio/speech — "pcm" returns 24 kHz s16le audio sized by text length,
+  anything else returns a pre-encoded MP3.
+
+Telegram (point aiogram's TelegramAPIServer at it):
+- /bot<token>/<method> answers every method with a plausible result
+  (messages, voice messages with file ids, files); unknown methods get `true`.
+- /file/bot<token>/<path> serves a pre-encoded OGG/Opus voice note.
+- GET /stats returns call counts per Telegram method and OpenAI endpoint.
+
+All latencies are configurable; ffmpeg is needed once at start-up to
+encode the sample audio.
+"""
+
+import asyncio
+import itertools
+import json
+import os
+import subprocess
+import time
+from collections import Counter
+from dataclasses import dataclass
+
+from aiohttp import web
+
+PCM_BYTES_PER_SECOND = 24000 * 2
+# Roughly how fast TTS voices speak.
+CHARS_PER_SECOND = 15
+
+
+@dataclass
+class MockLatency:
+    chat_first_token: float = 0.4
+    chat_total: float = 1.5
+    stt: float = 0.6
+    tts: float = 0.8
+    telegram: float = 0.05
+
+
+def _encode_sample(args: list[str], seconds: float) -> bytes:
+    cmd = [
+        "ffmpeg", "-hide_banner", "-loglevel", "error",
+        "-f", "lavfi", "-i", f"sine=frequency=220:duration={seconds}",
+        *args, "pipe:1",
+    ]
+    return subprocess.run(cmd, check=True, capture_output=True).stdout
+
+
+def build_app(latency: MockLatency, answer_sentences: int = 6, voice_seconds: float = 5.0) -> web.Application:
+    voice_note = _encode_sample(["-ac", "1", "-c:a", "libopus", "-b:a", "32k", "-f", "ogg"], voice_seconds)
+    mp3 = _encode_sample(["-ac", "1", "-f", "mp3"], 3.0)
+    noise_second = os.urandom(PCM_BYTES_PER_SECOND)
+    calls: Counter = Counter()
+    ids = itertools.count(1)
+
+    # --- OpenAI ---------------------------------------------------------
+
+    def _answer_for(body: dict) -> str:
+        question = next((m["content"] for m in reversed(body["messages"]) if m["role"] == "user"), "")
+        sentences = [f"Ответ на вопрос «{question[:60]}»."]
+        sentences += [
+            f"Это предложение номер {i} тестового ответа, примерно такой же длины, как настоящий ответ бота."
+            for i in range(2, answer_sentences + 1)
+        ]
+        return " ".join(sentences)
+
+    async def chat_completions(request: web.Request) -> web.StreamResponse:
+        calls["openai.chat"] += 1
+        body = await request.json()
+        answer = _answer_for(body)
+        prompt_tokens = sum(len(m["content"]) for m in body["messages"]) // 4
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": len(answer) // 4,
+            "total_tokens": prompt_tokens + len(answer) // 4,
+        }
+        base = {"id": f"chatcmpl-{next(ids)}", "created": int(time.time()), "model": body.get("model", "mock")}
+
+        if not body.get("stream"):
+            await asyncio.sleep(latency.chat_total)
+            return web.json_response({
+                **base,
+                "object": "chat.completion",
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": answer},
+                    "finish_reason": "stop",
+                }],
+                "usage": usage,
+            })
+
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        await asyncio.sleep(latency.chat_first_token)
+        words = answer.split(" ")
+        step = max(0.0, latency.chat_total - latency.chat_first_token) / max(1, len(words))
+        for i, word in enumerate(words):
+            chunk = {
+                **base,
+                "object": "chat.completion.chunk",
+                "choices": [{"index": 0, "delta": {"content": word if i == 0 else " " + word}, "finish_reason": None}],
+            }
+            await response.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode())
+            await asyncio.sleep(step)
+        if (body.get("stream_options") or {}).get("include_usage"):
+            chunk = {**base, "object": "chat.completion.chunk", "choices": [], "usage": usage}
+            await response.write(f"data: {json.dumps(chunk)}\n\n".encode())
+        await response.write(b"data: [DONE]\n\n")
+        await response.write_eof()
+        return response
+
+    async def transcriptions(request: web.Request) -> web.Response:
+        calls["openai.stt"] += 1
+        await request.read()
+        await asyncio.sleep(latency.stt)
+        return web.json_response({"text": f"Как поменять пароль от вайфая? Запрос номер {next(ids)}"})
+
+    async def speech(request: web.Request) -> web.Response:
+        calls["openai.tts"] += 1
+        body = await request.json()
+        await asyncio.sleep(latency.tts)
+        if body.get("response_format") == "pcm":
+            seconds = max(1, len(body["input"]) // CHARS_PER_SECOND)
+            return web.Response(body=noise_second * seconds, content_type="application/octet-stream")
+        return web.Response(body=mp3, content_type="audio/mpeg")
+
+    # --- Telegram -------------------------------------------------------
+
+    def _message(chat_id, **extra) -> dict:
+        return {
+            "message_id": next(ids),
+            "date": int(time.time()),
+            "chat": {"id": int(chat_id), "type": "private"},
+            **extra,
+        }
+
+    async def bot_method(request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        calls[f"telegram.{method}"] += 1
+        if request.content_type.startswith("multipart/") or request.content_type.endswith("urlencoded"):
+            params = dict(await request.post())
+        else:
+            params = await request.json() if request.can_read_body else {}
+        await asyncio.sleep(latency.telegram)
+
+        name = method.lower()
+        chat_id = params.get("chat_id", 0)
+        if name in ("sendmessage", "editmessagetext"):
+            result = _message(chat_id, text=str(params.get("text", "")))
+        elif name in ("sendvoice", "sendaudio", "senddocument"):
+            file_number = next(ids)
+            kind = {"sendvoice": "voice", "sendaudio": "audio", "senddocument": "document"}[name]
+            result = _message(chat_id, **{kind: {
+                "file_id": f"{kind}-{file_number}",
+                "file_unique_id": f"u{file_number}",
+                "duration": 3,
+            }})
+            if kind == "document":
+                result["document"].pop("duration")
+        elif name == "getfile":
+            result = {
+                "file_id": params.get("file_id", ""),
+                "file_unique_id": "u0",
+                "file_size": len(voice_note),
+                "file_path": "voice/sample.oga",
+            }
+        elif name == "getme":
+            result = {"id": 1, "is_bot": True, "first_name": "LoadTestBot", "username": "load_test_bot"}
+        else:
+            result = True
+        return web.json_response({"ok": True, "result": result})
+
+    async def download(request: web.Request) -> web.Response:
+        calls["telegram.download"] += 1
+        await asyncio.sleep(latency.telegram)
+        return web.Response(body=voice_note, content_type="audio/ogg")
+
+    async def stats(request: web.Request) -> web.Response:
+        return web.json_response(dict(calls))
+
+    app = web.Application(client_max_size=64 * 1024 * 1024)
+    app.router.add_post("/v1/chat/completions", chat_completions)
+    app.router.add_post("/v1/audio/transcriptions", transcriptions)
+    app.router.add_post("/v1/audio/speech", speech)
+    app.router.add_post("/bot{token}/{method}", bot_method)
+    app.router.add_get("/file/bot{token}/{path:.+}", download)
+    app.router.add_get("/stats", stats)
+    return app
+
+
+def serve(port: int, latency: MockLatency, answer_sentences: int = 6, voice_seconds: float = 5.0) -> None:
+    """Run the mock services in the current process until it is terminated."""
+    web.run_app(
+        build_app(latency, answer_sentences, voice_seconds),
+        host="127.0.0.1",
+        port=port,
+        access_log=None,
+        print=None,
+    )
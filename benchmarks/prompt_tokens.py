@@ -0,0 +1,140 @@
+"""
+Compare the monolithic prompt with retrieval-based prompt assembly.
+
+Reports, per language, input tokens per request for PROMPT_MODE="full"
+and "retrieval" over a set of typical questions, and which FAQ entries
+were retrieved. With --live, the same questions are also sent to the
+chat model in both modes and latency / reported prompt tokens are compared.
+
+Usage (from the repository root):
+    python -m benchmarks.prompt_tokens
+    python -m benchmarks.prompt_tokens --live --repeat 3
+
+Token counts use tiktoken when it is installed and its encoding can be
+loaded, otherwise a rough estimate (~4 characters per token) is printed.
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import time
+
+from dotenv import load_dotenv
+
+from bot_core.prompts import build_messages, find_faq
+
+SAMPLE_QUESTIONS: dict[str, list[str]] = {
+    "ru": [
+        "Как поменять пароль от вайфая?",
+        "Хочу приостановить интернет на время отпуска, сколько стоит?",
+        "Я переезжаю, как перенести интернет на новый адрес?",
+        "До какого числа нужно оплатить счёт?",
+        "Какие документы нужны для подключения?",
+        "Не работает интернет, как вызвать мастера?",
+        "Какие тарифы на телевидение?",
+    ],
+    "kz": [
+        "Wi-Fi құпиясөзін қалай ауыстырамын?",
+        "Қызметті уақытша тоқтатуға бола ма?",
+        "Жаңа пәтерге көшіп жатырмын, интернетті қалай қосамын?",
+        "Қосылу үшін қандай құжат керек?",
+    ],
+    "en": [
+        "How do I change my wifi password?",
+        "Can I pause my internet while I travel?",
+        "I am moving to a new apartment, what should I do?",
+        "What documents do I need to connect?",
+        "How to call abroad from my home phone?",
+    ],
+}
+
+
+def _token_counter():
+    try:
+        import tiktoken
+
+        encoding = tiktoken.get_encoding("cl100k_base")
+        return (lambda text: len(encoding.encode(text))), "tiktoken cl100k_base"
+    except Exception:
+        return (lambda text: max(1, round(len(text) / 4))), "estimate (~4 chars/token)"
+
+
+def count_tokens(messages: list[dict[str, str]], count) -> int:
+    # Chat format adds ~4 tokens per message plus 3 for the reply primer.
+    return sum(count(m["content"]) + 4 for m in messages) + 3
+
+
+def report_tokens() -> None:
+    count, method = _token_counter()
+    print(f"Token counting: {method}\n")
+
+    for lang, questions in SAMPLE_QUESTIONS.items():
+        full_tokens, retrieval_tokens = [], []
+        print(f"[{lang}]")
+        for question in questions:
+            full = count_tokens(build_messages(lang, question, mode="full"), count)
+            retrieval = count_tokens(build_messages(lang, question, mode="retrieval"), count)
+            full_tokens.append(full)
+            retrieval_tokens.append(retrieval)
+            hits = ", ".join(f"{entry.question} ({score:.2f})" for entry, score in find_faq(lang, question)) or "—"
+            print(f"  {full:5d} → {retrieval:5d}  {question}\n           FAQ: {hits}")
+
+        full_mean = statistics.mean(full_tokens)
+        retrieval_mean = statistics.mean(retrieval_tokens)
+        print(
+            f"  mean input tokens: full {full_mean:.0f}, retrieval {retrieval_mean:.0f} "
+            f"({(retrieval_mean - full_mean) / full_mean:+.1%})\n"
+        )
+
+
+async def report_latency(repeat: int) -> None:
+    from bot_core.openai_client import create_openai_client
+
+    client = create_openai_client(os.environ["OPENAI_API_KEY"])
+    model = os.getenv("OPENAI_MODEL", "gpt-3.5-turbo")
+    results: dict[str, list[tuple[float, int]]] = {"full": [], "retrieval": []}
+    try:
+        for lang, questions in SAMPLE_QUESTIONS.items():
+            for question in questions:
+                for _ in range(repeat):
+                    # Alternate modes so drift in API latency affects both equally.
+                    for mode in results:
+                        started = time.perf_counter()
+                        resp = await client.chat.completions.create(
+                            model=model,
+                            messages=build_messages(lang, question, mode=mode),
+                            max_tokens=600,
+                            temperature=0.2,
+                        )
+                        prompt_tokens = resp.usage.prompt_tokens if resp.usage else 0
+                        results[mode].append((time.perf_counter() - started, prompt_tokens))
+    finally:
+        await client.close()
+
+    print(f"Live latency ({model}, {repeat} run(s) per question):")
+    for mode, samples in results.items():
+        latencies = sorted(latency for latency, _ in samples)
+        p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+        print(
+            f"  {mode:9s} p50 {statistics.median(latencies):.2f}s  p95 {p95:.2f}s  "
+            f"mean prompt tokens {statistics.mean(t for _, t in samples):.0f}"
+        )
+
+
+def main() -> None:
+    load_dotenv()
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--live", action="store_true", help="also measure latency against the OpenAI API")
+    parser.add_argument("--repeat", type=int, default=1, help="live runs per question and mode")
+    args = parser.parse_args()
+
+    report_tokens()
+    if args.live:
+        if not os.getenv("OPENAI_API_KEY"):
+            raise SystemExit("OPENAI_API_KEY не задан, --live недоступен.")
+        asyncio.run(report_latency(args.repeat))
+
+
+if __name__ == "__main__":
+    main()
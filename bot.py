@@ -1,23 +1,53 @@
 import os
-import re
 import asyncio
 import logging
+import time
 
-import tempfile
 import subprocess
-from io import BytesIO
-from pathlib import Path
 
-from aiogram.types import FSInputFile
+from aiogram.types import BufferedInputFile
 
 from dotenv import load_dotenv
 load_dotenv()
 
 from aiogram import Bot, Dispatcher
-from aiogram.filters import Command
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
+from aiogram.filters import Command, CommandObject
 from aiogram.types import Message, ReplyKeyboardMarkup, KeyboardButton, ReplyKeyboardRemove
 
-from openai import OpenAI
+from bot_core import audio, stt, webhook
+from bot_core.admission import AdmissionMiddleware, get_resource_stats, resource_slot
+from bot_core.answer_cache import AnswerCache, prompt_fingerprint
+from bot_core.conf import (
+    BOT_MODE,
+    FAQ_DIRECT_ANSWERS,
+    MEMORY_SUMMARY_TOKENS,
+    METRICS_PORT,
+    OPENAI_CHAT_TIMEOUT,
+    OUTBOX_GLOBAL_RATE,
+    PROMPT_MODE,
+    STREAM_ANSWERS,
+    VOICE_MAX_DURATION_SECONDS,
+    VOICE_MAX_FILE_BYTES,
+    WEBHOOK_WORKERS,
+)
+from bot_core.faq_responder import FaqResponder, render_answer as render_faq_answer
+from bot_core.markdown import clean_markdown
+from bot_core.memory import ConversationMemory
+from bot_core.metrics import current_lang, registry, span, start_metrics_server
+from bot_core.openai_client import create_openai_client
+from bot_core.outbox import Outbox
+from bot_core.prompts import build_full_prompt, build_messages
+from bot_core.streaming import ProgressiveReply
+from bot_core.tts import synthesize_voice_note
+from bot_core.tts_cache import TTSCache, make_key as make_tts_key
+from bot_core.user_store import UserProfileStore
+from bot_core.voice_policy import (
+    VOICE_MODES,
+    effective_mode as effective_voice_mode,
+    next_mode as next_voice_mode,
+    skip_reason as voice_skip_reason,
+)
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -31,154 +61,75 @@ if not BOT_TOKEN:
 if not OPENAI_API_KEY:
     raise RuntimeError("OPENAI_API_KEY не задан. Установи переменную окружения OPENAI_API_KEY.")
 
-openai_client = OpenAI(api_key=OPENAI_API_KEY)
-
-
-def clean_markdown(text: str) -> str:
-    if not text:
-        return text
-    text = re.sub(r'####\s*(.+)', r'*\1*', text)
-    text = re.sub(r'\[\[[^\]]+]]\([^)]+\)', '', text)
-    return text.strip()
-
-
-SYSTEM_PROMPTS = {
-    "ru": {
-        "role": "system",
-        "content": (
-            "Ты — официальный цифровой помощник АО «Қазақтелеком» (Kazakhtelecom JSC). "
-            "Кратко, вежливо и профессионально отвечай на вопросы на русском языке.\n\n"
-
-            "Кратко о компании:\n"
-            "Крупнейший инфокоммуникационный оператор в Казахстане. Сайт: https://telecom.kz/en для англ., "
-            "https://telecom.kz/kk для казахского и https://telecom.kz/ru для русскоязычной версии.\n\n"
-
-            "Полезные разделы (RU):\n"
-            "База знаний (FAQ): https://telecom.kz/ru/knowledge/14\n"
-            "Интернет: https://telecom.kz/ru/common/internet\n"
-            "Телевидение: https://telecom.kz/ru/common/tvplus\n"
-            "Телефон / мобильная связь: https://telecom.kz/ru/common/mobsvyaz-altel\n\n"
-
-            "Часто задаваемые вопросы — краткие ответы (используй как быстрый справочник):\n"
-            "1) Как изменить пароль Wi-Fi?\n"
-            "  1. Откройте браузер и перейдите на 192.168.100.1\n"
-            "  2. Введите Account: telecomadmin, Password: admintelecom\n"
-            "  3. Вкладка WLAN → SSID Name и WPA PreSharedKey → Apply\n\n"
-            "2) Как восстановить междугородние/международные звонки?\n"
-            "  Подать заявку в онлайн-каналах (WhatsApp/Telegram) по +77080000160, звонком в 160 или в офисе.\n\n"
-            "3) Можно ли временно приостановить услуги?\n"
-            "  Да — только телефонию и отдельный интернет (вне пакета). Заявление через WhatsApp/Telegram +77080000160 или 160. "
-            "Стоимость: телефония 500 ₸, интернет 1000 ₸. Срок 1 день–1 месяц, максимум 3 месяца в год.\n\n"
-            "4) Как подключить услугу на новый адрес?\n"
-            "  Обратитесь в онлайн-каналы (+77080000160), в контакт-центр 160 или в офис обслуживания.\n\n"
-            "5) Что такое авансовый / кредитный метод оплаты?\n"
-            "  Аванс: оплачиваете заранее (например, оплатили в конце января — пользуетесь в феврале).\n"
-            "  Кредит: получаете услуги сейчас, оплачиваете до 25 числа следующего месяца.\n\n"
-            "6) Какие документы нужны для подключения?\n"
-            "  Удостоверение личности / паспорт.\n\n"
-            "Обращения и выезд мастера: оставить заявку на сайте telecom.kz, в WhatsApp/Telegram +77080000160 или по 160.\n\n"
-            "Контакты и часы работы контакт-центра:\n"
-            "  Контакт-центр: 160 | +7 800 160 00 00 | info@telecom.kz\n"
-            "  Пн–Пт: 08:00–23:00, Сб–Вс: 09:00–23:00, Праздничные дни: 09:00–23:00\n"
-            "Телеграм-канал: @kazakhtelecom_official\n\n"
-
-            "Правила ответа:\n"
-            "• Отвечай кратко, по делу и дружелюбно.\n"
-            "• Если вопрос требует действий специалиста (выезд мастера, операции с лицевым счётом, личные данные), "
-            "перенаправляй в онлайн-каналы (+77080000160) или контакт-центр 160 и указывай возможные сроки/стоимость, если известно.\n"
-            "• Не разглашай конфиденциальную информацию.\n"
-            "• При необходимости давай ссылки на соответствующие разделы сайта (см. разделы выше).\n\n"
-            "Если пользователь спрашивает не про Казахтелеком — вежливо сообщи, что не можешь помочь с этим."
-        )
-    },
-    "kz": {
-        "role": "system",
-        "content": (
-            "Сен — АО «Қазақтелеком» компаниясының ресми цифрлық көмекшісісің. "
-            "Қазақ тілінде қысқа, сыпайы және анық жауап бер.\n\n"
-
-            "Компания туралы қысқаша:\n"
-            "Қазақстандағы ең ірі инфокоммуникациялық оператор. Сайт: https://telecom.kz/kk (қазақша), "
-            "https://telecom.kz/en (ағылш.) және https://telecom.kz/ru (орысша).\n\n"
-
-            "Пайдалы бөлімдер (KK):\n"
-            "Жиі қойылатын сұрақтар (FAQ): https://telecom.kz/kk/knowledge/14 (немесе /ru бойынша) \n"
-            "Интернет: https://telecom.kz/kk/common/internet\n"
-            "Теледидар: https://telecom.kz/kk/common/tvplus\n"
-            "Телефония/мобильді байланыс: https://telecom.kz/kk/common/mobsvyaz-altel\n\n"
-
-            "Жиі қойылатын сұрақтар — қысқаша жауаптар (жедел бағыттау үшін):\n"
-            "1) Wi-Fi парольін қалай өзгертуге болады?\n"
-            "  1. Браузер ашып 192.168.100.1 адресіне кіріңіз\n"
-            "  2. Account: telecomadmin, Password: admintelecom\n"
-            "  3. WLAN → SSID Name мен WPA PreSharedKey енгізіп Apply басыңыз\n\n"
-            "2) Қашықтық/халықаралық қоңырауларды қалай қалпына келтіруге болады?\n"
-            "  +77080000160 (WhatsApp/Telegram), 160 немесе сервистік орталыққа өтініш қалдырыңыз.\n\n"
-            "3) Қызметтерді уақытша тоқтатуға бола ма?\n"
-            "  Иә — тек телефония мен жеке интернет. Өтініш +77080000160 арқылы; төлем: телефония 500 ₸, интернет 1000 ₸; мерзім 1 күннен 1 айға дейін.\n\n"
-            "4) Қызметті жаңа мекенжайға қалай қосуға болады?\n"
-            "  +77080000160, 160 немесе қызмет көрсету офистеріне жазыңыз.\n\n"
-            "Қызметтерді қосу үшін қажет құжаттар: төлқұжат/жеке куәлік.\n\n"
-            "Мәліметтер және жұмыс уақыты:\n"
-            "  Байланыс орталығы: 160 | +7 800 160 00 00 | info@telecom.kz\n"
-            "  Пн–Жұм: 08:00–23:00, Сен–Жекс: 09:00–23:00, Мереке күндері: 09:00–23:00\n"
-            "Телеграм каналы: @kazakhtelecom_official\n\n"
-
-            "Жауап беру ережелері:\n"
-            "• Қысқа және нақты жауап бер. Қажет болса сайтқа сілтеме көрсет.\n"
-            "• Егер мәселе шұғыл техникалық қолдауды немесе жеке деректерді тексеруді талап етсе — бағытта: WhatsApp/Telegram +77080000160 немесе 160.\n"
-            "• Құпия ақпаратты жариялама.\n\n"
-            "Пайдаланушы сұрағы компанияға қатысы жоқ болса — сыпайы түрде хабарла."
-        )
-    },
-    "en": {
-        "role": "system",
-        "content": (
-            "You are the official digital assistant of Kazakhtelecom JSC. "
-            "Answer clearly, politely and professionally in English.\n\n"
-
-            "Company summary:\n"
-            "Kazakhtelecom is the largest infocommunications operator in Kazakhstan. Website: https://telecom.kz/en (English), "
-            "https://telecom.kz/kk (Kazakh) and https://telecom.kz/ru (Russian).\n\n"
-
-            "Useful sections (EN):\n"
-            "Knowledge base (FAQ): https://telecom.kz/en/knowledge/14 (or use /ru and /kk paths)\n"
-            "Internet services: https://telecom.kz/en/common/internet\n"
-            "TV services: https://telecom.kz/en/common/tvplus\n"
-            "Phone / mobile: https://telecom.kz/en/common/mobsvyaz-altel\n\n"
-
-            "Common questions — quick answers (use as a reference):\n"
-            "1) How to change Wi-Fi password?\n"
-            "  1. Open a browser and go to 192.168.100.1\n"
-            "  2. Login: Account = telecomadmin, Password = admintelecom\n"
-            "  3. In WLAN section, set SSID Name and WPA PreSharedKey, then Apply\n\n"
-            "2) How to restore long-distance / international calls?\n"
-            "  Submit a request via WhatsApp/Telegram +77080000160, call center 160 or visit a service office.\n\n"
-            "3) Can I temporarily suspend services?\n"
-            "  Yes — only telephony and standalone internet. Owner should request via WhatsApp/Telegram +77080000160 or call 160. "
-            "Fees: telephony 500 KZT, internet 1000 KZT. Period: 1 day–1 month (max 3 months per year).\n\n"
-            "4) How to request service at a new address?\n"
-            "  Contact WhatsApp/Telegram +77080000160, call center 160 or a service office.\n\n"
-            "Required documents for connection: ID / passport.\n\n"
-            "Contact & hours:\n"
-            "  Call center: 160 | +7 800 160 00 00 | info@telecom.kz\n"
-            "  Mon–Fri: 08:00–23:00, Sat–Sun: 09:00–23:00, Holidays: 09:00–23:00\n"
-            "Telegram channel: @kazakhtelecom_official\n\n"
-
-            "Reply rules:\n"
-            "• Keep answers short, professional and helpful. Provide links to relevant pages when applicable.\n"
-            "• If the issue requires technician visit, account verification or actions on user's personal account, "
-            "ask the user to contact WhatsApp/Telegram +77080000160 or call center 160 and provide possible fees/schedule if known.\n"
-            "• Do not provide confidential/internal information.\n"
-            "• If the question is unrelated to Kazakhtelecom, politely say you cannot assist and suggest contacting proper service.\n"
-        )
-    }
+openai_client = create_openai_client(OPENAI_API_KEY)
+
+
+user_store = UserProfileStore()
+tts_cache = TTSCache()
+answer_cache = AnswerCache()
+faq_responder = FaqResponder()
+
+SUMMARY_INSTRUCTIONS = {
+    "ru": "Кратко (2–4 предложения) перескажи суть диалога клиента с помощником Казахтелекома: "
+          "о чём спрашивал клиент и что ему ответили. Сохрани важные детали (услуги, адреса, суммы). Только пересказ.",
+    "kz": "Клиент пен Қазақтелеком көмекшісі арасындағы әңгіменің мәнін қысқаша (2–4 сөйлем) баянда: "
+          "клиент не сұрады және оған не жауап берілді. Маңызды мәліметтерді сақта. Тек мазмұнын жаз.",
+    "en": "Briefly (2–4 sentences) summarize the conversation between a customer and the Kazakhtelecom assistant: "
+          "what the customer asked and what they were told. Keep important details (services, addresses, amounts). Summary only.",
 }
 
 
-user_language = {}
+def record_usage(usage, purpose: str = "answer") -> None:
+    """Count chat completion tokens, so cost per message can be derived from the metrics."""
+    if usage is None:
+        return
+    registry.add("llm_tokens_total", usage.prompt_tokens, kind="prompt", purpose=purpose)
+    registry.add("llm_tokens_total", usage.completion_tokens, kind="completion", purpose=purpose)
+
+
+async def summarize_turns(lang: str, summary: str, turns: list[tuple[str, str]]) -> str:
+    """Fold evicted conversation turns into the rolling summary (runs in the background)."""
+    transcript = "\n".join(f"{role}: {text}" for role, text in turns)
+    if summary:
+        transcript = f"{summary}\n{transcript}"
+    async with resource_slot("llm"):
+        with span("summary"):
+            resp = await openai_client.chat.completions.create(
+                model=OPENAI_MODEL,
+                messages=[
+                    {"role": "system", "content": SUMMARY_INSTRUCTIONS.get(lang, SUMMARY_INSTRUCTIONS["ru"])},
+                    {"role": "user", "content": transcript},
+                ],
+                max_tokens=MEMORY_SUMMARY_TOKENS,
+                temperature=0,
+                timeout=OPENAI_CHAT_TIMEOUT,
+            )
+    record_usage(resp.usage, purpose="summary")
+    return (resp.choices[0].message.content or "") if resp.choices else summary
+
+
+memory = ConversationMemory(summarize_turns)
 
 dp = Dispatcher()
+admission = AdmissionMiddleware(user_store.get_language)
+dp.message.middleware(admission)
+# Outbound Bot API calls are paced per chat and globally; the global limit is per process.
+outbox = Outbox(global_rate=OUTBOX_GLOBAL_RATE / (max(1, WEBHOOK_WORKERS) if BOT_MODE == "webhook" else 1))
+
+registry.register_gauges("user_store", user_store.stats)
+registry.register_gauges("tts_cache", tts_cache.stats)
+registry.register_gauges("answer_cache", answer_cache.stats)
+registry.register_gauges("faq_direct", faq_responder.stats)
+registry.register_gauges("memory", memory.stats)
+registry.register_gauges("admission", admission.stats)
+registry.register_gauges("outbox", outbox.stats)
+registry.register_gauges("resources", get_resource_stats)
+registry.register_gauges("stt", stt.get_stt_stats)
+registry.register_gauges("transcoder", audio.transcoder.stats)
+registry.register_histogram("transcode_wait_seconds", audio.transcoder.wait_seconds)
+registry.register_histogram("transcode_exec_seconds", audio.transcoder.exec_seconds)
+metrics_port = METRICS_PORT
+metrics_runner = None
 
 lang_keyboard = ReplyKeyboardMarkup(
     keyboard=[
@@ -207,7 +158,7 @@ async def cmd_start(message: Message) -> None:
 
 @dp.message(Command("help"))
 async def cmd_help(message: Message) -> None:
-    lang = user_language.get(message.from_user.id, "ru")
+    lang = await user_store.get_language(message.from_user.id) or "ru"
 
     help_text = {
         "ru": (
@@ -215,7 +166,8 @@ async def cmd_help(message: Message) -> None:
             "*/start* — запуск бота и выбор языка интерфейса.\n"
             "*/help* — показать список команд и справочную информацию.\n"
             "*/language* — изменить текущий язык общения.\n"
-            "*/socials* — ссылки на официальные страницы Казахтелекома в соцсетях.\n\n"
+            "*/socials* — ссылки на официальные страницы Казахтелекома в соцсетях.\n"
+            "*/voice* — голосовые ответы: всегда, только на голосовые или выключены.\n\n"
             "Вы также можете воспользоваться кнопкой */help* на клавиатуре."
         ),
 
@@ -224,7 +176,8 @@ async def cmd_help(message: Message) -> None:
             "*/start* — ботты іске қосу және тілді таңдау.\n"
             "*/help* — командалар тізімін және анықтаманы көрсету.\n"
             "*/language* — ағымдағы тілді өзгерту.\n"
-            "*/socials* — Қазақтелекомның ресми әлеуметтік желілері.\n\n"
+            "*/socials* — Қазақтелекомның ресми әлеуметтік желілері.\n"
+            "*/voice* — дауыстық жауаптар: әрқашан, тек дауыстық хабарларға немесе өшірулі.\n\n"
             "Сондай-ақ пернетақтадағы */help* батырмасын пайдалануға болады."
         ),
 
@@ -233,7 +186,8 @@ async def cmd_help(message: Message) -> None:
             "*/start* — launch the bot and select the interface language.\n"
             "*/help* — display the list of commands and help information.\n"
             "*/language* — change the current conversation language.\n"
-            "*/socials* — official Kazakhtelecom social media links.\n\n"
+            "*/socials* — official Kazakhtelecom social media links.\n"
+            "*/voice* — voice replies: always, only to voice messages, or off.\n\n"
             "You may also use the */help* button on the keyboard."
         )
     }
@@ -243,7 +197,7 @@ async def cmd_help(message: Message) -> None:
 
 @dp.message(Command("socials"))
 async def cmd_socials(message: Message) -> None:
-    lang = user_language.get(message.from_user.id, "ru")
+    lang = await user_store.get_language(message.from_user.id) or "ru"
 
     socials_text = {
         "ru": (
@@ -318,16 +272,50 @@ async def cmd_language(message: Message):
     )
 
 
-def convert_ogg_to_wav(input_path: str, output_path: str) -> None:
-    cmd = [
-        "ffmpeg",
-        "-y",
-        "-i", input_path,
-        "-ar", "16000",
-        "-ac", "1",
-        output_path
-    ]
-    subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+@dp.message(Command("voice"))
+async def cmd_voice(message: Message, command: CommandObject) -> None:
+    profile = await user_store.get_profile(message.from_user.id)
+    if profile is None:
+        await message.answer(
+            "Пожалуйста, выберите язык / Тілді таңдаңыз / Please choose a language:",
+            reply_markup=lang_keyboard
+        )
+        return
+
+    arg = (command.args or "").strip().lower()
+    if arg in VOICE_MODES:
+        mode = arg
+    elif not arg:
+        mode = next_voice_mode(profile.voice_mode)
+    else:
+        mode = None
+
+    voice_text = {
+        "ru": {
+            "always": "🔊 Голосовые ответы: всегда.",
+            "voice_only": "🎙 Голосовые ответы: только на голосовые сообщения.",
+            "never": "🔇 Голосовые ответы выключены, только текст.",
+            "usage": "Использование: /voice [always | voice_only | never]. Без параметра — следующий режим.",
+        },
+        "kz": {
+            "always": "🔊 Дауыстық жауаптар: әрқашан.",
+            "voice_only": "🎙 Дауыстық жауаптар: тек дауыстық хабарларға.",
+            "never": "🔇 Дауыстық жауаптар өшірілді, тек мәтін.",
+            "usage": "Қолдану: /voice [always | voice_only | never]. Параметрсіз — келесі режим.",
+        },
+        "en": {
+            "always": "🔊 Voice replies: always.",
+            "voice_only": "🎙 Voice replies: only to voice messages.",
+            "never": "🔇 Voice replies are off, text only.",
+            "usage": "Usage: /voice [always | voice_only | never]. Without an argument — the next mode.",
+        },
+    }[profile.lang]
+
+    if mode is None:
+        await message.answer(voice_text["usage"], reply_markup=help_keyboard)
+        return
+    await user_store.set_voice_mode(message.from_user.id, mode)
+    await message.answer(voice_text[mode], reply_markup=help_keyboard)
 
 
 @dp.message()
@@ -337,7 +325,8 @@ async def handle_message(message: Message) -> None:
 
     lowered = text.lower()
     if lowered in ("kz", "ru", "en"):
-        user_language[user_id] = lowered
+        await user_store.set_language(user_id, lowered)
+        memory.reset(message.chat.id)
         confirm = {
             "ru": "Язык сохранён: 🇷🇺 Русский. Можете задавать вопросы.",
             "kz": "Тіл сақталды: 🇰🇿 Қазақ тілі. Сұрақтарыңызды жазыңыз.",
@@ -346,65 +335,46 @@ async def handle_message(message: Message) -> None:
         await message.answer(confirm[lowered], reply_markup=help_keyboard)
         return
 
-    if user_id not in user_language:
+    profile = await user_store.get_profile(user_id)
+    if profile is None:
         await message.answer(
             "Пожалуйста, выберите язык / Тілді таңдаңыз / Please choose a language:",
             reply_markup=lang_keyboard
         )
         return
 
-    lang = user_language[user_id]
-    system_prompt = SYSTEM_PROMPTS[lang]
+    lang = profile.lang
+    current_lang.set(lang)
+    registry.add("messages_total", kind="voice" if message.voice else "text")
+    with span("total"):
+        await answer_question(message, lang, effective_voice_mode(profile.voice_mode))
 
+
+async def answer_question(message: Message, lang: str, voice_mode: str) -> None:
     if message.voice:
-        tmp_ogg_path = None
-        tmp_wav_path = None
+        if (message.voice.duration or 0) > VOICE_MAX_DURATION_SECONDS or (
+            (message.voice.file_size or 0) > VOICE_MAX_FILE_BYTES
+        ):
+            registry.add("voice_rejected_total", reason="too_long")
+            minutes = max(1, VOICE_MAX_DURATION_SECONDS // 60)
+            await message.answer({
+                "ru": f"Голосовое сообщение слишком длинное. Максимум — {minutes} мин., или напишите вопрос текстом.",
+                "kz": f"Дауыстық хабар тым ұзын. Ең көбі — {minutes} мин., немесе сұрақты мәтінмен жазыңыз.",
+                "en": f"The voice message is too long. The limit is {minutes} min, or type your question instead."
+            }[lang], reply_markup=help_keyboard)
+            return
         try:
-            file_id = message.voice.file_id
-            file_obj = await message.bot.get_file(file_id)
-            tg_file_path = file_obj.file_path
-
-            with tempfile.NamedTemporaryFile(suffix=".oga", delete=False) as tmp_ogg:
-                tmp_ogg_path = tmp_ogg.name
-            await message.bot.download_file(tg_file_path, tmp_ogg_path)
-
-            with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as tmp_wav:
-                tmp_wav_path = tmp_wav.name
-
-            def _convert_ogg_to_wav_block(in_path, out_path):
-                cmd = [
-                    "ffmpeg", "-y",
-                    "-i", in_path,
-                    "-ar", "16000",
-                    "-ac", "1",
-                    out_path
-                ]
-                subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-
-            await asyncio.to_thread(_convert_ogg_to_wav_block, tmp_ogg_path, tmp_wav_path)
-
-            with open(tmp_wav_path, "rb") as audio_file:
-                transcription_resp = await asyncio.to_thread(
-                    openai_client.audio.transcriptions.create,
-                    file=audio_file,
-                    model="whisper-1",
+            with span("download"):
+                file_obj = await message.bot.get_file(message.voice.file_id)
+                ogg_buffer = await message.bot.download_file(file_obj.file_path)
+            registry.add("stt_audio_seconds_total", message.voice.duration or 0)
+            with span("stt"):
+                transcript = await stt.transcribe_voice(
+                    openai_client,
+                    ogg_buffer.getvalue(),
+                    duration=message.voice.duration,
                 )
 
-            if hasattr(transcription_resp, "text"):
-                transcript = transcription_resp.text
-            elif isinstance(transcription_resp, dict):
-                transcript = transcription_resp.get("text", "")
-            else:
-                transcript = getattr(transcription_resp, "transcription", "") or ""
-
-            try:
-                if tmp_ogg_path:
-                    Path(tmp_ogg_path).unlink(missing_ok=True)
-                if tmp_wav_path:
-                    Path(tmp_wav_path).unlink(missing_ok=True)
-            except Exception:
-                pass
-
             if not transcript:
                 msgs = {
                     "ru": "Не удалось распознать голос. Попробуйте ещё раз.",
@@ -417,8 +387,8 @@ async def handle_message(message: Message) -> None:
             #await message.answer(f"🗣️ {transcript}", reply_markup=help_keyboard)
             user_query_text = transcript
 
-        except subprocess.CalledProcessError:
-            logger.exception("ffmpeg conversion error")
+        except subprocess.CalledProcessError as e:
+            logger.error("ffmpeg conversion error: %s", (e.stderr or b"").decode(errors="replace").strip())
             await message.answer({
                 "ru": "Ошибка обработки аудио (ffmpeg). Свяжитесь с поддержкой.",
                 "kz": "Аудионы өңдеу қатесі (ffmpeg). Қолдауға хабарласыңыз.",
@@ -432,125 +402,155 @@ async def handle_message(message: Message) -> None:
                 "kz": "Дауыстық хабарды өңдеу кезінде сервер қатесі. Кейін қайталап көріңіз.",
                 "en": "Server error while processing voice message. Try again later."
             }[lang], reply_markup=help_keyboard)
-            try:
-                if tmp_ogg_path:
-                    Path(tmp_ogg_path).unlink(missing_ok=True)
-                if tmp_wav_path:
-                    Path(tmp_wav_path).unlink(missing_ok=True)
-            except Exception:
-                pass
             return
     else:
         user_query_text = message.text or ""
 
-    messages = [
-        system_prompt,
-        {"role": "user", "content": user_query_text}
-    ]
-
-    try:
-        resp = await asyncio.to_thread(
-            openai_client.chat.completions.create,
-            model=OPENAI_MODEL,
-            messages=messages,
-            max_tokens=600,
-            temperature=0.2,
-        )
-        assistant_text = ""
-        choices = resp.choices if hasattr(resp, "choices") else resp.get("choices", [])
-        if choices:
-            choice = choices[0]
-            if hasattr(choice, "message") and choice.message:
-                assistant_text = getattr(choice.message, "content", "") or ""
-            elif isinstance(choice, dict):
-                assistant_text = (choice.get("message", {}) or {}).get("content", "") or choice.get("text", "") or ""
+    history = memory.history(message.chat.id, lang)
+    messages = build_messages(lang, user_query_text, history)
+
+    progressive = ProgressiveReply(message, reply_markup=help_keyboard) if STREAM_ANSWERS else None
+
+    async def _complete() -> str:
+        if progressive is None:
+            async with resource_slot("llm"):
+                with span("llm"):
+                    resp = await openai_client.chat.completions.create(
+                        model=OPENAI_MODEL,
+                        messages=messages,
+                        max_tokens=600,
+                        temperature=0.2,
+                        timeout=OPENAI_CHAT_TIMEOUT,
+                    )
+            record_usage(resp.usage)
+            if not resp.choices:
+                return ""
+            return resp.choices[0].message.content or ""
+
+        await progressive.start()
+        async with resource_slot("llm"):
+            with span("llm"):
+                started = time.perf_counter()
+                stream = await openai_client.chat.completions.create(
+                    model=OPENAI_MODEL,
+                    messages=messages,
+                    max_tokens=600,
+                    temperature=0.2,
+                    timeout=OPENAI_CHAT_TIMEOUT,
+                    stream=True,
+                    stream_options={"include_usage": True},
+                )
+                async for chunk in stream:
+                    if chunk.usage:
+                        record_usage(chunk.usage)
+                    if chunk.choices:
+                        delta = chunk.choices[0].delta.content or ""
+                        if delta and not progressive.text:
+                            registry.observe("stage_seconds", time.perf_counter() - started, stage="llm_first_token", lang=lang)
+                        progressive.feed(delta)
+        return progressive.text
+
+    faq_entry = None
+    if FAQ_DIRECT_ANSWERS:
+        with span("faq"):
+            faq_entry = faq_responder.match(lang, user_query_text)
+
+    if faq_entry is not None:
+        assistant_text = render_faq_answer(faq_entry)
+        memory.append(message.chat.id, lang, user_query_text, assistant_text)
+    else:
+        try:
+            if history:
+                # The answer depends on the conversation, so it must not be shared with other chats.
+                assistant_text = await _complete()
             else:
-                assistant_text = getattr(choice, "text", "") or ""
-        else:
-            assistant_text = ""
-    except Exception:
-        logger.exception("Ошибка OpenAI")
-        assistant_text = {
-            "ru": "Ошибка сервера. Повторите позже.",
-            "kz": "Сервер қатесі. Кейінірек қайталап көріңіз.",
-            "en": "Server error. Please try again later."
-        }[lang]
+                assistant_text = await answer_cache.get_or_create(
+                    lang,
+                    user_query_text,
+                    prompt_fingerprint(OPENAI_MODEL, PROMPT_MODE, build_full_prompt(lang)),
+                    _complete,
+                )
+            if assistant_text:
+                memory.append(message.chat.id, lang, user_query_text, assistant_text)
+        except Exception:
+            logger.exception("Ошибка OpenAI")
+            assistant_text = {
+                "ru": "Ошибка сервера. Повторите позже.",
+                "kz": "Сервер қатесі. Кейінірек қайталап көріңіз.",
+                "en": "Server error. Please try again later."
+            }[lang]
 
     cleaned = clean_markdown(assistant_text)
+
+    voice_map = {"ru": "alloy", "kz": "alloy", "en": "alloy"}
+    tts_voice = voice_map.get(lang, "alloy")
+    voice_task = None
+    skip = voice_skip_reason(voice_mode, message.voice is not None, cleaned or assistant_text)
+    if skip is None:
+        # Synthesis starts now and overlaps with delivering the text answer.
+        voice_task = asyncio.create_task(
+            prepare_voice_reply(assistant_text or cleaned or " ", tts_voice, lang)
+        )
+    else:
+        registry.add("voice_replies_skipped_total", reason=skip)
+
     try:
-        await message.answer(cleaned or assistant_text, parse_mode="Markdown", reply_markup=help_keyboard)
-    except Exception:
-        await message.answer(assistant_text, reply_markup=help_keyboard)
+        with span("send_text"):
+            if progressive is not None and progressive.started:
+                try:
+                    await progressive.finish(cleaned or assistant_text)
+                except Exception:
+                    logger.exception("Ошибка финального редактирования сообщения")
+            else:
+                try:
+                    await message.answer(cleaned or assistant_text, parse_mode="Markdown", reply_markup=help_keyboard)
+                except TelegramBadRequest:
+                    await message.answer(assistant_text, reply_markup=help_keyboard)
+    except BaseException:
+        if voice_task is not None:
+            voice_task.cancel()
+        raise
+
+    if voice_task is None:
+        return
 
-    tmp_mp3_path = None
-    tmp_oggopus_path = None
     try:
-        with tempfile.NamedTemporaryFile(suffix=".mp3", delete=False) as tmp_mp3:
-            tmp_mp3_path = tmp_mp3.name
-
-        def _create_tts_file(path, text_to_say, voice):
-            resp = openai_client.audio.speech.create(
-                model="tts-1",
-                voice=voice,
-                input=text_to_say,
-            )
-            if hasattr(resp, "stream_to_file"):
-                resp.stream_to_file(path)
-                return
-            content = getattr(resp, "content", None)
-            if content and isinstance(content, (bytes, bytearray)):
-                with open(path, "wb") as f:
-                    f.write(content)
+        with span("tts_wait"):
+            tts_key, file_id, oggopus_bytes = await voice_task
+
+        if file_id:
+            try:
+                with span("send_voice_cached"):
+                    await message.answer_voice(voice=file_id, reply_markup=help_keyboard)
                 return
-            if isinstance(resp, dict):
-                for key in ("audio", "audio_base64", "data"):
-                    if key in resp:
-                        data = resp[key]
-                        if isinstance(data, str):
-                            try:
-                                import base64
-                                b = base64.b64decode(data)
-                                with open(path, "wb") as f:
-                                    f.write(b)
-                                return
-                            except Exception:
-                                pass
-                        elif isinstance(data, (bytes, bytearray)):
-                            with open(path, "wb") as f:
-                                f.write(data)
-                            return
-            raise RuntimeError("Unsupported TTS response format")
-
-        voice_map = {"ru": "alloy", "kz": "alloy", "en": "alloy"}
-        tts_voice = voice_map.get(lang, "alloy")
-
-        await asyncio.to_thread(_create_tts_file, tmp_mp3_path, assistant_text or cleaned or " ", tts_voice)
-
-        with tempfile.NamedTemporaryFile(suffix=".oga", delete=False) as tmp_oggopus:
-            tmp_oggopus_path = tmp_oggopus.name
-
-        def _convert_mp3_to_oggopus(in_path, out_path):
-            cmd = [
-                "ffmpeg", "-y",
-                "-i", in_path,
-                "-c:a", "libopus",
-                "-b:a", "64k",
-                out_path
-            ]
-            subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-
-        await asyncio.to_thread(_convert_mp3_to_oggopus, tmp_mp3_path, tmp_oggopus_path)
-
-        audio_input = FSInputFile(tmp_oggopus_path)
+            except TelegramBadRequest:
+                logger.warning("Telegram отклонил закэшированный file_id, загружаем заново")
+                await tts_cache.set_file_id(tts_key, None)
+                oggopus_bytes = await tts_cache.read_audio(tts_key)
+                if oggopus_bytes is None:
+                    _, _, oggopus_bytes = await prepare_voice_reply(assistant_text or cleaned or " ", tts_voice, lang)
+
         try:
-            await message.answer_voice(voice=audio_input, reply_markup=help_keyboard)
-        except Exception:
-            audio_input_mp3 = FSInputFile(tmp_mp3_path)
-            try:
-                await message.answer_audio(audio=audio_input_mp3, reply_markup=help_keyboard)
-            except Exception:
-                await message.answer_document(document=audio_input_mp3, caption="Audio reply", reply_markup=help_keyboard)
+            with span("upload_voice"):
+                sent = await message.answer_voice(
+                    voice=BufferedInputFile(oggopus_bytes, filename="reply.oga"),
+                    reply_markup=help_keyboard,
+                )
+            if sent.voice:
+                registry.add("voice_reply_seconds_total", sent.voice.duration or 0)
+                await tts_cache.set_file_id(tts_key, sent.voice.file_id)
+        except TelegramBadRequest as e:
+            # Voice notes can be forbidden by the user's privacy settings; one audio upload instead.
+            # Rate limits are retried by the outbox, and other errors are not retried with another upload.
+            logger.warning("Telegram отклонил голосовое сообщение, отправляем аудиофайлом: %s", e)
+            with span("upload_audio"):
+                await message.answer_audio(
+                    audio=BufferedInputFile(oggopus_bytes, filename="reply.ogg"),
+                    reply_markup=help_keyboard,
+                )
 
+    except TelegramRetryAfter:
+        logger.warning("Голосовой ответ не отправлен: Telegram ограничил отправку")
     except Exception:
         logger.exception("Ошибка TTS / отправки аудио")
         try:
@@ -562,14 +562,54 @@ async def handle_message(message: Message) -> None:
             await message.answer(error_msg, reply_markup=help_keyboard)
         except Exception:
             pass
-    finally:
-        try:
-            if tmp_mp3_path:
-                Path(tmp_mp3_path).unlink(missing_ok=True)
-            if tmp_oggopus_path:
-                Path(tmp_oggopus_path).unlink(missing_ok=True)
-        except Exception:
-            pass
+
+
+async def prepare_voice_reply(text: str, voice: str, lang: str) -> tuple[str, str | None, bytes | None]:
+    """
+    Find or synthesize the voice note for an answer.
+
+    :return: (cache key, Telegram file_id if already uploaded, OGG/Opus bytes otherwise)
+    """
+    tts_key = make_tts_key(text, voice, lang)
+    cached = tts_cache.get(tts_key)
+    if cached and cached.file_id:
+        return tts_key, cached.file_id, None
+
+    oggopus_bytes = await tts_cache.read_audio(tts_key) if cached else None
+    if oggopus_bytes is None:
+        with span("tts"):
+            oggopus_bytes = await synthesize_voice_note(openai_client, text, voice)
+        await tts_cache.put(tts_key, oggopus_bytes)
+    return tts_key, None, oggopus_bytes
+
+
+@dp.startup()
+async def on_startup(bot: Bot) -> None:
+    global metrics_runner
+    if outbox not in bot.session.middleware:
+        bot.session.middleware(outbox)
+    metrics_runner = await start_metrics_server(metrics_port)
+    await user_store.open()
+    await tts_cache.open()
+    await audio.transcoder.start()
+
+
+@dp.shutdown()
+async def on_shutdown() -> None:
+    await memory.close()
+    await audio.transcoder.close()
+    await user_store.close()
+    await openai_client.close()
+    if metrics_runner is not None:
+        await metrics_runner.cleanup()
+
+
+def run_webhook_worker(worker_index: int, updates) -> None:
+    global metrics_port
+    logger.info("Webhook-воркер %d запущен", worker_index)
+    if METRICS_PORT:
+        metrics_port = METRICS_PORT + worker_index
+    webhook.run_worker(dp, BOT_TOKEN, updates)
 
 
 async def main() -> None:
@@ -578,4 +618,7 @@ async def main() -> None:
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    if BOT_MODE == "webhook":
+        webhook.run_webhook(BOT_TOKEN, dp, run_webhook_worker)
+    else:
+        asyncio.run(main())
@@ -0,0 +1,286 @@
+"""
+Admission control and fairness for incoming updates.
+
+Layers:
+- Per-user token bucket (ADMISSION_USER_RATE / ADMISSION_USER_BURST).
+  A voice note costs ADMISSION_VOICE_COST tokens, a text message one.
+  Buckets are kept in a bounded LRU; an evicted user simply starts over
+  with a full bucket.
+- Global admission queue: at most ADMISSION_MAX_ACTIVE handlers run at
+  once, up to ADMISSION_MAX_QUEUE more wait in FIFO order. When the queue
+  is full, ADMISSION_SHED_POLICY decides who is shed: the new arrival
+  ("reject_new") or the longest waiter ("drop_oldest"). Waiters give up
+  after ADMISSION_MAX_WAIT_SECONDS.
+- Per-resource semaphores (`resource_slot`) around STT, LLM and TTS, so
+  one stage cannot exhaust an upstream rate limit. ffmpeg jobs are bounded
+  by the transcoding executor (see transcoder.py).
+
+Shed and rate-limited users get a single localized "busy" reply.
+"""
+
+import asyncio
+import logging
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Any, Awaitable, Callable
+
+from aiogram import BaseMiddleware
+from aiogram.types import Message
+
+from .conf import (
+    ADMISSION_USER_RATE,
+    ADMISSION_USER_BURST,
+    ADMISSION_VOICE_COST,
+    ADMISSION_MAX_TRACKED_USERS,
+    ADMISSION_MAX_ACTIVE,
+    ADMISSION_MAX_QUEUE,
+    ADMISSION_MAX_WAIT_SECONDS,
+    ADMISSION_SHED_POLICY,
+    RESOURCE_LIMITS,
+)
+
+logger = logging.getLogger("bot.admission")
+
+BUSY_TEXT = {
+    "ru": "⏳ Сейчас много обращений. Пожалуйста, повторите запрос чуть позже.",
+    "kz": "⏳ Қазір өтініштер көп. Сәл кейінірек қайталап көріңіз.",
+    "en": "⏳ We are handling a lot of requests right now. Please try again shortly.",
+}
+
+
+class _Bucket:
+    __slots__ = ("tokens", "updated_at", "notified")
+
+    def __init__(self, tokens: float, updated_at: float):
+        self.tokens = tokens
+        self.updated_at = updated_at
+        self.notified = False
+
+
+class UserRateLimiter:
+    def __init__(
+        self,
+        rate: float = ADMISSION_USER_RATE,
+        burst: float = ADMISSION_USER_BURST,
+        max_users: int = ADMISSION_MAX_TRACKED_USERS,
+    ):
+        self.rate = rate
+        self.burst = burst
+        self.max_users = max_users
+        self._buckets: OrderedDict[int, _Bucket] = OrderedDict()
+        self.limited = 0
+
+    def try_consume(self, user_id: int, cost: float = 1.0) -> tuple[bool, bool]:
+        """
+        Take `cost` tokens from the user's bucket.
+
+        :return: (allowed, notify) — notify is True only for the first refusal
+                 since the bucket last had tokens, so spammers get one reply.
+        """
+        now = time.monotonic()
+        bucket = self._buckets.get(user_id)
+        if bucket is None:
+            bucket = _Bucket(self.burst, now)
+            self._buckets[user_id] = bucket
+            if len(self._buckets) > self.max_users:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(user_id)
+            bucket.tokens = min(self.burst, bucket.tokens + (now - bucket.updated_at) * self.rate)
+            bucket.updated_at = now
+
+        if bucket.tokens >= cost:
+            bucket.tokens -= cost
+            bucket.notified = False
+            return True, False
+
+        self.limited += 1
+        notify = not bucket.notified
+        bucket.notified = True
+        return False, notify
+
+
+class AdmissionQueue:
+    def __init__(
+        self,
+        max_active: int = ADMISSION_MAX_ACTIVE,
+        max_queue: int = ADMISSION_MAX_QUEUE,
+        max_wait: float = ADMISSION_MAX_WAIT_SECONDS,
+        shed_policy: str = ADMISSION_SHED_POLICY,
+    ):
+        if shed_policy not in ("reject_new", "drop_oldest"):
+            raise ValueError(f"Unknown ADMISSION_SHED_POLICY: '{shed_policy}'")
+        self.max_active = max_active
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.shed_policy = shed_policy
+
+        self.active = 0
+        self._waiters: deque[asyncio.Future] = deque()
+        self.admitted = 0
+        self.shed = 0
+        self.wait_count = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+
+    @property
+    def depth(self) -> int:
+        return len(self._waiters)
+
+    async def acquire(self) -> bool:
+        """Wait for a slot. Returns False if the caller was shed."""
+        if self.active < self.max_active and not self.depth:
+            self.active += 1
+            self.admitted += 1
+            return True
+
+        if self.depth >= self.max_queue:
+            if self.shed_policy == "reject_new":
+                self.shed += 1
+                return False
+            self._shed_oldest()
+
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append(future)
+        started = time.monotonic()
+        try:
+            granted = await asyncio.wait_for(future, timeout=self.max_wait)
+        except asyncio.TimeoutError:
+            self._discard(future)
+            granted = False
+        except asyncio.CancelledError:
+            self._discard(future)
+            if future.done() and not future.cancelled() and future.result():
+                self.release()
+            raise
+        finally:
+            self._record_wait(time.monotonic() - started)
+
+        if granted:
+            self.admitted += 1
+        else:
+            self.shed += 1
+        return granted
+
+    def release(self) -> None:
+        while self._waiters:
+            future = self._waiters.popleft()
+            if not future.done():
+                # Hand the slot over directly; `active` stays the same.
+                future.set_result(True)
+                return
+        self.active -= 1
+
+    def stats(self) -> dict[str, float]:
+        return {
+            "active": self.active,
+            "queue_depth": self.depth,
+            "admitted": self.admitted,
+            "shed": self.shed,
+            "wait_count": self.wait_count,
+            "wait_seconds_total": round(self.wait_seconds_total, 3),
+            "wait_seconds_max": round(self.wait_seconds_max, 3),
+        }
+
+    def _discard(self, future: asyncio.Future) -> None:
+        try:
+            self._waiters.remove(future)
+        except ValueError:
+            pass
+
+    def _shed_oldest(self) -> None:
+        while self._waiters:
+            future = self._waiters.popleft()
+            if not future.done():
+                future.set_result(False)
+                return
+
+    def _record_wait(self, seconds: float) -> None:
+        self.wait_count += 1
+        self.wait_seconds_total += seconds
+        self.wait_seconds_max = max(self.wait_seconds_max, seconds)
+
+
+_resource_semaphores: dict[str, asyncio.Semaphore] = {
+    name: asyncio.Semaphore(limit) for name, limit in RESOURCE_LIMITS.items()
+}
+_resource_waiting: dict[str, int] = {name: 0 for name in RESOURCE_LIMITS}
+_resource_in_use: dict[str, int] = {name: 0 for name in RESOURCE_LIMITS}
+
+
+@asynccontextmanager
+async def resource_slot(name: str):
+    """Hold one of the RESOURCE_LIMITS[name] concurrent slots for a downstream call."""
+    semaphore = _resource_semaphores[name]
+    _resource_waiting[name] += 1
+    try:
+        await semaphore.acquire()
+    finally:
+        _resource_waiting[name] -= 1
+    _resource_in_use[name] += 1
+    try:
+        yield
+    finally:
+        _resource_in_use[name] -= 1
+        semaphore.release()
+
+
+def get_resource_stats() -> dict[str, dict[str, int]]:
+    return {
+        name: {
+            "limit": RESOURCE_LIMITS[name],
+            "in_use": _resource_in_use[name],
+            "waiting": _resource_waiting[name],
+        }
+        for name in RESOURCE_LIMITS
+    }
+
+
+class AdmissionMiddleware(BaseMiddleware):
+    def __init__(
+        self,
+        get_language: Callable[[int], Awaitable[str | None]],
+        rate_limiter: UserRateLimiter | None = None,
+        queue: AdmissionQueue | None = None,
+    ):
+        self.get_language = get_language
+        self.rate_limiter = rate_limiter or UserRateLimiter()
+        self.queue = queue or AdmissionQueue()
+
+    async def __call__(
+        self,
+        handler: Callable[[Message, dict[str, Any]], Awaitable[Any]],
+        event: Message,
+        data: dict[str, Any],
+    ) -> Any:
+        if event.from_user is None:
+            return await handler(event, data)
+
+        user_id = event.from_user.id
+        cost = ADMISSION_VOICE_COST if event.voice else 1.0
+        allowed, notify = self.rate_limiter.try_consume(user_id, cost)
+        if not allowed:
+            if notify:
+                await self._reply_busy(event, user_id)
+            return None
+
+        if not await self.queue.acquire():
+            logger.warning("Запрос пользователя %s отклонён: очередь переполнена", user_id)
+            await self._reply_busy(event, user_id)
+            return None
+
+        try:
+            return await handler(event, data)
+        finally:
+            self.queue.release()
+
+    def stats(self) -> dict[str, float]:
+        return {**self.queue.stats(), "rate_limited": self.rate_limiter.limited}
+
+    async def _reply_busy(self, event: Message, user_id: int) -> None:
+        lang = await self.get_language(user_id) or "ru"
+        try:
+            await event.answer(BUSY_TEXT.get(lang, BUSY_TEXT["ru"]))
+        except Exception:
+            logger.exception("Не удалось отправить сообщение о перегрузке")
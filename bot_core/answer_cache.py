@@ -0,0 +1,155 @@
+"""
+In-memory cache for chat completion answers (TTL + LRU, single-flight).
+
+Key:
+- (lang, normalized question, prompt fingerprint)
+- The question is NFKC-normalized, case-folded, stripped of punctuation
+  and whitespace-collapsed, so "Как сменить пароль Wi-Fi?" and
+  "как сменить пароль wi-fi" share one entry.
+- The prompt fingerprint is a hash of the system prompt and model. When a
+  new fingerprint is seen for a language, all entries of that language
+  built from the previous prompt are dropped.
+
+Single-flight:
+- Concurrent identical questions wait on the first in-flight request
+  instead of issuing their own. Failures are propagated to every waiter
+  and are never cached.
+- Cancelling the leading request cancels only that request: its waiters
+  start over, and one of them becomes the new leader.
+
+Bounds:
+- At most ANSWER_CACHE_SIZE entries (least recently used are dropped),
+  each valid for ANSWER_CACHE_TTL_SECONDS. Expired entries are removed
+  lazily on access.
+"""
+
+import asyncio
+import hashlib
+import re
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Awaitable, Callable
+
+from .conf import ANSWER_CACHE_TTL_SECONDS, ANSWER_CACHE_SIZE
+
+_PUNCT_RE = re.compile(r"[^\w\s]+")
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize_question(text: str) -> str:
+    text = unicodedata.normalize("NFKC", text).casefold()
+    text = _PUNCT_RE.sub(" ", text)
+    return _WHITESPACE_RE.sub(" ", text).strip()
+
+
+def prompt_fingerprint(*parts: str) -> str:
+    return hashlib.sha256("\0".join(parts).encode("utf-8")).hexdigest()[:16]
+
+
+class AnswerCache:
+    def __init__(self, max_size: int = ANSWER_CACHE_SIZE, ttl: float = ANSWER_CACHE_TTL_SECONDS):
+        self.max_size = max_size
+        self.ttl = ttl
+        # key → (answer, expires_at)
+        self._entries: OrderedDict[tuple[str, str, str], tuple[str, float]] = OrderedDict()
+        self._inflight: dict[tuple[str, str, str], asyncio.Future] = {}
+        self._fingerprints: dict[str, str] = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    async def get_or_create(
+        self,
+        lang: str,
+        question: str,
+        fingerprint: str,
+        factory: Callable[[], Awaitable[str]],
+    ) -> str:
+        """
+        Return a cached answer or compute it once with `factory`.
+
+        :param lang: Conversation language
+        :param question: Raw user question
+        :param fingerprint: prompt_fingerprint() of the system prompt and model
+        :param factory: Coroutine function producing the answer on a miss
+        :return: Answer text
+        """
+        normalized = normalize_question(question)
+        if not normalized:
+            return await factory()
+
+        if self._fingerprints.get(lang) != fingerprint:
+            self._invalidate_lang(lang)
+            self._fingerprints[lang] = fingerprint
+
+        key = (lang, normalized, fingerprint)
+        while True:
+            answer = self._lookup(key)
+            if answer is not None:
+                self.hits += 1
+                return answer
+
+            pending = self._inflight.get(key)
+            if pending is None:
+                break
+            self.coalesced += 1
+            # Unlike awaiting the future, wait() raises CancelledError only when
+            # this caller is cancelled, not when the leader was.
+            await asyncio.wait([pending])
+            if not pending.cancelled():
+                return pending.result()
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            answer = await factory()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Mark retrieved so a failure nobody else waited on is not logged.
+            future.exception()
+            raise
+        else:
+            future.set_result(answer)
+            if answer:
+                self._store(key, answer)
+            return answer
+        finally:
+            self._inflight.pop(key, None)
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "size": len(self._entries),
+        }
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._fingerprints.clear()
+
+    def _invalidate_lang(self, lang: str) -> None:
+        for key in [k for k in self._entries if k[0] == lang]:
+            del self._entries[key]
+
+    def _lookup(self, key: tuple[str, str, str]) -> str | None:
+        item = self._entries.get(key)
+        if item is None:
+            return None
+        answer, expires_at = item
+        if time.monotonic() > expires_at:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return answer
+
+    def _store(self, key: tuple[str, str, str], answer: str) -> None:
+        self._entries[key] = (answer, time.monotonic() + self.ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
@@ -0,0 +1,106 @@
+"""
+In-memory audio transcoding through ffmpeg stdin/stdout pipes.
+
+No temporary files are involved: the input bytes are written to ffmpeg's
+stdin and the encoded result is read back from stdout, so a voice message
+never touches the disk between the Telegram download and the upload of
+the reply.
+
+All jobs run on the shared TranscodeExecutor (bounded concurrency, warm
+processes, per-job timeout). ffmpeg failures are reported as
+subprocess.CalledProcessError, the same exception
+`subprocess.run(..., check=True)` raises, so callers keep a single
+"ffmpeg failed" branch.
+"""
+
+import io
+import struct
+import wave
+from typing import AsyncIterable
+
+from .transcoder import TranscodeExecutor
+
+FFMPEG_BINARY = "ffmpeg"
+
+OPUS_OUTPUT_ARGS = ["-c:a", "libopus", "-b:a", "64k", "-f", "ogg", "pipe:1"]
+
+
+def _ffmpeg_cmd(input_args: list[str], output_args: list[str]) -> list[str]:
+    return [FFMPEG_BINARY, "-hide_banner", "-loglevel", "error", *input_args, "-i", "pipe:0", *output_args]
+
+
+transcoder = TranscodeExecutor({
+    "ogg_to_wav": _ffmpeg_cmd([], ["-ar", "16000", "-ac", "1", "-f", "wav", "pipe:1"]),
+    "ogg_to_pcm16k": _ffmpeg_cmd([], ["-ar", "16000", "-ac", "1", "-f", "s16le", "pipe:1"]),
+    "mp3_to_oggopus": _ffmpeg_cmd([], OPUS_OUTPUT_ARGS),
+    "pcm24k_to_oggopus": _ffmpeg_cmd(["-f", "s16le", "-ar", "24000", "-ac", "1"], OPUS_OUTPUT_ARGS),
+})
+
+
+def _fix_wav_header(wav: bytes) -> bytes:
+    """
+    Patch RIFF/data chunk sizes of a WAV written to a pipe.
+
+    ffmpeg cannot seek back on a pipe, so it leaves placeholder sizes in the
+    header; some decoders reject those. The sizes are rewritten in place.
+    """
+    if len(wav) < 12 or wav[:4] != b"RIFF" or wav[8:12] != b"WAVE":
+        return wav
+
+    buf = bytearray(wav)
+    struct.pack_into("<I", buf, 4, len(buf) - 8)
+
+    pos = 12
+    while pos + 8 <= len(buf):
+        chunk_id = bytes(buf[pos:pos + 4])
+        if chunk_id == b"data":
+            struct.pack_into("<I", buf, pos + 4, len(buf) - pos - 8)
+            break
+        chunk_size = struct.unpack_from("<I", buf, pos + 4)[0]
+        pos += 8 + chunk_size + (chunk_size & 1)
+    return bytes(buf)
+
+
+async def ogg_to_wav(data: bytes) -> bytes:
+    """Decode a Telegram voice note (OGG/Opus) to 16 kHz mono WAV for Whisper."""
+    wav = await transcoder.run("ogg_to_wav", data)
+    return _fix_wav_header(wav)
+
+
+async def ogg_to_pcm16k(data: bytes) -> bytes:
+    """Decode a Telegram voice note (OGG/Opus) to raw 16 kHz mono s16le PCM."""
+    return await transcoder.run("ogg_to_pcm16k", data)
+
+
+def pcm16k_to_wav(pcm: bytes) -> bytes:
+    """Wrap raw 16 kHz mono s16le PCM in a WAV container (no ffmpeg involved)."""
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(16000)
+        wav.writeframes(pcm)
+    return buf.getvalue()
+
+
+async def mp3_to_oggopus(data: bytes) -> bytes:
+    """Encode TTS output (MP3) to OGG/Opus, the format Telegram expects for voice notes."""
+    return await transcoder.run("mp3_to_oggopus", data)
+
+
+async def pcm_parts_to_oggopus(pcm_parts: AsyncIterable[bytes]) -> bytes:
+    """
+    Encode raw 24 kHz s16le mono PCM (OpenAI TTS "pcm" output) to a single OGG/Opus note.
+
+    Parts are collected first and the transcode job is submitted only once
+    the last one has arrived: a slow TTS backend must not hold an ffmpeg
+    slot (and run down its timeout) that voice-note decodes are waiting for.
+    Encoding PCM to Opus takes a fraction of the synthesis time.
+
+    :param pcm_parts: PCM parts in playback order
+    :return: OGG/Opus bytes
+    """
+    pcm = bytearray()
+    async for part in pcm_parts:
+        pcm += part
+    return await transcoder.run("pcm24k_to_oggopus", bytes(pcm))
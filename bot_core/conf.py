@@ -0,0 +1,130 @@
+import os
+
+
+USER_STORE_PATH: str = os.getenv("USER_STORE_PATH", "data/users.sqlite3")
+USER_CACHE_SIZE: int = int(os.getenv("USER_CACHE_SIZE", 100_000))
+USER_FLUSH_INTERVAL_SECONDS: float = float(os.getenv("USER_FLUSH_INTERVAL_SECONDS", 2.0))
+USER_FLUSH_BATCH_SIZE: int = int(os.getenv("USER_FLUSH_BATCH_SIZE", 500))
+
+# "direct": upload the Telegram OGG/Opus as-is, transcode to WAV only if the API rejects it.
+# "wav": always transcode to 16 kHz mono WAV before uploading.
+STT_INPUT_MODE: str = os.getenv("STT_INPUT_MODE", "direct").lower()
+STT_MODEL: str = os.getenv("STT_MODEL", "whisper-1")
+
+TTS_CACHE_DIR: str = os.getenv("TTS_CACHE_DIR", "data/tts_cache")
+TTS_CACHE_MAX_BYTES: int = int(os.getenv("TTS_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+
+ANSWER_CACHE_TTL_SECONDS: int = int(os.getenv("ANSWER_CACHE_TTL_SECONDS", 60 * 60 * 6))
+ANSWER_CACHE_SIZE: int = int(os.getenv("ANSWER_CACHE_SIZE", 10_000))
+
+OPENAI_MAX_CONNECTIONS: int = int(os.getenv("OPENAI_MAX_CONNECTIONS", 100))
+OPENAI_MAX_KEEPALIVE_CONNECTIONS: int = int(os.getenv("OPENAI_MAX_KEEPALIVE_CONNECTIONS", 20))
+OPENAI_MAX_RETRIES: int = int(os.getenv("OPENAI_MAX_RETRIES", 2))
+OPENAI_CONNECT_TIMEOUT: float = float(os.getenv("OPENAI_CONNECT_TIMEOUT", 5.0))
+OPENAI_CHAT_TIMEOUT: float = float(os.getenv("OPENAI_CHAT_TIMEOUT", 30.0))
+OPENAI_STT_TIMEOUT: float = float(os.getenv("OPENAI_STT_TIMEOUT", 30.0))
+OPENAI_TTS_TIMEOUT: float = float(os.getenv("OPENAI_TTS_TIMEOUT", 30.0))
+
+TTS_MODEL: str = os.getenv("TTS_MODEL", "tts-1")
+
+STREAM_ANSWERS: bool = os.getenv("STREAM_ANSWERS", "1").lower() in ("1", "true", "yes")
+# Telegram tolerates roughly one edit per second per chat.
+STREAM_EDIT_INTERVAL_SECONDS: float = float(os.getenv("STREAM_EDIT_INTERVAL_SECONDS", 1.2))
+STREAM_PLACEHOLDER: str = os.getenv("STREAM_PLACEHOLDER", "…")
+
+# Split voice replies at sentence boundaries and synthesize the parts concurrently.
+TTS_PIPELINE: bool = os.getenv("TTS_PIPELINE", "1").lower() in ("1", "true", "yes")
+TTS_CHUNK_CHARS: int = int(os.getenv("TTS_CHUNK_CHARS", 350))
+TTS_MAX_PARALLEL: int = int(os.getenv("TTS_MAX_PARALLEL", 4))
+
+# Per-user token bucket: sustained messages per second and burst size.
+ADMISSION_USER_RATE: float = float(os.getenv("ADMISSION_USER_RATE", 0.5))
+ADMISSION_USER_BURST: float = float(os.getenv("ADMISSION_USER_BURST", 5))
+ADMISSION_VOICE_COST: float = float(os.getenv("ADMISSION_VOICE_COST", 2))
+ADMISSION_MAX_TRACKED_USERS: int = int(os.getenv("ADMISSION_MAX_TRACKED_USERS", 100_000))
+
+# Global admission: handlers running at once, bounded wait queue and shed policy.
+ADMISSION_MAX_ACTIVE: int = int(os.getenv("ADMISSION_MAX_ACTIVE", 64))
+ADMISSION_MAX_QUEUE: int = int(os.getenv("ADMISSION_MAX_QUEUE", 256))
+ADMISSION_MAX_WAIT_SECONDS: float = float(os.getenv("ADMISSION_MAX_WAIT_SECONDS", 30.0))
+# "reject_new": refuse arrivals while the queue is full; "drop_oldest": shed the longest waiter instead.
+ADMISSION_SHED_POLICY: str = os.getenv("ADMISSION_SHED_POLICY", "reject_new").lower()
+
+# Concurrent calls per downstream resource.
+RESOURCE_LIMITS: dict[str, int] = {
+    "stt": int(os.getenv("STT_MAX_CONCURRENCY", 16)),
+    "llm": int(os.getenv("LLM_MAX_CONCURRENCY", 32)),
+    "tts": int(os.getenv("TTS_MAX_CONCURRENCY", 16)),
+}
+
+# ffmpeg jobs running at once, per-job timeout and pre-spawned processes per profile.
+TRANSCODE_MAX_CONCURRENCY: int = int(os.getenv("TRANSCODE_MAX_CONCURRENCY", os.cpu_count() or 4))
+TRANSCODE_TIMEOUT_SECONDS: float = float(os.getenv("TRANSCODE_TIMEOUT_SECONDS", 60.0))
+TRANSCODE_WARM_PER_PROFILE: int = int(os.getenv("TRANSCODE_WARM_PER_PROFILE", 2))
+TRANSCODE_WARM_MAX_AGE_SECONDS: float = float(os.getenv("TRANSCODE_WARM_MAX_AGE_SECONDS", 600.0))
+
+# "polling" (default) or "webhook".
+BOT_MODE: str = os.getenv("BOT_MODE", "polling").lower()
+WEBHOOK_BASE_URL: str = os.getenv("WEBHOOK_BASE_URL", "")
+WEBHOOK_PATH: str = os.getenv("WEBHOOK_PATH", "/telegram/webhook")
+WEBHOOK_SECRET: str = os.getenv("WEBHOOK_SECRET", "")
+WEBHOOK_HOST: str = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT: int = int(os.getenv("WEBHOOK_PORT", 8080))
+WEBHOOK_WORKERS: int = int(os.getenv("WEBHOOK_WORKERS", 1))
+WEBHOOK_QUEUE_SIZE: int = int(os.getenv("WEBHOOK_QUEUE_SIZE", 1000))
+
+# "retrieval": stable prompt prefix + top-k relevant FAQ entries; "full": prefix + the whole FAQ.
+PROMPT_MODE: str = os.getenv("PROMPT_MODE", "retrieval").lower()
+PROMPT_FAQ_TOP_K: int = int(os.getenv("PROMPT_FAQ_TOP_K", 2))
+
+# Per-chat conversation memory: recent turns budget (0 disables memory), rolling summary size,
+# number of chats kept and idle time after which a chat is forgotten.
+MEMORY_HISTORY_TOKENS: int = int(os.getenv("MEMORY_HISTORY_TOKENS", 600))
+MEMORY_SUMMARY_TOKENS: int = int(os.getenv("MEMORY_SUMMARY_TOKENS", 150))
+MEMORY_MAX_CHATS: int = int(os.getenv("MEMORY_MAX_CHATS", 100_000))
+MEMORY_IDLE_TTL_SECONDS: float = float(os.getenv("MEMORY_IDLE_TTL_SECONDS", 30 * 60))
+
+# Prometheus metrics endpoint (/metrics); port 0 disables it.
+# Webhook worker N listens on METRICS_PORT + N.
+METRICS_HOST: str = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT: int = int(os.getenv("METRICS_PORT", 9108))
+
+# When answers also get a voice note: "always", "voice_only" (only replies to voice messages) or "never".
+# Users can override the mode with /voice. Answers longer than VOICE_REPLY_MAX_CHARS (0 = no limit) get text only.
+VOICE_REPLY_MODE: str = os.getenv("VOICE_REPLY_MODE", "always").lower()
+VOICE_REPLY_MAX_CHARS: int = int(os.getenv("VOICE_REPLY_MAX_CHARS", 0))
+
+# Answer confidently matched FAQ questions locally, without the LLM.
+# The threshold is a BM25 score margin, calibrated with `python -m benchmarks.faq_calibrate`.
+FAQ_DIRECT_ANSWERS: bool = os.getenv("FAQ_DIRECT_ANSWERS", "1").lower() in ("1", "true", "yes")
+FAQ_DIRECT_MIN_CONFIDENCE: float = float(os.getenv("FAQ_DIRECT_MIN_CONFIDENCE", 2.5))
+
+# Voice activity detection before transcription: trim silence, shorten pauses, skip silent notes.
+# Off by default: it decodes every note with ffmpeg, which the direct OGG upload avoids.
+STT_VAD: bool = os.getenv("STT_VAD", "0").lower() in ("1", "true", "yes")
+VAD_FRAME_MS: int = int(os.getenv("VAD_FRAME_MS", 30))
+VAD_THRESHOLD_DB: float = float(os.getenv("VAD_THRESHOLD_DB", -45.0))
+VAD_NOISE_MARGIN_DB: float = float(os.getenv("VAD_NOISE_MARGIN_DB", 10.0))
+VAD_HANGOVER_MS: int = int(os.getenv("VAD_HANGOVER_MS", 210))
+VAD_MAX_PAUSE_MS: int = int(os.getenv("VAD_MAX_PAUSE_MS", 600))
+VAD_MIN_SPEECH_MS: int = int(os.getenv("VAD_MIN_SPEECH_MS", 300))
+# Below this saving the original OGG is uploaded (much smaller than the trimmed WAV).
+VAD_MIN_SAVED_SECONDS: float = float(os.getenv("VAD_MIN_SAVED_SECONDS", 1.0))
+
+# Long voice notes: refused above the limits before downloading, otherwise transcribed
+# in parts of STT_CHUNK_SECONDS..STT_CHUNK_MAX_SECONDS cut at pauses, STT_CHUNK_PARALLEL at a time.
+VOICE_MAX_DURATION_SECONDS: int = int(os.getenv("VOICE_MAX_DURATION_SECONDS", 600))
+VOICE_MAX_FILE_BYTES: int = int(os.getenv("VOICE_MAX_FILE_BYTES", 20 * 1024 * 1024))
+STT_CHUNK_SECONDS: float = float(os.getenv("STT_CHUNK_SECONDS", 30.0))
+STT_CHUNK_MAX_SECONDS: float = float(os.getenv("STT_CHUNK_MAX_SECONDS", 45.0))
+STT_CHUNK_PARALLEL: int = int(os.getenv("STT_CHUNK_PARALLEL", 4))
+
+# Outbound Bot API pacing (see outbox.py). Telegram allows about 1 message/s per chat,
+# 20 messages/min per group and 30 messages/s in total; the total is split between webhook workers.
+OUTBOX_CHAT_RATE: float = float(os.getenv("OUTBOX_CHAT_RATE", 1.0))
+OUTBOX_CHAT_BURST: int = int(os.getenv("OUTBOX_CHAT_BURST", 3))
+OUTBOX_GROUP_RATE: float = float(os.getenv("OUTBOX_GROUP_RATE", 20 / 60))
+OUTBOX_GLOBAL_RATE: float = float(os.getenv("OUTBOX_GLOBAL_RATE", 30.0))
+OUTBOX_MAX_RETRIES: int = int(os.getenv("OUTBOX_MAX_RETRIES", 3))
+OUTBOX_RETRY_JITTER_SECONDS: float = float(os.getenv("OUTBOX_RETRY_JITTER_SECONDS", 1.0))
+OUTBOX_MAX_DELAY_SECONDS: float = float(os.getenv("OUTBOX_MAX_DELAY_SECONDS", 60.0))
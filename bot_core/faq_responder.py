@@ -0,0 +1,78 @@
+"""
+Answers FAQ questions locally, without the LLM, when the match is unambiguous.
+
+Matching:
+- A BM25 index per language over each entry's question and keywords
+  (the answer text is left out: it mentions phone numbers, offices and
+  links shared by many entries, which blurs the ranking).
+- Confidence is the margin between the best and the second best score.
+  A question that hits one entry clearly scores high; one that hits
+  several entries weakly, or none, scores low and goes to the LLM.
+- FAQ_DIRECT_MIN_CONFIDENCE is calibrated on the labelled eval set with
+  `python -m benchmarks.faq_calibrate`.
+
+A lookup is a handful of dict operations over a few dozen entries, so it
+takes well under a millisecond.
+"""
+
+from dataclasses import dataclass
+
+from .conf import FAQ_DIRECT_MIN_CONFIDENCE
+from .prompts import FAQ_ENTRIES, FaqEntry
+from .retrieval import BM25Index
+
+
+@dataclass(frozen=True)
+class FaqMatch:
+    entry: FaqEntry | None
+    confidence: float
+
+
+def render_answer(entry: FaqEntry) -> str:
+    return f"*{entry.question}*\n\n{entry.answer}"
+
+
+class FaqResponder:
+    def __init__(
+        self,
+        entries: dict[str, list[FaqEntry]] = FAQ_ENTRIES,
+        min_confidence: float = FAQ_DIRECT_MIN_CONFIDENCE,
+    ):
+        self.entries = entries
+        self.min_confidence = min_confidence
+        self._indexes = {
+            lang: BM25Index([f"{e.question} {e.keywords}" for e in lang_entries])
+            for lang, lang_entries in entries.items()
+        }
+        self.hits = 0
+        self.misses = 0
+
+    def rank(self, lang: str, question: str) -> FaqMatch:
+        """Best entry for `question` and its confidence, regardless of the threshold."""
+        index = self._indexes.get(lang)
+        if index is None:
+            return FaqMatch(None, 0.0)
+        top = index.search(question, 2)
+        if not top:
+            return FaqMatch(None, 0.0)
+        best_score = top[0][1]
+        runner_up = top[1][1] if len(top) > 1 else 0.0
+        return FaqMatch(self.entries[lang][top[0][0]], best_score - runner_up)
+
+    def match(self, lang: str, question: str) -> FaqEntry | None:
+        """
+        Return the FAQ entry answering `question` if the match is confident enough.
+
+        :param lang: Conversation language
+        :param question: User question
+        :return: Entry, or None to fall through to the LLM
+        """
+        result = self.rank(lang, question)
+        if result.entry is not None and result.confidence >= self.min_confidence:
+            self.hits += 1
+            return result.entry
+        self.misses += 1
+        return None
+
+    def stats(self) -> dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses}
@@ -0,0 +1,38 @@
+import re
+
+_HEADING_RE = re.compile(r'####\s*(.+)')
+_WIKI_LINK_RE = re.compile(r'\[\[[^\]]+]]\([^)]+\)')
+
+
+def _clean_fragment(text: str) -> str:
+    text = _HEADING_RE.sub(r'*\1*', text)
+    return _WIKI_LINK_RE.sub('', text)
+
+
+def clean_markdown(text: str) -> str:
+    if not text:
+        return text
+    return _clean_fragment(text).strip()
+
+
+class IncrementalMarkdownCleaner:
+    """
+    Apply clean_markdown to a growing text one completed line at a time.
+
+    Completed lines are cleaned once and kept; only the unfinished tail is
+    re-examined on every token, so the cost per token stays constant.
+    """
+
+    def __init__(self):
+        self._done = ""
+        self._tail = ""
+
+    def feed(self, delta: str) -> None:
+        self._tail += delta
+        if "\n" in self._tail:
+            complete, self._tail = self._tail.rsplit("\n", 1)
+            self._done += _clean_fragment(complete + "\n")
+
+    @property
+    def text(self) -> str:
+        return (self._done + self._tail).strip()
@@ -0,0 +1,216 @@
+"""
+Per-chat conversation memory with a strict token budget.
+
+Per chat:
+- A ring buffer of the most recent exchanges (user + assistant message).
+  Their total size never exceeds MEMORY_HISTORY_TOKENS; a single oversized
+  message is truncated on the way in.
+- Turns pushed out of the buffer are folded into a rolling summary of at
+  most MEMORY_SUMMARY_TOKENS. Summarization runs as a background task
+  after the reply has been sent, never on the request path; until it
+  finishes, the evicted turns are simply not part of the context.
+
+Global bounds:
+- At most MEMORY_MAX_CHATS chats are kept (least recently used are
+  dropped), and chats idle for MEMORY_IDLE_TTL_SECONDS are forgotten.
+  So memory use is capped at roughly
+  MEMORY_MAX_CHATS × (history + summary + pending budget).
+
+Token counts are estimated from the text length, which is cheap and
+close enough for budgeting.
+"""
+
+import asyncio
+import logging
+import time
+from collections import OrderedDict, deque
+from typing import Awaitable, Callable
+
+from .conf import (
+    MEMORY_HISTORY_TOKENS,
+    MEMORY_SUMMARY_TOKENS,
+    MEMORY_MAX_CHATS,
+    MEMORY_IDLE_TTL_SECONDS,
+)
+
+logger = logging.getLogger("bot.memory")
+
+CHARS_PER_TOKEN = 4
+
+SUMMARY_HEADERS = {
+    "ru": "Краткое содержание предыдущей части разговора:",
+    "kz": "Әңгіменің алдыңғы бөлігінің қысқаша мазмұны:",
+    "en": "Summary of the earlier part of the conversation:",
+}
+
+# (lang, previous summary, turns to fold in as (role, text)) → new summary
+Summarizer = Callable[[str, str, list[tuple[str, str]]], Awaitable[str]]
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def truncate_to_tokens(text: str, tokens: int) -> str:
+    limit = tokens * CHARS_PER_TOKEN
+    if len(text) <= limit:
+        return text
+    return text[: max(0, limit - 1)].rstrip() + "…"
+
+
+class _Chat:
+    __slots__ = ("lang", "turns", "tokens", "summary", "pending", "pending_tokens", "summarizing", "last_used")
+
+    def __init__(self, lang: str):
+        self.lang = lang
+        self.turns: deque[tuple[str, str, int]] = deque()
+        self.tokens = 0
+        self.summary = ""
+        self.pending: list[tuple[str, str, int]] = []
+        self.pending_tokens = 0
+        self.summarizing = False
+        self.last_used = time.monotonic()
+
+
+class ConversationMemory:
+    def __init__(
+        self,
+        summarizer: Summarizer | None = None,
+        history_tokens: int = MEMORY_HISTORY_TOKENS,
+        summary_tokens: int = MEMORY_SUMMARY_TOKENS,
+        max_chats: int = MEMORY_MAX_CHATS,
+        idle_ttl: float = MEMORY_IDLE_TTL_SECONDS,
+    ):
+        """
+        :param summarizer: Folds evicted turns into the summary; without it evicted turns are dropped
+        """
+        self.summarizer = summarizer
+        self.history_tokens = history_tokens
+        self.summary_tokens = summary_tokens
+        self.max_chats = max_chats
+        self.idle_ttl = idle_ttl
+
+        self._chats: OrderedDict[int, _Chat] = OrderedDict()
+        self._tasks: set[asyncio.Task] = set()
+        self.evicted = 0
+        self.summaries = 0
+        self.summary_failures = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.history_tokens > 0
+
+    def history(self, chat_id: int, lang: str) -> list[dict[str, str]]:
+        """
+        Return the remembered context of a chat as chat messages.
+
+        :param chat_id: Telegram chat id
+        :param lang: Current conversation language; memory of another language is discarded
+        :return: Optional summary system message followed by the recent turns, oldest first
+        """
+        chat = self._get(chat_id, lang)
+        if chat is None:
+            return []
+        messages = []
+        if chat.summary:
+            header = SUMMARY_HEADERS.get(chat.lang, SUMMARY_HEADERS["ru"])
+            messages.append({"role": "system", "content": f"{header}\n{chat.summary}"})
+        messages.extend({"role": role, "content": text} for role, text, _ in chat.turns)
+        return messages
+
+    def append(self, chat_id: int, lang: str, question: str, answer: str) -> None:
+        """Remember one exchange; may schedule background summarization of older turns."""
+        if not self.enabled:
+            return
+        chat = self._get(chat_id, lang)
+        if chat is None:
+            chat = _Chat(lang)
+            self._chats[chat_id] = chat
+            while len(self._chats) > self.max_chats:
+                self._chats.popitem(last=False)
+                self.evicted += 1
+
+        # One exchange may take at most the whole budget, split between question and answer.
+        half = max(1, self.history_tokens // 2)
+        for role, text in (("user", question), ("assistant", answer)):
+            text = truncate_to_tokens(text, half)
+            tokens = estimate_tokens(text)
+            chat.turns.append((role, text, tokens))
+            chat.tokens += tokens
+
+        # Evict whole exchanges so the history never starts with an orphaned answer.
+        while chat.tokens > self.history_tokens and len(chat.turns) > 2:
+            for _ in range(2):
+                turn = chat.turns.popleft()
+                chat.tokens -= turn[2]
+                if self.summarizer is not None:
+                    chat.pending.append(turn)
+                    chat.pending_tokens += turn[2]
+
+        # Bound what waits for summarization, in case the summarizer is slow or failing.
+        while chat.pending_tokens > self.history_tokens:
+            chat.pending_tokens -= chat.pending.pop(0)[2]
+
+        if chat.pending and not chat.summarizing:
+            self._schedule_summary(chat)
+
+    def reset(self, chat_id: int) -> None:
+        self._chats.pop(chat_id, None)
+
+    async def close(self) -> None:
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "chats": len(self._chats),
+            "evicted": self.evicted,
+            "summaries": self.summaries,
+            "summary_failures": self.summary_failures,
+            "summarizing": len(self._tasks),
+        }
+
+    def _get(self, chat_id: int, lang: str) -> _Chat | None:
+        self._evict_idle()
+        chat = self._chats.get(chat_id)
+        if chat is None:
+            return None
+        if chat.lang != lang:
+            del self._chats[chat_id]
+            return None
+        chat.last_used = time.monotonic()
+        self._chats.move_to_end(chat_id)
+        return chat
+
+    def _evict_idle(self) -> None:
+        deadline = time.monotonic() - self.idle_ttl
+        while self._chats:
+            chat = next(iter(self._chats.values()))
+            if chat.last_used >= deadline:
+                break
+            self._chats.popitem(last=False)
+            self.evicted += 1
+
+    def _schedule_summary(self, chat: _Chat) -> None:
+        chat.summarizing = True
+        task = asyncio.create_task(self._summarize(chat))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _summarize(self, chat: _Chat) -> None:
+        try:
+            while chat.pending:
+                turns, chat.pending, chat.pending_tokens = chat.pending, [], 0
+                try:
+                    summary = await self.summarizer(chat.lang, chat.summary, [(r, t) for r, t, _ in turns])
+                except asyncio.CancelledError:
+                    raise
+                except Exception:
+                    self.summary_failures += 1
+                    logger.exception("Не удалось обновить краткое содержание диалога")
+                    return
+                chat.summary = truncate_to_tokens(summary.strip(), self.summary_tokens)
+                self.summaries += 1
+        finally:
+            chat.summarizing = False
@@ -0,0 +1,221 @@
+"""
+Constant-memory latency histograms and the bot's metrics registry.
+
+A Histogram keeps one counter per fixed upper bound plus a running sum and
+count, so observing a value is O(log buckets) and memory never grows with
+traffic. Bucket bounds follow Prometheus conventions (cumulative "le").
+
+Registry (`registry`, one per process):
+- `span(stage)` times a block of code into the `bot_stage_seconds`
+  histogram labelled by stage and language; exceptions are also counted
+  in `bot_stage_errors_total`. The language comes from the `current_lang`
+  context variable, set once per update, so lower layers (STT, TTS,
+  ffmpeg) need no extra arguments.
+- `add(name, value)` increments a counter labelled by language (tokens,
+  audio seconds, TTS characters...).
+- Gauge providers: the `stats()` methods of caches, queues and pools are
+  registered once and sampled on every scrape.
+- `start_metrics_server` serves everything in the Prometheus text format
+  on METRICS_HOST:METRICS_PORT/metrics.
+
+Label sets are small and fixed (stages × languages), so the registry stays
+bounded as well.
+"""
+
+import bisect
+import contextvars
+import logging
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterator
+
+from aiohttp import web
+
+from .conf import METRICS_HOST, METRICS_PORT
+
+logger = logging.getLogger("bot.metrics")
+
+DEFAULT_LATENCY_BUCKETS: tuple[float, ...] = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0,
+)
+
+
+class Histogram:
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds: tuple[float, ...] = DEFAULT_LATENCY_BUCKETS):
+        self.bounds = bounds
+        # The last slot counts values above the largest bound (+Inf).
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """Approximate quantile: the upper bound of the bucket holding the q-th value."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+    def cumulative(self) -> list[int]:
+        """Counts per bucket including all smaller buckets; the last item equals `count`."""
+        total = 0
+        result = []
+        for count in self.counts:
+            total += count
+            result.append(total)
+        return result
+
+    def snapshot(self) -> dict[str, float]:
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 6),
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+        }
+
+
+current_lang: contextvars.ContextVar[str] = contextvars.ContextVar("current_lang", default="")
+
+Labels = tuple[tuple[str, str], ...]
+
+
+def _format_labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels) + "}"
+
+
+def _flatten(prefix: str, values: dict) -> Iterator[tuple[str, float]]:
+    for key, value in values.items():
+        name = f"{prefix}_{key}"
+        if isinstance(value, dict):
+            yield from _flatten(name, value)
+        elif isinstance(value, (int, float)):
+            yield name, value
+
+
+class MetricsRegistry:
+    def __init__(self, namespace: str = "bot"):
+        self.namespace = namespace
+        self._histograms: dict[str, dict[Labels, Histogram]] = {}
+        self._counters: dict[str, dict[Labels, float]] = {}
+        self._gauge_providers: dict[str, Callable[[], dict]] = {}
+        self._external_histograms: dict[str, Histogram] = {}
+
+    def observe(self, name: str, value: float, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        series = self._histograms.setdefault(name, {})
+        histogram = series.get(key)
+        if histogram is None:
+            histogram = series[key] = Histogram()
+        histogram.observe(value)
+
+    def add(self, name: str, value: float = 1, lang: str | None = None, **labels: str) -> None:
+        """Increment counter `name`; labelled with the current language unless `lang` is given."""
+        labels["lang"] = current_lang.get() if lang is None else lang
+        key = tuple(sorted(labels.items()))
+        series = self._counters.setdefault(name, {})
+        series[key] = series.get(key, 0) + value
+
+    @contextmanager
+    def span(self, stage: str) -> Iterator[None]:
+        """Time the enclosed block as `stage` (works inside coroutines as well)."""
+        lang = current_lang.get()
+        started = time.perf_counter()
+        try:
+            yield
+        except BaseException:
+            self.add("stage_errors_total", lang=lang, stage=stage)
+            raise
+        finally:
+            self.observe("stage_seconds", time.perf_counter() - started, stage=stage, lang=lang)
+
+    def register_gauges(self, name: str, provider: Callable[[], dict]) -> None:
+        """Sample `provider()` (e.g. a stats() method) on every scrape as gauges `<namespace>_<name>_<key>`."""
+        self._gauge_providers[name] = provider
+
+    def register_histogram(self, name: str, histogram: Histogram) -> None:
+        """Expose a histogram owned by another component."""
+        self._external_histograms[name] = histogram
+
+    def stage_snapshot(self) -> dict[str, dict[str, float]]:
+        """p50/p95/p99 per "stage/lang", for logs and debugging."""
+        return {
+            f"{dict(labels)['stage']}/{dict(labels)['lang'] or '-'}": histogram.snapshot()
+            for labels, histogram in self._histograms.get("stage_seconds", {}).items()
+        }
+
+    def render(self) -> str:
+        """Return all metrics in the Prometheus text exposition format."""
+        lines: list[str] = []
+        for name, series in self._counters.items():
+            full = f"{self.namespace}_{name}"
+            lines.append(f"# TYPE {full} counter")
+            for labels, value in series.items():
+                lines.append(f"{full}{_format_labels(labels)} {value:g}")
+
+        histograms = dict(self._histograms)
+        histograms.update({name: {(): h} for name, h in self._external_histograms.items()})
+        for name, series in histograms.items():
+            full = f"{self.namespace}_{name}"
+            lines.append(f"# TYPE {full} histogram")
+            for labels, histogram in series.items():
+                cumulative = histogram.cumulative()
+                for bound, count in zip((*histogram.bounds, "+Inf"), cumulative):
+                    le = bound if isinstance(bound, str) else f"{bound:g}"
+                    lines.append(f"{full}_bucket{_format_labels(labels + (('le', le),))} {count}")
+                lines.append(f"{full}_sum{_format_labels(labels)} {histogram.sum:.6f}")
+                lines.append(f"{full}_count{_format_labels(labels)} {histogram.count}")
+
+        for prefix, provider in self._gauge_providers.items():
+            try:
+                values = provider()
+            except Exception:
+                logger.exception("Не удалось получить метрики %s", prefix)
+                continue
+            for name, value in _flatten(f"{self.namespace}_{prefix}", values):
+                lines.append(f"# TYPE {name} gauge")
+                lines.append(f"{name} {value:g}")
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+span = registry.span
+
+
+async def start_metrics_server(port: int = METRICS_PORT, host: str = METRICS_HOST) -> web.AppRunner | None:
+    """
+    Serve `registry` on http://host:port/metrics. Port 0 disables the endpoint.
+
+    :return: Runner to pass to `runner.cleanup()` on shutdown, or None if not started
+    """
+    if not port:
+        return None
+
+    async def handle_metrics(request: web.Request) -> web.Response:
+        return web.Response(text=registry.render(), content_type="text/plain", charset="utf-8")
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle_metrics)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    try:
+        await web.TCPSite(runner, host, port).start()
+    except OSError:
+        logger.exception("Не удалось запустить сервер метрик на %s:%s", host, port)
+        await runner.cleanup()
+        return None
+    logger.info("Метрики доступны на http://%s:%s/metrics", host, port)
+    return runner
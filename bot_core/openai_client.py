@@ -0,0 +1,33 @@
+import httpx
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+
+from .conf import (
+    OPENAI_MAX_CONNECTIONS,
+    OPENAI_MAX_KEEPALIVE_CONNECTIONS,
+    OPENAI_MAX_RETRIES,
+    OPENAI_CONNECT_TIMEOUT,
+    OPENAI_CHAT_TIMEOUT,
+)
+
+
+def create_openai_client(api_key: str) -> AsyncOpenAI:
+    """
+    Build the process-wide AsyncOpenAI client.
+
+    All calls share one HTTP connection pool with keep-alive, so bursts reuse
+    warm TLS connections instead of opening new ones. Per-call timeouts are
+    passed at the call site; the client default covers everything else.
+    """
+    http_client = DefaultAsyncHttpxClient(
+        limits=httpx.Limits(
+            max_connections=OPENAI_MAX_CONNECTIONS,
+            max_keepalive_connections=OPENAI_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=60.0,
+        ),
+        timeout=httpx.Timeout(OPENAI_CHAT_TIMEOUT, connect=OPENAI_CONNECT_TIMEOUT),
+    )
+    return AsyncOpenAI(
+        api_key=api_key,
+        http_client=http_client,
+        max_retries=OPENAI_MAX_RETRIES,
+    )
@@ -0,0 +1,230 @@
+"""
+Outbound rate limiting for Bot API calls (aiogram request middleware).
+
+Every API call that targets a chat (sendMessage, sendVoice, editMessageText,
+...) goes through `Outbox`, registered on the bot session at startup:
+- Per-chat pacing: OUTBOX_CHAT_RATE messages per second with bursts of
+  OUTBOX_CHAT_BURST in private chats, OUTBOX_GROUP_RATE in groups and
+  channels. Calls of one chat are sent strictly in order.
+- Global pacing: OUTBOX_GLOBAL_RATE calls per second per process (the
+  webhook workers split the bot-wide limit between them).
+- 429 Too Many Requests: the chat (or the whole process, for calls without
+  a chat) is paused for `retry_after` plus up to
+  OUTBOX_RETRY_JITTER_SECONDS of jitter, so paused senders do not wake up
+  together. send* calls are then retried up to OUTBOX_MAX_RETRIES times;
+  other calls (message edits) fail fast, their callers merge edits anyway.
+  A `retry_after` above OUTBOX_MAX_DELAY_SECONDS is not waited out.
+
+Calls wait in the outbox instead of failing, so a burst costs a short
+delay rather than a lost reply. `stats()` reports the outbox depth.
+"""
+
+import asyncio
+import logging
+import math
+import random
+import time
+from collections import OrderedDict
+from contextlib import nullcontext
+from typing import Any
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import Response, TelegramMethod
+
+from .conf import (
+    OUTBOX_CHAT_RATE,
+    OUTBOX_CHAT_BURST,
+    OUTBOX_GROUP_RATE,
+    OUTBOX_GLOBAL_RATE,
+    OUTBOX_MAX_RETRIES,
+    OUTBOX_RETRY_JITTER_SECONDS,
+    OUTBOX_MAX_DELAY_SECONDS,
+)
+from .metrics import registry
+
+logger = logging.getLogger("bot.outbox")
+
+
+class _Pacer:
+    """Virtual-clock token bucket (GCRA): `rate` calls per second, bursts of `burst`."""
+
+    __slots__ = ("interval", "tolerance", "tat", "blocked_until")
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self.tolerance = max(0, burst - 1) * self.interval
+        self.tat = 0.0
+        self.blocked_until = 0.0
+
+    def earliest(self, now: float) -> float:
+        return max(now, self.tat - self.tolerance, self.blocked_until)
+
+    def commit(self, at: float) -> None:
+        self.tat = max(self.tat, at) + self.interval
+
+    def idle(self, now: float) -> bool:
+        return self.tat <= now and self.blocked_until <= now
+
+
+class _ChatLane:
+    __slots__ = ("pacer", "lock", "users")
+
+    def __init__(self, pacer: _Pacer):
+        self.pacer = pacer
+        self.lock = asyncio.Lock()
+        self.users = 0
+
+
+class Outbox(BaseRequestMiddleware):
+    def __init__(
+        self,
+        chat_rate: float = OUTBOX_CHAT_RATE,
+        chat_burst: int = OUTBOX_CHAT_BURST,
+        group_rate: float = OUTBOX_GROUP_RATE,
+        global_rate: float = OUTBOX_GLOBAL_RATE,
+        max_retries: int = OUTBOX_MAX_RETRIES,
+        retry_jitter: float = OUTBOX_RETRY_JITTER_SECONDS,
+        max_delay: float = OUTBOX_MAX_DELAY_SECONDS,
+    ):
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.group_rate = group_rate
+        self.max_retries = max_retries
+        self.retry_jitter = retry_jitter
+        self.max_delay = max_delay
+        self._global = _Pacer(global_rate, max(1, int(global_rate)))
+        self._lanes: OrderedDict[Any, _ChatLane] = OrderedDict()
+
+        self.queued = 0
+        self.in_flight = 0
+        self.sent = 0
+        self.retried = 0
+        self.failed = 0
+        self.delayed = 0
+        self.delay_seconds_total = 0.0
+        self.delay_seconds_max = 0.0
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType,
+        bot: Bot,
+        method: TelegramMethod,
+    ) -> Response:
+        chat_id = getattr(method, "chat_id", None)
+        if chat_id is None:
+            return await self._send(make_request, bot, method, None)
+
+        lane = self._lane(chat_id)
+        lane.users += 1
+        try:
+            return await self._send(make_request, bot, method, lane)
+        finally:
+            lane.users -= 1
+            self._prune()
+
+    async def _send(
+        self,
+        make_request: NextRequestMiddlewareType,
+        bot: Bot,
+        method: TelegramMethod,
+        lane: _ChatLane | None,
+    ) -> Response:
+        retryable = method.__api_method__.startswith("send")
+        pacer = lane.pacer if lane is not None else None
+        attempt = 0
+        started = time.monotonic()
+        queued = True
+        self.queued += 1
+        try:
+            async with lane.lock if lane is not None else nullcontext():
+                while True:
+                    await self._wait_turn(method, pacer)
+                    if queued:
+                        queued = False
+                        self.queued -= 1
+                        self._record_delay(time.monotonic() - started, method)
+
+                    self.in_flight += 1
+                    try:
+                        response = await make_request(bot, method)
+                        self.sent += 1
+                        return response
+                    except TelegramRetryAfter as e:
+                        pause = e.retry_after + random.uniform(0, self.retry_jitter)
+                        (pacer or self._global).blocked_until = time.monotonic() + pause
+                        registry.add("outbox_throttled_total", method=method.__api_method__)
+                        if not retryable or attempt >= self.max_retries or e.retry_after > self.max_delay:
+                            self.failed += 1
+                            raise
+                        attempt += 1
+                        self.retried += 1
+                        logger.warning(
+                            "Telegram ограничил отправку (%s), повтор через %.1f с", method.__api_method__, pause
+                        )
+                    finally:
+                        self.in_flight -= 1
+        finally:
+            if queued:
+                self.queued -= 1
+
+    async def _wait_turn(self, method: TelegramMethod, pacer: _Pacer | None) -> None:
+        now = time.monotonic()
+        at = max(pacer.earliest(now) if pacer is not None else now, self._global.blocked_until)
+        if at - now > self.max_delay:
+            # Paused by Telegram for longer than a reply is worth holding.
+            self.failed += 1
+            raise TelegramRetryAfter(method=method, message="outbox is paused", retry_after=math.ceil(at - now))
+        if pacer is not None:
+            pacer.commit(at)
+        if at > now:
+            await asyncio.sleep(at - now)
+            now = time.monotonic()
+
+        # The global slot is taken only when the chat's turn has come, so chats
+        # waiting out their own pacing do not hold back the others.
+        at = self._global.earliest(now)
+        self._global.commit(at)
+        if at > now:
+            await asyncio.sleep(at - now)
+
+    def _lane(self, chat_id: Any) -> _ChatLane:
+        lane = self._lanes.get(chat_id)
+        if lane is None:
+            private = isinstance(chat_id, int) and chat_id > 0
+            pacer = _Pacer(self.chat_rate, self.chat_burst) if private else _Pacer(self.group_rate)
+            lane = self._lanes[chat_id] = _ChatLane(pacer)
+        else:
+            self._lanes.move_to_end(chat_id)
+        return lane
+
+    def _prune(self) -> None:
+        """Forget the least recently used chats once their pacing state has expired."""
+        now = time.monotonic()
+        while self._lanes:
+            lane = next(iter(self._lanes.values()))
+            if lane.users or not lane.pacer.idle(now):
+                break
+            self._lanes.popitem(last=False)
+
+    def _record_delay(self, seconds: float, method: TelegramMethod) -> None:
+        if seconds < 0.001:
+            return
+        self.delayed += 1
+        self.delay_seconds_total += seconds
+        self.delay_seconds_max = max(self.delay_seconds_max, seconds)
+        registry.observe("outbox_wait_seconds", seconds, method=method.__api_method__)
+
+    def stats(self) -> dict[str, float]:
+        return {
+            "queue_depth": self.queued,
+            "in_flight": self.in_flight,
+            "chats": len(self._lanes),
+            "sent": self.sent,
+            "retried": self.retried,
+            "failed": self.failed,
+            "delayed": self.delayed,
+            "delay_seconds_total": round(self.delay_seconds_total, 3),
+            "delay_seconds_max": round(self.delay_seconds_max, 3),
+        }
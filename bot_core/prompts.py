@@ -0,0 +1,363 @@
+"""
+System prompts for the chat completion: stable prefix + retrieved FAQ.
+
+Layout of a request (PROMPT_MODE="retrieval"):
+1. PROMPT_PREFIXES[lang] — role and reply rules only, kept short because
+   every request pays for it. Identical for every question of a language,
+   so it always forms the leading part of the request and benefits from
+   provider-side prompt prefix caching.
+2. Only the entries relevant to the question, as a second system message:
+   BM25 top-k over FAQ_ENTRIES[lang] plus the best match among
+   REFERENCE_ENTRIES[lang] (company summary, site sections, contacts and
+   hours), which used to sit in the fixed prefix.
+3. Conversation history, if any (rolling summary + recent turns).
+4. The user message.
+
+PROMPT_MODE="full" sends the prefix with the complete FAQ, which is what the
+bot used to send for every question (kept for comparison and fallback).
+"""
+
+from dataclasses import dataclass
+
+from .conf import PROMPT_MODE, PROMPT_FAQ_TOP_K
+from .retrieval import BM25Index
+
+
+@dataclass(frozen=True)
+class FaqEntry:
+    question: str
+    answer: str
+    # Extra words people use for the topic; indexed but never sent to the model.
+    keywords: str = ""
+
+
+PROMPT_PREFIXES: dict[str, str] = {
+    "ru": (
+        "Ты — официальный цифровой помощник АО «Қазақтелеком». "
+        "Отвечай на русском кратко, вежливо и по делу.\n"
+        "• Если нужен специалист (выезд мастера, лицевой счёт, личные данные) — направляй в WhatsApp/Telegram "
+        "+77080000160 или контакт-центр 160, указывай сроки/стоимость, если известны.\n"
+        "• Не разглашай конфиденциальную информацию.\n"
+        "• Ссылки и контакты бери только из справки.\n"
+        "• На вопросы не про Казахтелеком вежливо отвечай, что не можешь помочь."
+    ),
+    "kz": (
+        "Сен — АО «Қазақтелеком» ресми цифрлық көмекшісісің. "
+        "Қазақ тілінде қысқа, сыпайы және нақты жауап бер.\n"
+        "• Маман қажет болса (шебер шақыру, дербес шот, жеке деректер) — WhatsApp/Telegram +77080000160 немесе 160.\n"
+        "• Құпия ақпаратты жариялама.\n"
+        "• Сілтемелер мен байланыстарды тек анықтамадан ал.\n"
+        "• Сұрақ компанияға қатысты болмаса — сыпайы түрде хабарла."
+    ),
+    "en": (
+        "You are the official digital assistant of Kazakhtelecom JSC. "
+        "Answer in English, briefly, politely and to the point.\n"
+        "• If a specialist is needed (technician visit, account actions, personal data), refer the user to "
+        "WhatsApp/Telegram +77080000160 or call center 160 and mention fees/timing if known.\n"
+        "• Do not disclose confidential information.\n"
+        "• Take links and contacts only from the reference.\n"
+        "• If the question is unrelated to Kazakhtelecom, politely say you cannot help."
+    ),
+}
+
+FAQ_HEADERS: dict[str, str] = {
+    "ru": "Справка:\n",
+    "kz": "Анықтама:\n",
+    "en": "Reference:\n",
+}
+
+FAQ_ENTRIES: dict[str, list[FaqEntry]] = {
+    "ru": [
+        FaqEntry(
+            "Как изменить пароль Wi-Fi?",
+            "1. Откройте браузер и перейдите на 192.168.100.1\n"
+            "2. Введите Account: telecomadmin, Password: admintelecom\n"
+            "3. Вкладка WLAN → SSID Name и WPA PreSharedKey → Apply",
+            "вайфай вай фай wifi роутер модем сеть поменять сменить название",
+        ),
+        FaqEntry(
+            "Как восстановить междугородние/международные звонки?",
+            "Подать заявку в онлайн-каналах (WhatsApp/Telegram) по +77080000160, звонком в 160 или в офисе.",
+            "межгород межгородние международная связь звонить заграницу подключить звонки",
+        ),
+        FaqEntry(
+            "Можно ли временно приостановить услуги?",
+            "Да — только телефонию и отдельный интернет (вне пакета). Заявление через WhatsApp/Telegram +77080000160 или 160. "
+            "Стоимость: телефония 500 ₸, интернет 1000 ₸. Срок 1 день–1 месяц, максимум 3 месяца в год.",
+            "приостановка заморозить блокировка пауза отключить временно отпуск уезжаю",
+        ),
+        FaqEntry(
+            "Как подключить услугу на новый адрес?",
+            "Обратитесь в онлайн-каналы (+77080000160), в контакт-центр 160 или в офис обслуживания.",
+            "переезд переезжаю перенос адрес квартира",
+        ),
+        FaqEntry(
+            "Что такое авансовый / кредитный метод оплаты?",
+            "Аванс: оплачиваете заранее (например, оплатили в конце января — пользуетесь в феврале).\n"
+            "Кредит: получаете услуги сейчас, оплачиваете до 25 числа следующего месяца.",
+            "оплата оплатить платить счёт счет аванс кредит срок оплаты когда платить",
+        ),
+        FaqEntry(
+            "Какие документы нужны для подключения?",
+            "Удостоверение личности / паспорт.",
+            "документ паспорт удостоверение подключить подключение договор",
+        ),
+        FaqEntry(
+            "Как оставить обращение или вызвать мастера?",
+            "Оставить заявку на сайте telecom.kz, в WhatsApp/Telegram +77080000160 или по 160.",
+            "мастер выезд заявка обращение жалоба ремонт не работает сломался",
+        ),
+    ],
+    "kz": [
+        FaqEntry(
+            "Wi-Fi парольін қалай өзгертуге болады?",
+            "1. Браузер ашып 192.168.100.1 адресіне кіріңіз\n"
+            "2. Account: telecomadmin, Password: admintelecom\n"
+            "3. WLAN → SSID Name мен WPA PreSharedKey енгізіп Apply басыңыз",
+            "вайфай wifi құпиясөз пароль роутер модем желі",
+        ),
+        FaqEntry(
+            "Қашықтық/халықаралық қоңырауларды қалай қалпына келтіруге болады?",
+            "+77080000160 (WhatsApp/Telegram), 160 немесе сервистік орталыққа өтініш қалдырыңыз.",
+            "қалааралық халықаралық қоңырау шалу байланыс",
+        ),
+        FaqEntry(
+            "Қызметтерді уақытша тоқтатуға бола ма?",
+            "Иә — тек телефония мен жеке интернет. Өтініш +77080000160 арқылы; төлем: телефония 500 ₸, интернет 1000 ₸; "
+            "мерзім 1 күннен 1 айға дейін.",
+            "тоқтату уақытша өшіру бұғаттау демалыс",
+        ),
+        FaqEntry(
+            "Қызметті жаңа мекенжайға қалай қосуға болады?",
+            "+77080000160, 160 немесе қызмет көрсету офистеріне жазыңыз.",
+            "көшу мекенжай үй пәтер ауыстыру",
+        ),
+        FaqEntry(
+            "Қызметтерді қосу үшін қандай құжаттар қажет?",
+            "Төлқұжат/жеке куәлік.",
+            "құжат төлқұжат куәлік қосу келісімшарт",
+        ),
+    ],
+    "en": [
+        FaqEntry(
+            "How to change Wi-Fi password?",
+            "1. Open a browser and go to 192.168.100.1\n"
+            "2. Login: Account = telecomadmin, Password = admintelecom\n"
+            "3. In WLAN section, set SSID Name and WPA PreSharedKey, then Apply",
+            "wifi wireless router modem network name ssid reset",
+        ),
+        FaqEntry(
+            "How to restore long-distance / international calls?",
+            "Submit a request via WhatsApp/Telegram +77080000160, call center 160 or visit a service office.",
+            "intercity international abroad calling phone enable",
+        ),
+        FaqEntry(
+            "Can I temporarily suspend services?",
+            "Yes — only telephony and standalone internet. Owner should request via WhatsApp/Telegram +77080000160 or call 160. "
+            "Fees: telephony 500 KZT, internet 1000 KZT. Period: 1 day–1 month (max 3 months per year).",
+            "pause freeze block stop temporarily vacation travel",
+        ),
+        FaqEntry(
+            "How to request service at a new address?",
+            "Contact WhatsApp/Telegram +77080000160, call center 160 or a service office.",
+            "move moving relocate relocation apartment house",
+        ),
+        FaqEntry(
+            "Which documents are required for connection?",
+            "ID / passport.",
+            "document documents passport identity card connect contract",
+        ),
+    ],
+}
+
+
+# Company facts, links and contacts. They used to be part of every prompt; now they are
+# retrieved like FAQ entries, but kept out of FAQ_ENTRIES so they are never sent as
+# direct answers (faq_responder.py).
+REFERENCE_ENTRIES: dict[str, list[FaqEntry]] = {
+    "ru": [
+        FaqEntry(
+            "О компании и сайт",
+            "Крупнейший инфокоммуникационный оператор в Казахстане. Сайт: https://telecom.kz/ru "
+            "(https://telecom.kz/kk — казахский, https://telecom.kz/en — английский).",
+            "казахтелеком компания оператор сайт официальный",
+        ),
+        FaqEntry(
+            "Контакты и часы работы контакт-центра",
+            "Контакт-центр: 160 | +7 800 160 00 00 | info@telecom.kz\n"
+            "Пн–Пт: 08:00–23:00, Сб–Вс и праздничные дни: 09:00–23:00\n"
+            "Телеграм-канал: @kazakhtelecom_official",
+            "контакты телефон позвонить номер почта email часы работы график поддержка оператор телеграм канал",
+        ),
+        FaqEntry(
+            "База знаний (FAQ)",
+            "https://telecom.kz/ru/knowledge/14",
+            "база знаний инструкция справка вопросы",
+        ),
+        FaqEntry(
+            "Интернет",
+            "https://telecom.kz/ru/common/internet",
+            "интернет тариф тарифы скорость подключить",
+        ),
+        FaqEntry(
+            "Телевидение",
+            "https://telecom.kz/ru/common/tvplus",
+            "телевидение тв tv каналы тариф тарифы приставка",
+        ),
+        FaqEntry(
+            "Телефон / мобильная связь",
+            "https://telecom.kz/ru/common/mobsvyaz-altel",
+            "телефон мобильная связь мобильный сотовый altel алтел тариф тарифы",
+        ),
+    ],
+    "kz": [
+        FaqEntry(
+            "Компания туралы және сайт",
+            "Қазақстандағы ең ірі инфокоммуникациялық оператор. Сайт: https://telecom.kz/kk "
+            "(https://telecom.kz/ru — орысша, https://telecom.kz/en — ағылшынша).",
+            "қазақтелеком компания оператор сайт",
+        ),
+        FaqEntry(
+            "Байланыс және жұмыс уақыты",
+            "Байланыс орталығы: 160 | +7 800 160 00 00 | info@telecom.kz\n"
+            "Дс–Жм: 08:00–23:00, Сб–Жс және мереке күндері: 09:00–23:00\n"
+            "Телеграм каналы: @kazakhtelecom_official",
+            "байланыс телефон нөмір қоңырау пошта жұмыс уақыты кесте қолдау телеграм",
+        ),
+        FaqEntry(
+            "Жиі қойылатын сұрақтар (FAQ)",
+            "https://telecom.kz/kk/knowledge/14",
+            "анықтама нұсқаулық сұрақтар",
+        ),
+        FaqEntry(
+            "Интернет",
+            "https://telecom.kz/kk/common/internet",
+            "интернет тариф жылдамдық қосу",
+        ),
+        FaqEntry(
+            "Теледидар",
+            "https://telecom.kz/kk/common/tvplus",
+            "теледидар тв tv арналар тариф",
+        ),
+        FaqEntry(
+            "Телефония / мобильді байланыс",
+            "https://telecom.kz/kk/common/mobsvyaz-altel",
+            "телефон мобильді байланыс altel алтел тариф",
+        ),
+    ],
+    "en": [
+        FaqEntry(
+            "About the company and website",
+            "Kazakhtelecom is the largest infocommunications operator in Kazakhstan. Website: https://telecom.kz/en "
+            "(https://telecom.kz/kk Kazakh, https://telecom.kz/ru Russian).",
+            "kazakhtelecom company operator website site official",
+        ),
+        FaqEntry(
+            "Contacts and call center hours",
+            "Call center: 160 | +7 800 160 00 00 | info@telecom.kz\n"
+            "Mon–Fri: 08:00–23:00, Sat–Sun and holidays: 09:00–23:00\n"
+            "Telegram channel: @kazakhtelecom_official",
+            "contact contacts phone number call email hours schedule support telegram channel",
+        ),
+        FaqEntry(
+            "Knowledge base (FAQ)",
+            "https://telecom.kz/en/knowledge/14",
+            "knowledge base help instructions questions",
+        ),
+        FaqEntry(
+            "Internet services",
+            "https://telecom.kz/en/common/internet",
+            "internet plan plans tariff speed connect",
+        ),
+        FaqEntry(
+            "TV services",
+            "https://telecom.kz/en/common/tvplus",
+            "tv television channels plan plans tariff",
+        ),
+        FaqEntry(
+            "Phone / mobile",
+            "https://telecom.kz/en/common/mobsvyaz-altel",
+            "phone mobile cellular altel plan plans tariff",
+        ),
+    ],
+}
+
+
+def render_faq(lang: str, entries: list[FaqEntry]) -> str:
+    lines = [FAQ_HEADERS[lang]]
+    for number, entry in enumerate(entries, start=1):
+        answer = "\n".join(f"  {line}" for line in entry.answer.split("\n"))
+        lines.append(f"{number}) {entry.question}\n{answer}\n\n")
+    return "".join(lines).rstrip() + "\n"
+
+
+def build_full_prompt(lang: str) -> str:
+    """Prefix plus all reference and FAQ entries — the same content as the old monolithic prompt."""
+    return PROMPT_PREFIXES[lang] + "\n\n" + render_faq(lang, REFERENCE_ENTRIES[lang] + FAQ_ENTRIES[lang])
+
+
+_RELATIVE_SCORE_CUTOFF = 0.4
+# Reference entries are one-liners (a link, the contacts); the best match is enough.
+_REFERENCE_TOP_K = 1
+
+_indexes: dict[str, BM25Index] = {
+    lang: BM25Index([f"{e.question} {e.keywords} {e.answer}" for e in entries])
+    for lang, entries in FAQ_ENTRIES.items()
+}
+# Links would only add noise tokens to the ranking, so answers are not indexed.
+_reference_indexes: dict[str, BM25Index] = {
+    lang: BM25Index([f"{e.question} {e.keywords}" for e in entries])
+    for lang, entries in REFERENCE_ENTRIES.items()
+}
+
+
+def find_faq(lang: str, question: str, top_k: int = PROMPT_FAQ_TOP_K) -> list[tuple[FaqEntry, float]]:
+    """Return up to `top_k` FAQ entries of `lang` relevant to `question`, best first, with BM25 scores."""
+    entries = FAQ_ENTRIES[lang]
+    return [(entries[i], score) for i, score in _indexes[lang].search(question, top_k)]
+
+
+def find_reference(lang: str, question: str, top_k: int = _REFERENCE_TOP_K) -> list[tuple[FaqEntry, float]]:
+    """Return up to `top_k` reference entries (links, contacts) of `lang` relevant to `question`."""
+    entries = REFERENCE_ENTRIES[lang]
+    return [(entries[i], score) for i, score in _reference_indexes[lang].search(question, top_k)]
+
+
+def build_messages(
+    lang: str,
+    question: str,
+    history: list[dict[str, str]] | None = None,
+    mode: str = PROMPT_MODE,
+) -> list[dict[str, str]]:
+    """
+    Assemble the chat messages for a question.
+
+    :param lang: Conversation language
+    :param question: User question
+    :param history: Earlier messages of the conversation (see memory.py), placed before the question
+    :param mode: "retrieval" or "full", see module docstring
+    :return: Messages for chat.completions.create
+    """
+    history = history or []
+    if mode == "full":
+        return [
+            {"role": "system", "content": build_full_prompt(lang)},
+            *history,
+            {"role": "user", "content": question},
+        ]
+
+    # Follow-ups ("and how much is it?") rarely name the topic, so the previous question helps retrieval.
+    previous = next((m["content"] for m in reversed(history) if m["role"] == "user"), "")
+    messages = [{"role": "system", "content": PROMPT_PREFIXES[lang]}]
+    found = find_faq(lang, question) or (find_faq(lang, f"{previous} {question}") if previous else [])
+    entries = []
+    if found:
+        # Entries far below the best match are almost always noise.
+        best = found[0][1]
+        entries = [entry for entry, score in found if score >= best * _RELATIVE_SCORE_CUTOFF]
+    entries += [entry for entry, _ in find_reference(lang, question)]
+    if entries:
+        messages.append({"role": "system", "content": render_faq(lang, entries)})
+    messages.extend(history)
+    messages.append({"role": "user", "content": question})
+    return messages
@@ -0,0 +1,72 @@
+"""
+Small in-process lexical index (Okapi BM25).
+
+Meant for tens to hundreds of short documents (FAQ entries), so it is kept
+deliberately simple: documents are tokenized once at build time into term
+frequency dicts, and a query is scored against every document.
+
+Tokenization:
+- NFKC + case folding, words of letters/digits.
+- Words are cut to their first STEM_LENGTH characters. This is a crude but
+  language-agnostic stemmer that works well enough for Russian and Kazakh
+  inflection ("пароль", "пароля", "паролем" → "парол").
+"""
+
+import math
+import re
+import unicodedata
+from collections import Counter
+
+STEM_LENGTH = 5
+
+_WORD_RE = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> list[str]:
+    text = unicodedata.normalize("NFKC", text).casefold().replace("ё", "е")
+    return [word[:STEM_LENGTH] for word in _WORD_RE.findall(text) if len(word) > 1 or word.isdigit()]
+
+
+class BM25Index:
+    def __init__(self, documents: list[str], k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._docs = [Counter(tokenize(doc)) for doc in documents]
+        self._lengths = [sum(doc.values()) for doc in self._docs]
+        self._avg_length = (sum(self._lengths) / len(self._lengths)) if self._lengths else 0.0
+
+        df: Counter = Counter()
+        for doc in self._docs:
+            df.update(doc.keys())
+        n = len(self._docs)
+        self._idf = {term: math.log(1 + (n - freq + 0.5) / (freq + 0.5)) for term, freq in df.items()}
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    def score(self, query: str) -> list[float]:
+        """Return the BM25 score of every document for `query`."""
+        terms = [t for t in tokenize(query) if t in self._idf]
+        scores = [0.0] * len(self._docs)
+        if not terms:
+            return scores
+        for i, doc in enumerate(self._docs):
+            norm = self.k1 * (1 - self.b + self.b * self._lengths[i] / self._avg_length)
+            total = 0.0
+            for term in terms:
+                tf = doc.get(term)
+                if tf:
+                    total += self._idf[term] * tf * (self.k1 + 1) / (tf + norm)
+            scores[i] = total
+        return scores
+
+    def search(self, query: str, k: int) -> list[tuple[int, float]]:
+        """
+        Return the `k` best matching documents.
+
+        :param query: Free-text query
+        :param k: Maximum number of results
+        :return: (document index, score) pairs, best first; documents scoring 0 are omitted
+        """
+        ranked = sorted(enumerate(self.score(query)), key=lambda item: item[1], reverse=True)
+        return [(i, s) for i, s in ranked[:k] if s > 0]
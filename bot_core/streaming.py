@@ -0,0 +1,143 @@
+"""
+Progressive delivery of streamed answers through message edits.
+
+Flow:
+- `start()` posts a placeholder message right away.
+- `feed()` receives completion tokens. It only updates the in-memory text;
+  a background editor task pushes the current text with
+  `edit_message_text` at most once per STREAM_EDIT_INTERVAL_SECONDS.
+- `finish()` stops the editor and performs the final edit with Markdown
+  (falling back to plain text if Telegram cannot parse it). If the
+  placeholder cannot be edited at all (deleted, network error), the answer
+  is sent as a new message instead, so it is never lost.
+- The time from creating the reply to the first edit that shows answer
+  text is observed as the `first_visible_token` stage of
+  `bot_stage_seconds`.
+
+Rate limits:
+- Intermediate edits are sent as plain text, so half-written Markdown never
+  produces "can't parse entities" errors.
+- On TelegramRetryAfter the editor pauses for `retry_after` seconds; edits
+  in between are merged, not queued.
+- A failed intermediate edit is logged and skipped; the editor keeps
+  running and only the final edit decides what the user sees.
+"""
+
+import asyncio
+import logging
+import time
+
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
+from aiogram.types import Message
+
+from .conf import STREAM_EDIT_INTERVAL_SECONDS, STREAM_PLACEHOLDER
+from .markdown import IncrementalMarkdownCleaner
+from .metrics import current_lang, registry
+
+logger = logging.getLogger("bot.streaming")
+
+TELEGRAM_MESSAGE_LIMIT = 4096
+
+
+class ProgressiveReply:
+    def __init__(
+        self,
+        message: Message,
+        reply_markup=None,
+        edit_interval: float = STREAM_EDIT_INTERVAL_SECONDS,
+    ):
+        self.message = message
+        self.reply_markup = reply_markup
+        self.edit_interval = edit_interval
+        self.placeholder: Message | None = None
+        self.created_at = time.monotonic()
+        self.first_visible_at: float | None = None
+
+        self._cleaner = IncrementalMarkdownCleaner()
+        self._raw: list[str] = []
+        self._shown = ""
+        self._dirty = asyncio.Event()
+        self._editor: asyncio.Task | None = None
+
+    @property
+    def started(self) -> bool:
+        return self.placeholder is not None
+
+    @property
+    def text(self) -> str:
+        return "".join(self._raw)
+
+    async def start(self) -> None:
+        self.placeholder = await self.message.answer(STREAM_PLACEHOLDER, reply_markup=self.reply_markup)
+        self._editor = asyncio.create_task(self._edit_loop())
+
+    def feed(self, delta: str) -> None:
+        if not delta:
+            return
+        self._raw.append(delta)
+        self._cleaner.feed(delta)
+        self._dirty.set()
+
+    async def finish(self, final_text: str) -> None:
+        """
+        Stop intermediate edits and replace the placeholder with the final answer.
+
+        :param final_text: Fully cleaned answer text
+        """
+        if self._editor is not None:
+            self._editor.cancel()
+            # How the editor ended does not matter here; the final edit replaces its work.
+            await asyncio.gather(self._editor, return_exceptions=True)
+            self._editor = None
+
+        final_text = final_text[:TELEGRAM_MESSAGE_LIMIT]
+        try:
+            await self._edit_final(final_text)
+        except Exception:
+            logger.exception("Не удалось отредактировать сообщение, ответ отправлен новым сообщением")
+            await self.message.answer(final_text, reply_markup=self.reply_markup)
+
+    async def _edit_final(self, text: str) -> None:
+        try:
+            await self.placeholder.edit_text(text, parse_mode="Markdown")
+        except TelegramRetryAfter as e:
+            await asyncio.sleep(e.retry_after)
+            await self._edit_plain(text)
+        except TelegramBadRequest as e:
+            if "not modified" not in str(e):
+                await self._edit_plain(text)
+
+    async def _edit_plain(self, text: str) -> None:
+        try:
+            await self.placeholder.edit_text(text)
+        except TelegramBadRequest as e:
+            if "not modified" not in str(e):
+                raise
+
+    async def _edit_loop(self) -> None:
+        while True:
+            await self._dirty.wait()
+            self._dirty.clear()
+
+            text = self._cleaner.text[:TELEGRAM_MESSAGE_LIMIT]
+            if text and text != self._shown:
+                try:
+                    await self._edit_plain(text)
+                    self._shown = text
+                    if self.first_visible_at is None:
+                        self.first_visible_at = time.monotonic()
+                        registry.observe(
+                            "stage_seconds",
+                            self.first_visible_at - self.created_at,
+                            stage="first_visible_token",
+                            lang=current_lang.get(),
+                        )
+                except TelegramRetryAfter as e:
+                    logger.debug("Edit throttled by Telegram for %ss", e.retry_after)
+                    self._dirty.set()
+                    await asyncio.sleep(e.retry_after)
+                    continue
+                except Exception:
+                    logger.exception("Не удалось обновить сообщение при стриминге")
+
+            await asyncio.sleep(self.edit_interval)
@@ -0,0 +1,183 @@
+"""
+Speech-to-text for Telegram voice notes.
+
+Input modes (STT_INPUT_MODE):
+- "direct": the OGG/Opus bytes downloaded from Telegram are uploaded to
+  Whisper unchanged. No ffmpeg process is spawned and the upload is several
+  times smaller than the equivalent WAV. If the API rejects the file
+  (HTTP 400), the note is transcoded to 16 kHz mono WAV and sent again.
+- "wav": always transcode to WAV first (previous behaviour).
+
+Silence trimming (STT_VAD, off by default since it costs an ffmpeg decode
+per note, which the direct upload exists to avoid):
+- The note is decoded to 16 kHz PCM and passed through the energy VAD
+  (vad.py). Silent notes are rejected without calling the API.
+- If trimming saves at least VAD_MIN_SAVED_SECONDS, the trimmed audio is
+  uploaded as WAV (Whisper bills and takes time by duration); otherwise
+  the original note goes through the input mode above.
+- Seconds saved per note are observed in the `stt_saved_seconds` metric.
+
+Long notes (longer than STT_CHUNK_MAX_SECONDS, after trimming):
+- The audio is split at the quietest points into parts of
+  STT_CHUNK_SECONDS..STT_CHUNK_MAX_SECONDS (vad.split_at_silence).
+- Parts are transcribed concurrently, at most STT_CHUNK_PARALLEL per note
+  (and within the global "stt" resource limit), and the transcripts are
+  joined in order. A 3-minute note then waits for the slowest ~45 s part
+  instead of the whole recording.
+
+Counters:
+- Every transcription updates module-level counters (see `get_stt_stats`),
+  so the fallback rate and the bytes saved by skipping the transcode can
+  be measured in production.
+"""
+
+import asyncio
+import logging
+import threading
+
+from openai import AsyncOpenAI, BadRequestError
+
+from . import audio
+from .admission import resource_slot
+from .conf import (
+    STT_INPUT_MODE,
+    STT_MODEL,
+    OPENAI_STT_TIMEOUT,
+    STT_VAD,
+    VAD_MIN_SAVED_SECONDS,
+    STT_CHUNK_MAX_SECONDS,
+    STT_CHUNK_PARALLEL,
+)
+from .metrics import current_lang, registry, span
+from .vad import split_at_silence, trim_silence
+
+logger = logging.getLogger("bot.stt")
+
+# 16 kHz, mono, 16-bit PCM
+_WAV_BYTES_PER_SECOND = 16000 * 2
+
+_stats = {
+    "direct_ok": 0,
+    "direct_fallback": 0,
+    "wav": 0,
+    "uploaded_bytes": 0,
+    "saved_bytes": 0,
+    "vad_rejected": 0,
+    "vad_trimmed": 0,
+    "chunked": 0,
+    "chunks": 0,
+}
+_stats_lock = threading.Lock()
+
+
+def _count(**deltas: int) -> None:
+    with _stats_lock:
+        for key, value in deltas.items():
+            _stats[key] += value
+
+
+def get_stt_stats() -> dict[str, int]:
+    """Return a snapshot of the transcription counters."""
+    with _stats_lock:
+        return dict(_stats)
+
+
+def _record_saved(seconds: float) -> None:
+    registry.observe("stt_saved_seconds", seconds, lang=current_lang.get())
+    registry.add("stt_saved_seconds_total", seconds)
+
+
+async def _transcribe_upload(client: AsyncOpenAI, filename: str, data: bytes) -> str:
+    async with resource_slot("stt"):
+        with span("stt_request"):
+            resp = await client.audio.transcriptions.create(
+                file=(filename, data),
+                model=STT_MODEL,
+                timeout=OPENAI_STT_TIMEOUT,
+            )
+    return resp.text or ""
+
+
+async def _transcribe_pcm(client: AsyncOpenAI, pcm: bytes) -> str:
+    parts = split_at_silence(pcm)
+    if len(parts) == 1:
+        wav_bytes = audio.pcm16k_to_wav(pcm)
+        text = await _transcribe_upload(client, "voice.wav", wav_bytes)
+        _count(wav=1, uploaded_bytes=len(wav_bytes))
+        return text
+
+    semaphore = asyncio.Semaphore(STT_CHUNK_PARALLEL)
+
+    async def _one(part: bytes) -> str:
+        async with semaphore:
+            wav_bytes = audio.pcm16k_to_wav(part)
+            text = await _transcribe_upload(client, "voice.wav", wav_bytes)
+        _count(wav=1, uploaded_bytes=len(wav_bytes))
+        return text.strip()
+
+    tasks = [asyncio.create_task(_one(part)) for part in parts]
+    try:
+        texts = [await task for task in tasks]
+    finally:
+        for task in tasks:
+            task.cancel()
+    _count(chunked=1, chunks=len(parts))
+    return " ".join(text for text in texts if text)
+
+
+async def transcribe_voice(
+    client: AsyncOpenAI,
+    ogg_bytes: bytes,
+    duration: int | None = None,
+    mode: str = STT_INPUT_MODE,
+    vad: bool = STT_VAD,
+) -> str:
+    """
+    Transcribe a Telegram voice note.
+
+    :param client: OpenAI client
+    :param ogg_bytes: Voice note as downloaded from Telegram (OGG/Opus)
+    :param duration: Voice note duration in seconds; long notes are chunked even without VAD
+    :param mode: "direct" or "wav", see module docstring
+    :param vad: Trim silence first, see module docstring
+    :return: Transcript text (may be empty; always empty for silent notes)
+    """
+    long_note = (duration or 0) > STT_CHUNK_MAX_SECONDS
+    if vad or long_note:
+        pcm = await audio.ogg_to_pcm16k(ogg_bytes)
+        if vad:
+            with span("vad"):
+                result = trim_silence(pcm)
+
+            if result.silent:
+                _record_saved(result.input_seconds)
+                _count(vad_rejected=1)
+                return ""
+            if (
+                result.saved_seconds >= VAD_MIN_SAVED_SECONDS
+                or result.output_seconds > STT_CHUNK_MAX_SECONDS
+                or mode == "wav"
+            ):
+                _record_saved(result.saved_seconds)
+                _count(vad_trimmed=1)
+                pcm = result.pcm
+            else:
+                _record_saved(0.0)
+                pcm = b""
+        if pcm:
+            return await _transcribe_pcm(client, pcm)
+
+    if mode == "direct":
+        try:
+            text = await _transcribe_upload(client, "voice.ogg", ogg_bytes)
+            saved = max(0, duration * _WAV_BYTES_PER_SECOND - len(ogg_bytes)) if duration else 0
+            _count(direct_ok=1, uploaded_bytes=len(ogg_bytes), saved_bytes=saved)
+            return text
+        except BadRequestError as e:
+            logger.warning("Whisper отклонил OGG, перекодируем в WAV: %s", e)
+            _count(direct_fallback=1, uploaded_bytes=len(ogg_bytes))
+
+    wav_bytes = await audio.ogg_to_wav(ogg_bytes)
+    text = await _transcribe_upload(client, "voice.wav", wav_bytes)
+    _count(wav=1, uploaded_bytes=len(wav_bytes))
+    return text
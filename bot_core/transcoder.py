@@ -0,0 +1,235 @@
+"""
+Bounded transcoding executor with pre-spawned ("warm") ffmpeg processes.
+
+Concurrency:
+- At most TRANSCODE_MAX_CONCURRENCY jobs run at once; further jobs wait
+  in FIFO order. Queue depth, wait time and execution time are tracked
+  (constant-memory histograms).
+- Every job is bounded by TRANSCODE_TIMEOUT_SECONDS; on timeout the
+  ffmpeg process is killed and asyncio.TimeoutError is raised.
+- A job is submitted with its complete input, so a slot and its timeout
+  only cover ffmpeg's own work, never waiting on the network.
+
+Warm pool:
+- ffmpeg handles a single stream per process, so a process cannot be
+  reused across jobs. Instead, TRANSCODE_WARM_PER_PROFILE processes per
+  profile are spawned ahead of time with their full command line and left
+  blocked on stdin. A job takes one and only has to write its input, which
+  removes fork/exec and ffmpeg start-up from the request path. The pool is
+  refilled in the background; idle processes older than
+  TRANSCODE_WARM_MAX_AGE_SECONDS are recycled by a periodic sweep, even
+  when no job comes along to take them.
+"""
+
+import asyncio
+import logging
+import subprocess
+import time
+from collections import deque
+from typing import Coroutine
+
+from .conf import (
+    TRANSCODE_MAX_CONCURRENCY,
+    TRANSCODE_TIMEOUT_SECONDS,
+    TRANSCODE_WARM_PER_PROFILE,
+    TRANSCODE_WARM_MAX_AGE_SECONDS,
+)
+from .metrics import Histogram, span
+
+logger = logging.getLogger("bot.transcoder")
+
+
+class TranscodeExecutor:
+    def __init__(
+        self,
+        profiles: dict[str, list[str]],
+        max_concurrency: int = TRANSCODE_MAX_CONCURRENCY,
+        timeout: float = TRANSCODE_TIMEOUT_SECONDS,
+        warm_per_profile: int = TRANSCODE_WARM_PER_PROFILE,
+        warm_max_age: float = TRANSCODE_WARM_MAX_AGE_SECONDS,
+    ):
+        """
+        :param profiles: Profile name → full ffmpeg command reading stdin and writing stdout
+        """
+        self.profiles = profiles
+        self.timeout = timeout
+        self.warm_per_profile = warm_per_profile
+        self.warm_max_age = warm_max_age
+
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._warm: dict[str, deque[tuple[float, asyncio.subprocess.Process]]] = {
+            name: deque() for name in profiles
+        }
+        self._refilling: set[str] = set()
+        self._tasks: set[asyncio.Task] = set()
+        self._sweeper: asyncio.Task | None = None
+        self._closed = False
+
+        self.waiting = 0
+        self.running = 0
+        self.completed = 0
+        self.failed = 0
+        self.timeouts = 0
+        self.warm_hits = 0
+        self.cold_starts = 0
+        self.wait_seconds = Histogram()
+        self.exec_seconds = Histogram()
+
+    async def start(self) -> None:
+        """Fill the warm pool for every profile."""
+        self._closed = False
+        await asyncio.gather(*(self._refill(name) for name in self.profiles))
+        if self.warm_per_profile > 0 and self._sweeper is None:
+            self._sweeper = asyncio.create_task(self._sweep_loop())
+
+    async def close(self) -> None:
+        self._closed = True
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            self._sweeper = None
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        for pool in self._warm.values():
+            while pool:
+                _, proc = pool.popleft()
+                await self._kill(proc)
+
+    async def run(self, profile: str, data: bytes, timeout: float | None = None) -> bytes:
+        """
+        Transcode `data` with the given profile.
+
+        :param profile: Profile name
+        :param data: Input bytes written to ffmpeg's stdin
+        :param timeout: Overrides TRANSCODE_TIMEOUT_SECONDS for this job
+        :return: ffmpeg stdout
+        """
+        async def _job(proc: asyncio.subprocess.Process) -> tuple[bytes, bytes]:
+            return await proc.communicate(data)
+
+        return await self._execute(profile, _job, timeout)
+
+    def stats(self) -> dict[str, float]:
+        return {
+            "queue_depth": self.waiting,
+            "running": self.running,
+            "completed": self.completed,
+            "failed": self.failed,
+            "timeouts": self.timeouts,
+            "warm_hits": self.warm_hits,
+            "cold_starts": self.cold_starts,
+            "warm_idle": sum(len(pool) for pool in self._warm.values()),
+        }
+
+    async def _execute(self, profile: str, job, timeout: float | None) -> bytes:
+        cmd = self.profiles[profile]
+        queued_at = time.monotonic()
+        self.waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+
+        self.running += 1
+        try:
+            started = time.monotonic()
+            self.wait_seconds.observe(started - queued_at)
+
+            proc = self._take_warm(profile)
+            if proc is None:
+                self.cold_starts += 1
+                proc = await self._spawn(cmd)
+            else:
+                self.warm_hits += 1
+            self._schedule_refill(profile)
+
+            try:
+                with span(f"ffmpeg_{profile}"):
+                    stdout, stderr = await asyncio.wait_for(job(proc), timeout or self.timeout)
+            except asyncio.TimeoutError:
+                self.timeouts += 1
+                self.failed += 1
+                await self._kill(proc)
+                logger.error("ffmpeg (%s) превысил таймаут и был остановлен", profile)
+                raise
+            except BaseException:
+                self.failed += 1
+                await self._kill(proc)
+                raise
+
+            self.exec_seconds.observe(time.monotonic() - started)
+            if proc.returncode != 0:
+                self.failed += 1
+                raise subprocess.CalledProcessError(proc.returncode, cmd, output=stdout, stderr=stderr)
+            self.completed += 1
+            return stdout
+        finally:
+            self.running -= 1
+            self._semaphore.release()
+
+    def _take_warm(self, profile: str) -> asyncio.subprocess.Process | None:
+        pool = self._warm[profile]
+        now = time.monotonic()
+        while pool:
+            spawned_at, proc = pool.popleft()
+            if proc.returncode is None and now - spawned_at < self.warm_max_age:
+                return proc
+            self._background(self._kill(proc))
+        return None
+
+    def _schedule_refill(self, profile: str) -> None:
+        if self.warm_per_profile > 0 and profile not in self._refilling and not self._closed:
+            self._background(self._refill(profile))
+
+    def _background(self, coro: Coroutine) -> None:
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._task_done)
+
+    def _task_done(self, task: asyncio.Task) -> None:
+        self._tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error("Фоновая задача пула ffmpeg завершилась с ошибкой", exc_info=task.exception())
+
+    async def _sweep_loop(self) -> None:
+        interval = max(1.0, self.warm_max_age / 4)
+        while True:
+            await asyncio.sleep(interval)
+            now = time.monotonic()
+            for profile, pool in self._warm.items():
+                expired = [item for item in pool if item[1].returncode is not None or now - item[0] >= self.warm_max_age]
+                for item in expired:
+                    pool.remove(item)
+                    self._background(self._kill(item[1]))
+                if expired:
+                    self._schedule_refill(profile)
+
+    async def _refill(self, profile: str) -> None:
+        self._refilling.add(profile)
+        try:
+            pool = self._warm[profile]
+            while len(pool) < self.warm_per_profile and not self._closed:
+                proc = await self._spawn(self.profiles[profile])
+                pool.append((time.monotonic(), proc))
+        except Exception:
+            logger.exception("Не удалось запустить ffmpeg для пула (%s)", profile)
+        finally:
+            self._refilling.discard(profile)
+
+    @staticmethod
+    async def _spawn(cmd: list[str]) -> asyncio.subprocess.Process:
+        return await asyncio.create_subprocess_exec(
+            *cmd,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+        )
+
+    @staticmethod
+    async def _kill(proc: asyncio.subprocess.Process) -> None:
+        if proc.returncode is None:
+            try:
+                proc.kill()
+            except ProcessLookupError:
+                pass
+        await proc.wait()
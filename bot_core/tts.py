@@ -0,0 +1,109 @@
+"""
+Text-to-speech for voice replies.
+
+Pipelined mode (TTS_PIPELINE):
+- The answer is split at sentence boundaries into parts of up to
+  TTS_CHUNK_CHARS characters.
+- Parts are synthesized concurrently as raw 24 kHz PCM, at most
+  TTS_MAX_PARALLEL requests at a time.
+- The parts are joined in order and encoded by one ffmpeg job into a
+  single OGG/Opus voice note. The job is submitted once synthesis has
+  finished, so TTS latency never holds a transcode slot.
+
+Otherwise the whole answer is synthesized as one MP3 and transcoded.
+"""
+
+import asyncio
+import re
+from typing import AsyncIterator
+
+from openai import AsyncOpenAI
+
+from . import audio
+from .admission import resource_slot
+from .conf import TTS_MODEL, OPENAI_TTS_TIMEOUT, TTS_PIPELINE, TTS_CHUNK_CHARS, TTS_MAX_PARALLEL
+from .metrics import registry, span
+
+_SENTENCE_END_RE = re.compile(r"(?<=[.!?…;])\s+|\n+")
+
+
+async def synthesize_speech(client: AsyncOpenAI, text: str, voice: str, response_format: str = "mp3") -> bytes:
+    """
+    Synthesize `text` with OpenAI TTS.
+
+    :param client: OpenAI client
+    :param text: Text to speak
+    :param voice: TTS voice name
+    :param response_format: "mp3", "pcm" (24 kHz s16le mono), "opus", ...
+    :return: Audio bytes
+    """
+    registry.add("tts_characters_total", len(text))
+    async with resource_slot("tts"):
+        with span("tts_request"):
+            resp = await client.audio.speech.create(
+                model=TTS_MODEL,
+                voice=voice,
+                input=text,
+                response_format=response_format,
+                timeout=OPENAI_TTS_TIMEOUT,
+            )
+    return resp.content
+
+
+def split_sentences(text: str, max_chars: int = TTS_CHUNK_CHARS) -> list[str]:
+    """
+    Split text at sentence boundaries and pack sentences into parts of up to `max_chars`.
+
+    A single sentence longer than `max_chars` becomes its own part.
+    """
+    parts: list[str] = []
+    current = ""
+    for sentence in _SENTENCE_END_RE.split(text):
+        sentence = sentence.strip()
+        if not sentence:
+            continue
+        if current and len(current) + 1 + len(sentence) > max_chars:
+            parts.append(current)
+            current = sentence
+        else:
+            current = f"{current} {sentence}" if current else sentence
+    if current:
+        parts.append(current)
+    return parts
+
+
+async def _synthesize_parts_in_order(
+    client: AsyncOpenAI,
+    parts: list[str],
+    voice: str,
+) -> AsyncIterator[bytes]:
+    semaphore = asyncio.Semaphore(TTS_MAX_PARALLEL)
+
+    async def _one(part: str) -> bytes:
+        async with semaphore:
+            return await synthesize_speech(client, part, voice, response_format="pcm")
+
+    tasks = [asyncio.create_task(_one(part)) for part in parts]
+    try:
+        for task in tasks:
+            yield await task
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def synthesize_voice_note(client: AsyncOpenAI, text: str, voice: str) -> bytes:
+    """
+    Synthesize `text` into a Telegram-ready OGG/Opus voice note.
+
+    :param client: OpenAI client
+    :param text: Answer text
+    :param voice: TTS voice name
+    :return: OGG/Opus bytes
+    """
+    parts = split_sentences(text) if TTS_PIPELINE else []
+    if len(parts) <= 1:
+        mp3_bytes = await synthesize_speech(client, text, voice)
+        return await audio.mp3_to_oggopus(mp3_bytes)
+
+    return await audio.pcm_parts_to_oggopus(_synthesize_parts_in_order(client, parts, voice))
@@ -0,0 +1,153 @@
+"""
+Content-addressed cache for synthesized voice replies.
+
+Key:
+- sha256 of (normalized text, voice, lang). Normalization is NFKC plus
+  whitespace collapsing, so answers that differ only in formatting share
+  one entry.
+
+Storage:
+- `<key>.oga` holds the encoded OGG/Opus voice note.
+- `<key>.fid` holds the Telegram `file_id` of that note once it has been
+  uploaded. Repeat answers are then sent by file_id: no TTS, no ffmpeg,
+  no upload.
+- The index (key → size, file_id) lives in memory and is rebuilt from the
+  directory on startup, ordered by mtime.
+
+Eviction:
+- LRU by total size. When TTS_CACHE_MAX_BYTES is exceeded the least
+  recently used entries are removed from disk.
+"""
+
+import asyncio
+import hashlib
+import logging
+import os
+import re
+import unicodedata
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+
+from .conf import TTS_CACHE_DIR, TTS_CACHE_MAX_BYTES
+
+logger = logging.getLogger("bot.tts_cache")
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+@dataclass(slots=True)
+class TTSCacheEntry:
+    size: int
+    file_id: str | None = None
+
+
+def normalize_text(text: str) -> str:
+    return _WHITESPACE_RE.sub(" ", unicodedata.normalize("NFKC", text)).strip()
+
+
+def make_key(text: str, voice: str, lang: str) -> str:
+    raw = "\0".join((normalize_text(text), voice, lang))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class TTSCache:
+    def __init__(self, directory: str = TTS_CACHE_DIR, max_bytes: int = TTS_CACHE_MAX_BYTES):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self._index: OrderedDict[str, TTSCacheEntry] = OrderedDict()
+        self._total_bytes = 0
+
+    async def open(self) -> None:
+        await asyncio.to_thread(self._load_index)
+        logger.info("TTS cache: %d entries, %d bytes", len(self._index), self._total_bytes)
+
+    def get(self, key: str) -> TTSCacheEntry | None:
+        """Return the index entry for `key` and mark it as recently used."""
+        entry = self._index.get(key)
+        if entry is None:
+            return None
+        self._index.move_to_end(key)
+        asyncio.get_running_loop().run_in_executor(None, self._touch, key)
+        return entry
+
+    async def read_audio(self, key: str) -> bytes | None:
+        try:
+            return await asyncio.to_thread(self._path(key, ".oga").read_bytes)
+        except FileNotFoundError:
+            self._drop(key)
+            return None
+
+    async def put(self, key: str, data: bytes) -> None:
+        """
+        Store an encoded voice note and evict old entries if over budget.
+
+        :param key: Cache key from make_key()
+        :param data: OGG/Opus bytes
+        """
+        await asyncio.to_thread(self._write, key, data)
+        old = self._index.pop(key, None)
+        if old is not None:
+            self._total_bytes -= old.size
+        self._index[key] = TTSCacheEntry(size=len(data))
+        self._total_bytes += len(data)
+
+        evicted = []
+        while self._total_bytes > self.max_bytes and len(self._index) > 1:
+            old_key, old_entry = self._index.popitem(last=False)
+            self._total_bytes -= old_entry.size
+            evicted.append(old_key)
+        if evicted:
+            await asyncio.to_thread(self._unlink_many, evicted)
+
+    async def set_file_id(self, key: str, file_id: str | None) -> None:
+        """Remember (or forget, with None) the Telegram file_id of a cached note."""
+        entry = self._index.get(key)
+        if entry is None or entry.file_id == file_id:
+            return
+        entry.file_id = file_id
+        path = self._path(key, ".fid")
+        if file_id:
+            await asyncio.to_thread(path.write_text, file_id, "utf-8")
+        else:
+            await asyncio.to_thread(path.unlink, True)
+
+    def stats(self) -> dict[str, int]:
+        return {"entries": len(self._index), "bytes": self._total_bytes}
+
+    def _path(self, key: str, suffix: str) -> Path:
+        return self.directory / f"{key}{suffix}"
+
+    def _load_index(self) -> None:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        items = []
+        for path in self.directory.glob("*.oga"):
+            st = path.stat()
+            fid_path = path.with_suffix(".fid")
+            file_id = fid_path.read_text("utf-8").strip() if fid_path.exists() else None
+            items.append((st.st_mtime, path.stem, TTSCacheEntry(size=st.st_size, file_id=file_id or None)))
+        for _, key, entry in sorted(items):
+            self._index[key] = entry
+            self._total_bytes += entry.size
+
+    def _write(self, key: str, data: bytes) -> None:
+        path = self._path(key, ".oga")
+        tmp_path = path.with_suffix(".tmp")
+        tmp_path.write_bytes(data)
+        os.replace(tmp_path, path)
+
+    def _touch(self, key: str) -> None:
+        try:
+            os.utime(self._path(key, ".oga"))
+        except FileNotFoundError:
+            pass
+
+    def _drop(self, key: str) -> None:
+        entry = self._index.pop(key, None)
+        if entry is not None:
+            self._total_bytes -= entry.size
+
+    def _unlink_many(self, keys: list[str]) -> None:
+        for key in keys:
+            for suffix in (".oga", ".fid"):
+                self._path(key, suffix).unlink(missing_ok=True)
@@ -0,0 +1,270 @@
+"""
+Persistent user profile store for the Telegram bot (LRU + SQLite, write-behind).
+
+Layout:
+- Hot profiles live in a bounded in-memory LRU (OrderedDict), so the common
+  path (`/help`, `/socials`, every message) never touches the disk.
+- A miss falls through to the backend in a worker thread, so the event loop
+  is never blocked by SQLite I/O.
+- Users without a profile are cached too (negative entries), otherwise every
+  message from a user who has not picked a language would hit the backend.
+
+Write-behind:
+- `update_profile` only touches memory and marks the user dirty.
+- A background task flushes dirty profiles in batches (one transaction per
+  batch) every USER_FLUSH_INTERVAL_SECONDS, or earlier once
+  USER_FLUSH_BATCH_SIZE users are pending.
+- Dirty profiles are kept outside the LRU until flushed, so eviction never
+  loses a write. `close()` performs a final flush.
+
+Schema:
+- Columns added after the first release are created on open
+  (`_MIGRATIONS`), so existing databases upgrade in place.
+
+Multiple processes:
+- The SQLite file runs in WAL mode, so several bot processes can share it.
+  Each process keeps its own LRU; updates for one user must be routed to the
+  same process (see webhook mode) for the caches to stay coherent.
+"""
+
+import asyncio
+import logging
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from dataclasses import dataclass, replace
+from pathlib import Path
+
+from .conf import (
+    USER_STORE_PATH,
+    USER_CACHE_SIZE,
+    USER_FLUSH_INTERVAL_SECONDS,
+    USER_FLUSH_BATCH_SIZE,
+)
+
+logger = logging.getLogger("bot.user_store")
+
+_MISSING = object()
+
+
+@dataclass(slots=True, frozen=True)
+class UserProfile:
+    lang: str
+    # Voice reply mode chosen with /voice; None means the global VOICE_REPLY_MODE.
+    voice_mode: str | None = None
+
+
+class ProfileBackend(ABC):
+    """Durable storage behind the in-memory LRU. Methods are called from worker threads."""
+
+    def open(self) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+    @abstractmethod
+    def load(self, user_id: int) -> UserProfile | None:
+        ...
+
+    @abstractmethod
+    def save_many(self, profiles: dict[int, UserProfile]) -> None:
+        ...
+
+
+# Column name → definition, applied in order to tables created by older versions.
+_MIGRATIONS: dict[str, str] = {
+    "voice_mode": "TEXT",
+}
+
+
+class SQLiteProfileBackend(ProfileBackend):
+    def __init__(self, path: str = USER_STORE_PATH):
+        self.path = path
+        self._conn: sqlite3.Connection | None = None
+        self._lock = threading.Lock()
+
+    def open(self) -> None:
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS user_profiles ("
+            "user_id INTEGER PRIMARY KEY, "
+            "lang TEXT NOT NULL, "
+            "updated_at REAL NOT NULL)"
+        )
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(user_profiles)")}
+        for name, definition in _MIGRATIONS.items():
+            if name not in columns:
+                conn.execute(f"ALTER TABLE user_profiles ADD COLUMN {name} {definition}")
+        self._conn = conn
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def load(self, user_id: int) -> UserProfile | None:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT lang, voice_mode FROM user_profiles WHERE user_id = ?", (user_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        return UserProfile(lang=row[0], voice_mode=row[1])
+
+    def save_many(self, profiles: dict[int, UserProfile]) -> None:
+        now = time.time()
+        rows = [(user_id, p.lang, p.voice_mode, now) for user_id, p in profiles.items()]
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany(
+                    "INSERT INTO user_profiles (user_id, lang, voice_mode, updated_at) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT(user_id) DO UPDATE SET lang = excluded.lang, voice_mode = excluded.voice_mode, "
+                    "updated_at = excluded.updated_at",
+                    rows,
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+
+class UserProfileStore:
+    def __init__(
+        self,
+        backend: ProfileBackend | None = None,
+        cache_size: int = USER_CACHE_SIZE,
+        flush_interval: float = USER_FLUSH_INTERVAL_SECONDS,
+        flush_batch_size: int = USER_FLUSH_BATCH_SIZE,
+    ):
+        self.backend = backend or SQLiteProfileBackend()
+        self.cache_size = cache_size
+        self.flush_interval = flush_interval
+        self.flush_batch_size = flush_batch_size
+
+        # user_id → UserProfile | None (None = known to have no profile)
+        self._lru: OrderedDict[int, UserProfile | None] = OrderedDict()
+        self._dirty: dict[int, UserProfile] = {}
+        self._flushing: dict[int, UserProfile] = {}
+        self._flush_event = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._flusher: asyncio.Task | None = None
+
+    async def open(self) -> None:
+        await asyncio.to_thread(self.backend.open)
+        self._flusher = asyncio.create_task(self._flush_loop())
+
+    async def close(self) -> None:
+        if self._flusher is not None:
+            self._flusher.cancel()
+            try:
+                await self._flusher
+            except asyncio.CancelledError:
+                pass
+            self._flusher = None
+        await self.flush()
+        await asyncio.to_thread(self.backend.close)
+
+    async def get_profile(self, user_id: int) -> UserProfile | None:
+        """
+        Return the profile of a user, loading it from the backend on a cache miss.
+
+        :param user_id: Telegram user id
+        :return: Profile, or None if the user has not set one yet
+        """
+        profile = self._dirty.get(user_id) or self._flushing.get(user_id)
+        if profile is not None:
+            return profile
+
+        profile = self._lru.get(user_id, _MISSING)
+        if profile is not _MISSING:
+            self._lru.move_to_end(user_id)
+            return profile
+
+        profile = await asyncio.to_thread(self.backend.load, user_id)
+        newer = self._dirty.get(user_id) or self._flushing.get(user_id) or self._lru.get(user_id)
+        if newer is not None:
+            # Updated while the backend lookup was in flight.
+            return newer
+        self._remember(user_id, profile)
+        return profile
+
+    async def get_language(self, user_id: int) -> str | None:
+        profile = await self.get_profile(user_id)
+        return profile.lang if profile else None
+
+    async def update_profile(self, user_id: int, **fields) -> UserProfile:
+        """
+        Update profile fields in memory; the change is persisted by the next flush.
+
+        :param user_id: Telegram user id
+        :param fields: UserProfile fields to change
+        :return: The updated profile
+        """
+        current = await self.get_profile(user_id)
+        if current is None:
+            profile = UserProfile(**fields)
+        else:
+            profile = replace(current, **fields)
+
+        self._lru.pop(user_id, None)
+        self._dirty[user_id] = profile
+        if len(self._dirty) >= self.flush_batch_size:
+            self._flush_event.set()
+        return profile
+
+    async def set_language(self, user_id: int, lang: str) -> None:
+        await self.update_profile(user_id, lang=lang)
+
+    async def set_voice_mode(self, user_id: int, voice_mode: str | None) -> None:
+        """Requires an existing profile (the language is chosen first)."""
+        await self.update_profile(user_id, voice_mode=voice_mode)
+
+    async def flush(self) -> None:
+        """Write all dirty profiles to the backend in a single batch."""
+        async with self._flush_lock:
+            if not self._dirty:
+                return
+            batch = self._flushing = self._dirty
+            self._dirty = {}
+            try:
+                await asyncio.to_thread(self.backend.save_many, batch)
+            except Exception:
+                # Keep the batch; newer in-memory updates win over it.
+                self._dirty = {**batch, **self._dirty}
+                raise
+            finally:
+                self._flushing = {}
+            for user_id, profile in batch.items():
+                if user_id not in self._dirty:
+                    self._remember(user_id, profile)
+            logger.debug("Flushed %d user profiles", len(batch))
+
+    def stats(self) -> dict[str, int]:
+        return {"cached": len(self._lru), "dirty": len(self._dirty)}
+
+    def _remember(self, user_id: int, profile: UserProfile | None) -> None:
+        self._lru[user_id] = profile
+        self._lru.move_to_end(user_id)
+        while len(self._lru) > self.cache_size:
+            self._lru.popitem(last=False)
+
+    async def _flush_loop(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._flush_event.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_event.clear()
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("Ошибка сохранения профилей пользователей")
+
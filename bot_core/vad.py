@@ -0,0 +1,155 @@
+"""
+Energy-based voice activity detection on 16 kHz mono s16le PCM (NumPy).
+
+Algorithm:
+- The signal is cut into VAD_FRAME_MS frames and the RMS level of every
+  frame is computed in dBFS in one vectorized pass.
+- A frame is speech if it is louder than the noise floor (10th percentile
+  of frame levels) by VAD_NOISE_MARGIN_DB and louder than VAD_THRESHOLD_DB.
+  The adaptive part copes with noisy rooms, the absolute part with notes
+  that are silent from start to end. A clip whose level barely varies
+  (90th minus 10th percentile below the margin) has no quiet part to take
+  the floor from, so only the absolute threshold is applied to it.
+- Speech regions are widened by VAD_HANGOVER_MS on both sides, so word
+  onsets and soft endings are not clipped.
+- Leading and trailing silence is dropped; pauses inside the speech longer
+  than VAD_MAX_PAUSE_MS are shortened to that length.
+- Clips with less than VAD_MIN_SPEECH_MS of speech are reported as silent.
+
+Chunking (`split_at_silence`): long audio is cut into parts of
+STT_CHUNK_SECONDS..STT_CHUNK_MAX_SECONDS, each cut placed in the quietest
+frame of that window, so words are not split between parts.
+"""
+
+from dataclasses import dataclass
+
+import numpy as np
+
+from .conf import (
+    STT_CHUNK_SECONDS,
+    STT_CHUNK_MAX_SECONDS,
+    VAD_FRAME_MS,
+    VAD_THRESHOLD_DB,
+    VAD_NOISE_MARGIN_DB,
+    VAD_HANGOVER_MS,
+    VAD_MAX_PAUSE_MS,
+    VAD_MIN_SPEECH_MS,
+)
+
+SAMPLE_RATE = 16000
+
+
+@dataclass(frozen=True)
+class VadResult:
+    pcm: bytes
+    input_seconds: float
+    output_seconds: float
+    speech_seconds: float
+
+    @property
+    def silent(self) -> bool:
+        return not self.pcm
+
+    @property
+    def saved_seconds(self) -> float:
+        return self.input_seconds - self.output_seconds
+
+
+def _frame_levels_db(samples: np.ndarray, frame_len: int) -> np.ndarray:
+    frames = samples[: len(samples) // frame_len * frame_len].astype(np.float32).reshape(-1, frame_len)
+    rms = np.sqrt(np.mean(np.square(frames / 32768.0), axis=1))
+    return 20.0 * np.log10(np.maximum(rms, 1e-10))
+
+
+def _runs(mask: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Start and end (exclusive) indices of the runs of True in a boolean array."""
+    edges = np.diff(np.concatenate(([0], mask.astype(np.int8), [0])))
+    return np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+
+
+def trim_silence(
+    pcm: bytes,
+    frame_ms: int = VAD_FRAME_MS,
+    threshold_db: float = VAD_THRESHOLD_DB,
+    noise_margin_db: float = VAD_NOISE_MARGIN_DB,
+    hangover_ms: int = VAD_HANGOVER_MS,
+    max_pause_ms: int = VAD_MAX_PAUSE_MS,
+    min_speech_ms: int = VAD_MIN_SPEECH_MS,
+) -> VadResult:
+    """
+    Remove silence from a voice note.
+
+    :param pcm: 16 kHz mono s16le PCM
+    :return: Trimmed PCM (empty if the clip is silent) and durations
+    """
+    samples = np.frombuffer(pcm, dtype="<i2")
+    input_seconds = len(samples) / SAMPLE_RATE
+    frame_len = SAMPLE_RATE * frame_ms // 1000
+    if len(samples) < frame_len:
+        return VadResult(b"", input_seconds, 0.0, 0.0)
+
+    levels = _frame_levels_db(samples, frame_len)
+    noise_floor, loud = np.percentile(levels, [10, 90])
+    if loud - noise_floor < noise_margin_db:
+        # Steady level from start to end (speech without pauses, a tone): there are
+        # no quiet frames to estimate the noise from, only the absolute threshold applies.
+        speech = levels > threshold_db
+    else:
+        speech = levels > max(threshold_db, noise_floor + noise_margin_db)
+
+    speech_seconds = float(speech.sum()) * frame_ms / 1000
+    if speech_seconds * 1000 < min_speech_ms:
+        return VadResult(b"", input_seconds, 0.0, speech_seconds)
+
+    hangover = max(0, hangover_ms // frame_ms)
+    if hangover:
+        speech = np.convolve(speech.astype(np.int8), np.ones(2 * hangover + 1, dtype=np.int8), mode="same") > 0
+
+    keep = speech.copy()
+    starts, ends = _runs(~speech)
+    max_pause = max_pause_ms // frame_ms
+    head, tail = max_pause // 2, max_pause - max_pause // 2
+    for start, end in zip(starts, ends):
+        if start == 0 or end == len(speech):
+            continue  # leading / trailing silence is dropped entirely
+        if end - start <= max_pause:
+            keep[start:end] = True
+        else:
+            keep[start:start + head] = True
+            keep[end - tail:end] = True
+
+    sample_mask = np.repeat(keep, frame_len)
+    trimmed = samples[: len(sample_mask)][sample_mask]
+    return VadResult(trimmed.tobytes(), input_seconds, len(trimmed) / SAMPLE_RATE, speech_seconds)
+
+
+def split_at_silence(
+    pcm: bytes,
+    min_seconds: float = STT_CHUNK_SECONDS,
+    max_seconds: float = STT_CHUNK_MAX_SECONDS,
+    frame_ms: int = VAD_FRAME_MS,
+) -> list[bytes]:
+    """
+    Split audio into parts at the quietest points.
+
+    :param pcm: 16 kHz mono s16le PCM
+    :param min_seconds: Shortest part (except the last one)
+    :param max_seconds: Longest part
+    :return: Consecutive PCM parts; a single part if the audio is not longer than `max_seconds`
+    """
+    samples = np.frombuffer(pcm, dtype="<i2")
+    frame_len = SAMPLE_RATE * frame_ms // 1000
+    min_frames = max(1, int(min_seconds * 1000 // frame_ms))
+    max_frames = max(min_frames + 1, int(max_seconds * 1000 // frame_ms))
+    if len(samples) <= max_frames * frame_len:
+        return [pcm]
+
+    levels = _frame_levels_db(samples, frame_len)
+    cuts = [0]
+    position = 0  # in frames
+    while (len(samples) - position * frame_len) > max_frames * frame_len:
+        window = levels[position + min_frames:position + max_frames]
+        position += min_frames + int(np.argmin(window))
+        cuts.append(position)
+    bounds = [c * frame_len + (frame_len // 2 if c else 0) for c in cuts] + [len(samples)]
+    return [samples[start:end].tobytes() for start, end in zip(bounds, bounds[1:])]
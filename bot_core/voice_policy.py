@@ -0,0 +1,46 @@
+"""
+Decides whether an answer also gets a voice note.
+
+Modes (global VOICE_REPLY_MODE, overridable per user with /voice):
+- "always": every answer is voiced (original behaviour).
+- "voice_only": only answers to voice messages are voiced.
+- "never": text only.
+
+Independently of the mode, answers longer than VOICE_REPLY_MAX_CHARS are
+sent as text only: long voice notes are rarely listened to and are the
+most expensive to synthesize and encode.
+"""
+
+from .conf import VOICE_REPLY_MODE, VOICE_REPLY_MAX_CHARS
+
+VOICE_MODES: tuple[str, ...] = ("always", "voice_only", "never")
+
+if VOICE_REPLY_MODE not in VOICE_MODES:
+    raise ValueError(f"Unknown VOICE_REPLY_MODE: '{VOICE_REPLY_MODE}'")
+
+
+def effective_mode(user_mode: str | None) -> str:
+    return user_mode if user_mode in VOICE_MODES else VOICE_REPLY_MODE
+
+
+def next_mode(user_mode: str | None) -> str:
+    """The mode `/voice` without arguments switches to (cycles through VOICE_MODES)."""
+    current = effective_mode(user_mode)
+    return VOICE_MODES[(VOICE_MODES.index(current) + 1) % len(VOICE_MODES)]
+
+
+def skip_reason(mode: str, incoming_voice: bool, text: str, max_chars: int = VOICE_REPLY_MAX_CHARS) -> str | None:
+    """
+    Check whether the voice reply should be skipped.
+
+    :param mode: Effective voice mode
+    :param incoming_voice: The user's message was a voice note
+    :param text: Answer text
+    :param max_chars: Length cutoff, 0 disables it
+    :return: None to send a voice reply, otherwise the reason ("mode" or "length")
+    """
+    if mode == "never" or (mode == "voice_only" and not incoming_voice):
+        return "mode"
+    if max_chars and len(text) > max_chars:
+        return "length"
+    return None
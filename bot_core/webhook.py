@@ -0,0 +1,260 @@
+"""
+Webhook runtime with per-chat ordering and multi-process fan-out.
+
+Front (aiohttp):
+- Receives Telegram updates on WEBHOOK_PATH, checks the
+  `X-Telegram-Bot-Api-Secret-Token` header against WEBHOOK_SECRET
+  (required in webhook mode) and answers immediately; the update is
+  handled asynchronously.
+- Each update is routed by chat id: with WEBHOOK_WORKERS > 1 it goes to
+  worker `chat_id % WEBHOOK_WORKERS` through a bounded multiprocessing
+  queue, otherwise it is handled in-process. A full queue answers 503 so
+  Telegram redelivers later instead of the update being lost.
+
+Workers:
+- Every worker runs its own event loop, Bot session and Dispatcher.
+- Updates of one chat are processed strictly in arrival order (ChatLanes);
+  different chats run concurrently.
+- A worker takes updates off its queue only while fewer than
+  WEBHOOK_QUEUE_SIZE are in progress, so backpressure reaches the front.
+"""
+
+import asyncio
+import logging
+import multiprocessing
+import queue
+import re
+import signal
+from typing import Any, Callable, Coroutine
+
+from aiogram import Bot, Dispatcher
+from aiohttp import web
+
+from .conf import (
+    WEBHOOK_BASE_URL,
+    WEBHOOK_PATH,
+    WEBHOOK_SECRET,
+    WEBHOOK_HOST,
+    WEBHOOK_PORT,
+    WEBHOOK_WORKERS,
+    WEBHOOK_QUEUE_SIZE,
+)
+
+logger = logging.getLogger("bot.webhook")
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+# Characters Telegram accepts in secret_token
+_SECRET_RE = re.compile(r"[A-Za-z0-9_-]{1,256}")
+
+_CHAT_CARRIERS = (
+    "message", "edited_message", "channel_post", "edited_channel_post",
+    "business_message", "edited_business_message",
+)
+
+
+def extract_chat_id(update: dict[str, Any]) -> int:
+    """Return the chat (or user) id an update belongs to; falls back to update_id."""
+    for key in _CHAT_CARRIERS:
+        if key in update:
+            return update[key]["chat"]["id"]
+    callback = update.get("callback_query")
+    if callback:
+        if callback.get("message"):
+            return callback["message"]["chat"]["id"]
+        return callback["from"]["id"]
+    for payload in update.values():
+        if isinstance(payload, dict) and isinstance(payload.get("from"), dict):
+            return payload["from"]["id"]
+    return update.get("update_id", 0)
+
+
+class ChatLanes:
+    """Run coroutines concurrently across chats but sequentially within one chat."""
+
+    def __init__(self):
+        self._tails: dict[int, asyncio.Task] = {}
+        self._pending = 0
+        self._finished = asyncio.Event()
+
+    def submit(self, chat_id: int, coro: Coroutine) -> None:
+        previous = self._tails.get(chat_id)
+        task = asyncio.create_task(self._run(chat_id, previous, coro))
+        self._tails[chat_id] = task
+        self._pending += 1
+
+    async def wait_for_room(self, limit: int) -> None:
+        """Wait until fewer than `limit` updates are pending."""
+        while self._pending >= limit:
+            self._finished.clear()
+            await self._finished.wait()
+
+    async def _run(self, chat_id: int, previous: asyncio.Task | None, coro: Coroutine) -> None:
+        try:
+            if previous is not None:
+                await asyncio.wait([previous])
+            await coro
+        except Exception:
+            logger.exception("Ошибка обработки обновления (chat_id=%s)", chat_id)
+        finally:
+            self._pending -= 1
+            self._finished.set()
+            if self._tails.get(chat_id) is asyncio.current_task():
+                del self._tails[chat_id]
+
+    async def drain(self) -> None:
+        while self._tails:
+            await asyncio.gather(*self._tails.values(), return_exceptions=True)
+
+    def __len__(self) -> int:
+        """Updates submitted and not finished yet, across all chats."""
+        return self._pending
+
+
+async def serve_update_queue(dp: Dispatcher, bot: Bot, updates: multiprocessing.Queue) -> None:
+    """
+    Worker loop: feed updates from the front process into the dispatcher.
+
+    :param dp: Dispatcher with all handlers registered
+    :param bot: Bot instance owned by this worker
+    :param updates: Queue of raw update dicts; None stops the worker
+    """
+    loop = asyncio.get_running_loop()
+    lanes = ChatLanes()
+    await dp.emit_startup(bot=bot, dispatcher=dp)
+    try:
+        while True:
+            # While the lanes are full, updates stay in the bounded queue, so the
+            # front sees it fill up and answers 503 instead of the backlog moving here.
+            await lanes.wait_for_room(WEBHOOK_QUEUE_SIZE)
+            update = await loop.run_in_executor(None, updates.get)
+            if update is None:
+                break
+            lanes.submit(extract_chat_id(update), dp.feed_raw_update(bot, update))
+        await lanes.drain()
+    finally:
+        await dp.emit_shutdown(bot=bot, dispatcher=dp)
+        await bot.session.close()
+
+
+def _check_config() -> None:
+    if not WEBHOOK_BASE_URL:
+        raise RuntimeError("WEBHOOK_BASE_URL не задан. Он нужен для BOT_MODE=webhook.")
+    if not WEBHOOK_PATH.startswith("/"):
+        raise ValueError(f"WEBHOOK_PATH must start with '/': '{WEBHOOK_PATH}'")
+    if not WEBHOOK_SECRET:
+        # Without it any POST to WEBHOOK_PATH would be taken for a Telegram update.
+        raise RuntimeError("WEBHOOK_SECRET не задан. Он нужен для BOT_MODE=webhook.")
+    if not _SECRET_RE.fullmatch(WEBHOOK_SECRET):
+        raise ValueError("WEBHOOK_SECRET: 1-256 символов A-Z, a-z, 0-9, _ и -")
+
+
+def _build_front_app(
+    bot_token: str,
+    allowed_updates: list[str],
+    dispatch: Callable[[dict[str, Any]], bool],
+) -> web.Application:
+    async def handle_update(request: web.Request) -> web.Response:
+        if request.headers.get(SECRET_HEADER) != WEBHOOK_SECRET:
+            return web.Response(status=401)
+        try:
+            update = await request.json()
+        except ValueError:
+            return web.Response(status=400)
+        if not dispatch(update):
+            return web.Response(status=503)
+        return web.Response()
+
+    async def on_startup(app: web.Application) -> None:
+        bot = Bot(token=bot_token)
+        try:
+            await bot.set_webhook(
+                url=WEBHOOK_BASE_URL.rstrip("/") + WEBHOOK_PATH,
+                secret_token=WEBHOOK_SECRET,
+                allowed_updates=allowed_updates,
+            )
+        finally:
+            await bot.session.close()
+        logger.info("Webhook установлен: %s%s", WEBHOOK_BASE_URL.rstrip("/"), WEBHOOK_PATH)
+
+    app = web.Application()
+    app.router.add_post(WEBHOOK_PATH, handle_update)
+    app.on_startup.append(on_startup)
+    return app
+
+
+def run_webhook(
+    bot_token: str,
+    dp: Dispatcher,
+    worker_target: Callable[[int, multiprocessing.Queue], None],
+) -> None:
+    """
+    Run the webhook front and, if WEBHOOK_WORKERS > 1, its worker processes.
+
+    :param bot_token: Telegram bot token
+    :param dp: Dispatcher (used in-process when there is a single worker)
+    :param worker_target: Importable function `(worker_index, updates_queue)` started in each worker process
+    """
+    _check_config()
+    allowed_updates = dp.resolve_used_update_types()
+
+    if WEBHOOK_WORKERS <= 1:
+        bot = Bot(token=bot_token)
+        lanes = ChatLanes()
+
+        def dispatch(update: dict[str, Any]) -> bool:
+            if len(lanes) >= WEBHOOK_QUEUE_SIZE:
+                return False
+            lanes.submit(extract_chat_id(update), dp.feed_raw_update(bot, update))
+            return True
+
+        async def on_startup(app: web.Application) -> None:
+            await dp.emit_startup(bot=bot, dispatcher=dp)
+
+        async def on_shutdown(app: web.Application) -> None:
+            await lanes.drain()
+            await dp.emit_shutdown(bot=bot, dispatcher=dp)
+            await bot.session.close()
+
+        app = _build_front_app(bot_token, allowed_updates, dispatch)
+        app.on_startup.append(on_startup)
+        app.on_shutdown.append(on_shutdown)
+        web.run_app(app, host=WEBHOOK_HOST, port=WEBHOOK_PORT)
+        return
+
+    ctx = multiprocessing.get_context("spawn")
+    queues = [ctx.Queue(maxsize=WEBHOOK_QUEUE_SIZE) for _ in range(WEBHOOK_WORKERS)]
+    workers = [
+        ctx.Process(target=worker_target, args=(index, queues[index]), name=f"bot-worker-{index}")
+        for index in range(WEBHOOK_WORKERS)
+    ]
+    for process in workers:
+        process.start()
+    logger.info("Запущено воркеров: %d", len(workers))
+
+    def dispatch(update: dict[str, Any]) -> bool:
+        index = extract_chat_id(update) % WEBHOOK_WORKERS
+        try:
+            queues[index].put_nowait(update)
+        except queue.Full:
+            logger.warning("Очередь воркера %d переполнена", index)
+            return False
+        return True
+
+    async def on_shutdown(app: web.Application) -> None:
+        for updates in queues:
+            updates.put(None)
+        loop = asyncio.get_running_loop()
+        for process in workers:
+            await loop.run_in_executor(None, process.join, 60)
+            if process.is_alive():
+                process.terminate()
+
+    app = _build_front_app(bot_token, allowed_updates, dispatch)
+    app.on_shutdown.append(on_shutdown)
+    web.run_app(app, host=WEBHOOK_HOST, port=WEBHOOK_PORT)
+
+
+def run_worker(dp: Dispatcher, bot_token: str, updates: multiprocessing.Queue) -> None:
+    """Entry point body for a worker process (the front handles SIGINT/SIGTERM)."""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    asyncio.run(serve_update_queue(dp, Bot(token=bot_token), updates))
@@ -0,0 +1,106 @@
+"""
+Micro-benchmark of the per-frame relay work, before and after media_codec.
+
+Frames are realistic 20 ms μ-law frames (160 bytes, 216 base64 chars):
+- inbound: Twilio `media` frame -> `input_audio_buffer.append` event,
+- outbound: Realtime `response.output_audio.delta` event -> Twilio `media` frame.
+"before" is the previous code path (stdlib json + base64 decode/encode),
+"after" is media_codec with the active JSON backend. Single thread, so the
+numbers are frames/sec per core.
+
+Usage (from the speech-assistant directory):
+    python -m benchmarks.media_codec
+    python -m benchmarks.media_codec --frames 200000
+"""
+
+import argparse
+import base64
+import json
+import os
+import time
+
+import media_codec
+from media_codec import TwilioFrameEncoder, encode_append, loads
+
+STREAM_SID = "MZ" + "0123456789abcdef" * 2
+
+
+def make_frames() -> tuple[str, str]:
+    payload = base64.b64encode(os.urandom(160)).decode()
+    twilio_frame = json.dumps({
+        "event": "media",
+        "sequenceNumber": "42",
+        "media": {"track": "inbound", "chunk": "41", "timestamp": "820", "payload": payload},
+        "streamSid": STREAM_SID,
+    })
+    realtime_event = json.dumps({
+        "type": "response.output_audio.delta",
+        "event_id": "event_CqX0abcdefghijklmno",
+        "response_id": "resp_CqX0abcdefghijklmno",
+        "item_id": "item_CqX0abcdefghijklmno",
+        "output_index": 0,
+        "content_index": 0,
+        "delta": payload,
+    })
+    return twilio_frame, realtime_event
+
+
+def inbound_before(message: str) -> str:
+    data = json.loads(message)
+    if data.get("event") == "media":
+        int(data['media'].get('timestamp', 0))
+        return json.dumps({"type": "input_audio_buffer.append", "audio": data['media']['payload']})
+
+
+def inbound_after(message: str) -> str:
+    data = loads(message)
+    if data.get("event") == "media":
+        media = data['media']
+        int(media.get('timestamp', 0))
+        return encode_append(media['payload'])
+
+
+def outbound_before(message: str) -> str:
+    response = json.loads(message)
+    if response.get('type') == 'response.output_audio.delta' and 'delta' in response:
+        payload = base64.b64encode(base64.b64decode(response['delta'])).decode('utf-8')
+        # starlette's send_json is json.dumps + send_text
+        return json.dumps({"event": "media", "streamSid": STREAM_SID, "media": {"payload": payload}})
+
+
+def outbound_after(message: str, frames: TwilioFrameEncoder) -> str:
+    response = loads(message)
+    if response.get('type') == 'response.output_audio.delta' and 'delta' in response:
+        return frames.media(response['delta'])
+
+
+def rate(fn, message: str, frames: int, *args) -> float:
+    started = time.perf_counter()
+    for _ in range(frames):
+        fn(message, *args)
+    return frames / (time.perf_counter() - started)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Frames/sec per core of the media relay codec.")
+    parser.add_argument("--frames", type=int, default=100_000)
+    args = parser.parse_args()
+
+    twilio_frame, realtime_event = make_frames()
+    encoder = TwilioFrameEncoder(STREAM_SID)
+    assert json.loads(inbound_after(twilio_frame)) == json.loads(inbound_before(twilio_frame))
+    assert json.loads(outbound_after(realtime_event, encoder)) == json.loads(outbound_before(realtime_event))
+
+    print(f"JSON backend: {media_codec.JSON_BACKEND}, {args.frames} frames per run\n")
+    print(f"{'direction':<10} {'before':>12} {'after':>12} {'speed-up':>9}   calls/core at 50 fps")
+    for name, before, after in (
+        ("inbound", rate(inbound_before, twilio_frame, args.frames), rate(inbound_after, twilio_frame, args.frames)),
+        ("outbound", rate(outbound_before, realtime_event, args.frames),
+         rate(outbound_after, realtime_event, args.frames, encoder)),
+    ):
+        print(f"{name:<10} {before:>10,.0f}/s {after:>10,.0f}/s {after / before:>8.1f}x   "
+              f"{before / 50:,.0f} -> {after / 50:,.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,269 @@
+"""
+Live call registry and metrics for the media server.
+
+- Every /media-stream call gets a CallStats record, registered under its
+  streamSid once Twilio sends `start`.
+- Per-frame accounting is a couple of integer increments on that record.
+  Totals are summed over live calls only when /metrics or /calls is
+  requested.
+- Latencies go into constant-memory histograms (a fixed set of buckets, a
+  sum and a count): barge-in reactions as they happen, per-call latencies
+  when the call ends. Counters of a finished call are folded into process
+  totals. Memory does not grow with the number of calls, frames or
+  interruptions; only the last RECENT_CALLS finished calls are kept for
+  /calls.
+- The latest OpenAI `rate_limits.updated` data is kept per call and
+  process-wide.
+
+`render_prometheus()` serves /metrics, `snapshot()` serves /calls.
+"""
+
+import bisect
+import time
+from collections import deque
+from typing import Callable
+
+LATENCY_BUCKETS: tuple[float, ...] = (
+    0.025, 0.05, 0.1, 0.15, 0.25, 0.5, 0.75, 1.0, 1.5, 2.5, 5.0, 10.0,
+)
+DURATION_BUCKETS: tuple[float, ...] = (5, 15, 30, 60, 120, 300, 600, 1200, 1800)
+RECENT_CALLS = 20
+
+
+class Histogram:
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds: tuple[float, ...] = LATENCY_BUCKETS):
+        self.bounds = bounds
+        # The last slot counts values above the largest bound (+Inf).
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """Approximate quantile: the upper bound of the bucket holding the q-th value."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+    def cumulative(self) -> list[int]:
+        total = 0
+        result = []
+        for count in self.counts:
+            total += count
+            result.append(total)
+        return result
+
+    def snapshot(self) -> dict:
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 6),
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+        }
+
+
+class CallStats:
+    __slots__ = (
+        "stream_sid", "started_at", "accepted_at", "ended_at",
+        "frames_in", "bytes_in", "frames_out", "bytes_out",
+        "openai_connect_seconds", "first_audio_seconds",
+        "interruptions", "last_barge_in_seconds", "rate_limits",
+        "gate", "coalescer",
+    )
+
+    def __init__(self):
+        self.stream_sid: str | None = None
+        self.started_at = time.time()
+        self.accepted_at = time.monotonic()
+        self.ended_at: float | None = None
+        self.frames_in = 0
+        self.bytes_in = 0
+        self.frames_out = 0
+        self.bytes_out = 0
+        self.openai_connect_seconds: float | None = None
+        self.first_audio_seconds: float | None = None
+        self.interruptions = 0
+        self.last_barge_in_seconds: float | None = None
+        self.rate_limits: dict[str, dict] = {}
+        # VoiceGate and AppendCoalescer of the call; their counters are read on snapshot
+        self.gate = None
+        self.coalescer = None
+
+    @property
+    def duration(self) -> float:
+        return (self.ended_at or time.monotonic()) - self.accepted_at
+
+    def snapshot(self) -> dict:
+        return {
+            "stream_sid": self.stream_sid,
+            "started_at": round(self.started_at, 3),
+            "duration_seconds": round(self.duration, 3),
+            "frames_in": self.frames_in,
+            "bytes_in": self.bytes_in,
+            "frames_out": self.frames_out,
+            "bytes_out": self.bytes_out,
+            "append_messages": self.coalescer.messages if self.coalescer is not None else None,
+            "frames_forwarded": self.gate.forwarded if self.gate is not None else None,
+            "frames_suppressed": self.gate.suppressed if self.gate is not None else None,
+            "openai_connect_ms": _ms(self.openai_connect_seconds),
+            "time_to_first_audio_ms": _ms(self.first_audio_seconds),
+            "interruptions": self.interruptions,
+            "last_barge_in_reaction_ms": _ms(self.last_barge_in_seconds),
+            "rate_limits": self.rate_limits,
+        }
+
+
+def _ms(seconds: float | None) -> float | None:
+    return round(seconds * 1000, 1) if seconds is not None else None
+
+
+# Counters summed over finished and live calls
+_TOTALS = ("frames_in", "bytes_in", "frames_out", "bytes_out", "interruptions")
+
+
+class CallRegistry:
+    def __init__(self, namespace: str = "speech"):
+        self.namespace = namespace
+        self.live: dict[str, CallStats] = {}
+        self._unregistered: set[CallStats] = set()
+        self.recent: deque[dict] = deque(maxlen=RECENT_CALLS)
+        self.calls_total = 0
+        self.finished = {name: 0 for name in _TOTALS}
+        self.finished.update(append_messages=0, frames_forwarded=0, frames_suppressed=0)
+        self.rate_limits: dict[str, dict] = {}
+        self.histograms = {
+            "openai_connect_seconds": Histogram(),
+            "time_to_first_audio_seconds": Histogram(),
+            "barge_in_reaction_seconds": Histogram(),
+            "call_duration_seconds": Histogram(DURATION_BUCKETS),
+        }
+        self._gauge_providers: dict[str, Callable[[], dict]] = {}
+
+    def open(self) -> CallStats:
+        """Start tracking a call that has just connected to /media-stream."""
+        call = CallStats()
+        self._unregistered.add(call)
+        self.calls_total += 1
+        return call
+
+    def set_stream_sid(self, call: CallStats, stream_sid: str) -> None:
+        self._unregistered.discard(call)
+        call.stream_sid = stream_sid
+        self.live[stream_sid] = call
+
+    def update_rate_limits(self, call: CallStats, rate_limits: list[dict]) -> None:
+        for item in rate_limits or ():
+            name = item.get("name")
+            if name:
+                limits = {k: item.get(k) for k in ("limit", "remaining", "reset_seconds")}
+                call.rate_limits[name] = limits
+                self.rate_limits[name] = limits
+
+    def record_interruption(self, call: CallStats, reaction_seconds: float) -> None:
+        """The caller cut the assistant off; `reaction_seconds` is from speech onset to the Twilio clear."""
+        call.interruptions += 1
+        call.last_barge_in_seconds = reaction_seconds
+        self.histograms["barge_in_reaction_seconds"].observe(reaction_seconds)
+
+    def close(self, call: CallStats) -> None:
+        """Fold a finished call into the totals and histograms."""
+        call.ended_at = time.monotonic()
+        self._unregistered.discard(call)
+        if call.stream_sid is not None and self.live.get(call.stream_sid) is call:
+            del self.live[call.stream_sid]
+
+        for name in _TOTALS:
+            self.finished[name] += getattr(call, name)
+        if call.coalescer is not None:
+            self.finished["append_messages"] += call.coalescer.messages
+        if call.gate is not None:
+            self.finished["frames_forwarded"] += call.gate.forwarded
+            self.finished["frames_suppressed"] += call.gate.suppressed
+
+        if call.openai_connect_seconds is not None:
+            self.histograms["openai_connect_seconds"].observe(call.openai_connect_seconds)
+        if call.first_audio_seconds is not None:
+            self.histograms["time_to_first_audio_seconds"].observe(call.first_audio_seconds)
+        self.histograms["call_duration_seconds"].observe(call.duration)
+        self.recent.append(call.snapshot())
+
+    def register_gauges(self, name: str, provider: Callable[[], dict]) -> None:
+        """Sample `provider()` (e.g. a stats() method) on every scrape as gauges `<namespace>_<name>_<key>`."""
+        self._gauge_providers[name] = provider
+
+    def totals(self) -> dict[str, int]:
+        totals = dict(self.finished)
+        for call in self._calls():
+            for name in _TOTALS:
+                totals[name] += getattr(call, name)
+            if call.coalescer is not None:
+                totals["append_messages"] += call.coalescer.messages
+            if call.gate is not None:
+                totals["frames_forwarded"] += call.gate.forwarded
+                totals["frames_suppressed"] += call.gate.suppressed
+        return totals
+
+    def snapshot(self) -> dict:
+        return {
+            "active": len(self.live) + len(self._unregistered),
+            "calls_total": self.calls_total,
+            "live": [call.snapshot() for call in self._calls()],
+            "recent": list(self.recent),
+            "totals": self.totals(),
+            "latency": {name: h.snapshot() for name, h in self.histograms.items()},
+            "rate_limits": self.rate_limits,
+        }
+
+    def render_prometheus(self) -> str:
+        """Return all metrics in the Prometheus text exposition format."""
+        ns = self.namespace
+        lines = [
+            f"# TYPE {ns}_calls_active gauge",
+            f"{ns}_calls_active {len(self.live) + len(self._unregistered)}",
+            f"# TYPE {ns}_calls_total counter",
+            f"{ns}_calls_total {self.calls_total}",
+        ]
+        for name, value in self.totals().items():
+            lines.append(f"# TYPE {ns}_{name}_total counter")
+            lines.append(f"{ns}_{name}_total {value}")
+
+        for name, histogram in self.histograms.items():
+            full = f"{ns}_{name}"
+            lines.append(f"# TYPE {full} histogram")
+            for bound, count in zip((*histogram.bounds, "+Inf"), histogram.cumulative()):
+                le = bound if isinstance(bound, str) else f"{bound:g}"
+                lines.append(f'{full}_bucket{{le="{le}"}} {count}')
+            lines.append(f"{full}_sum {histogram.sum:.6f}")
+            lines.append(f"{full}_count {histogram.count}")
+
+        for field in ("limit", "remaining", "reset_seconds"):
+            full = f"{ns}_openai_rate_limit_{field}"
+            values = [(name, limits[field]) for name, limits in self.rate_limits.items()
+                      if isinstance(limits.get(field), (int, float))]
+            if values:
+                lines.append(f"# TYPE {full} gauge")
+                lines.extend(f'{full}{{name="{name}"}} {value:g}' for name, value in values)
+
+        for prefix, provider in self._gauge_providers.items():
+            for key, value in provider().items():
+                if isinstance(value, (int, float)):
+                    lines.append(f"# TYPE {ns}_{prefix}_{key} gauge")
+                    lines.append(f"{ns}_{prefix}_{key} {value:g}")
+        return "\n".join(lines) + "\n"
+
+    def _calls(self):
+        yield from self.live.values()
+        yield from self._unregistered
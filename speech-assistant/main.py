@@ -1,19 +1,44 @@
 import os
-import json
-import base64
+import time
 import asyncio
+from binascii import a2b_base64
+from contextlib import asynccontextmanager
 import aiohttp
 from fastapi import FastAPI, WebSocket, Request
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi.responses import HTMLResponse, JSONResponse, PlainTextResponse
 from fastapi.websockets import WebSocketDisconnect
+from starlette.background import BackgroundTask
 from twilio.twiml.voice_response import VoiceResponse, Connect
 from dotenv import load_dotenv
 
+from call_metrics import CallRegistry
+from media_codec import AppendCoalescer, TwilioFrameEncoder, dumps, loads, payload_size
+from realtime_pool import RealtimePool
+from ulaw_vad import VoiceGate
+
 load_dotenv()
 
 OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
 PORT = int(os.getenv('PORT', 5050))
 TEMPERATURE = float(os.getenv('TEMPERATURE', 0.2))
+# Ready Realtime sessions kept connected in advance, and their maximum age in seconds
+REALTIME_POOL_SIZE = int(os.getenv('REALTIME_POOL_SIZE', 2))
+REALTIME_POOL_MAX_AGE = float(os.getenv('REALTIME_POOL_MAX_AGE', 300))
+# Caller audio is sent to OpenAI in batches of up to INPUT_COALESCE_MS ms / INPUT_COALESCE_BYTES bytes (0 = per frame)
+INPUT_COALESCE_MS = int(os.getenv('INPUT_COALESCE_MS', 100))
+INPUT_COALESCE_BYTES = int(os.getenv('INPUT_COALESCE_BYTES', 1600))
+# Local μ-law voice gate: long silences are not sent to OpenAI, and the caller's speech
+# start is detected locally for faster barge-in. VAD_GATE_HANGOVER_MS must exceed the server VAD silence (500 ms).
+VAD_GATE = os.getenv('VAD_GATE', '1').lower() in ('1', 'true', 'yes')
+VAD_GATE_THRESHOLD_DB = float(os.getenv('VAD_GATE_THRESHOLD_DB', -45))
+VAD_GATE_NOISE_MARGIN_DB = float(os.getenv('VAD_GATE_NOISE_MARGIN_DB', 9))
+VAD_GATE_PREROLL_MS = int(os.getenv('VAD_GATE_PREROLL_MS', 300))
+VAD_GATE_HANGOVER_MS = int(os.getenv('VAD_GATE_HANGOVER_MS', 800))
+VAD_GATE_BARGE_IN_MS = int(os.getenv('VAD_GATE_BARGE_IN_MS', 120))
+VAD_GATE_KEEPALIVE_MS = int(os.getenv('VAD_GATE_KEEPALIVE_MS', 0))
+# A local barge-in not confirmed by the server's speech_started within this time is treated
+# as noise (cough, line click): the assistant is asked to respond again.
+VAD_GATE_BARGE_IN_CONFIRM_MS = int(os.getenv('VAD_GATE_BARGE_IN_CONFIRM_MS', 1000))
 
 if not OPENAI_API_KEY:
     raise ValueError("Не задан OPENAI_API_KEY в .env")
@@ -29,20 +54,71 @@ SYSTEM_PROMPT_RU = (
 
 VOICE = "alloy"
 
-LOG_EVENT_TYPES = [
+LOG_EVENT_TYPES = {
     'error', 'response.content.done', 'rate_limits.updated',
     'response.done', 'input_audio_buffer.committed',
     'input_audio_buffer.speech_stopped', 'input_audio_buffer.speech_started',
     'session.created', 'session.updated'
-]
+}
+
+OPENAI_URL = f"wss://api.openai.com/v1/realtime?model=gpt-realtime&temperature={TEMPERATURE}"
+OPENAI_HEADERS = {"Authorization": f"Bearer {OPENAI_API_KEY}"}
+
+SESSION_UPDATE = {
+    "type": "session.update",
+    "session": {
+        "type": "realtime",
+        "model": "gpt-realtime",
+        "output_modalities": ["audio"],
+        "audio": {
+            "input": {
+                "format": {"type": "audio/pcmu"},
+                "turn_detection": {"type": "server_vad"}
+            },
+            "output": {
+                "format": {"type": "audio/pcmu"},
+                "voice": VOICE
+            }
+        },
+        "instructions": SYSTEM_PROMPT_RU
+    }
+}
+
+realtime_pool = RealtimePool(
+    OPENAI_URL, OPENAI_HEADERS, SESSION_UPDATE,
+    size=REALTIME_POOL_SIZE, max_age=REALTIME_POOL_MAX_AGE,
+)
+
+calls = CallRegistry()
+calls.register_gauges("realtime_pool", realtime_pool.stats)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await realtime_pool.start()
+    try:
+        yield
+    finally:
+        await realtime_pool.close()
 
-app = FastAPI()
+
+app = FastAPI(lifespan=lifespan)
 
 @app.get("/", response_class=JSONResponse)
 async def index_page():
     return {"message": "Kazakhtelecom realtime media server (русский) running!"}
 
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics_page():
+    return PlainTextResponse(calls.render_prometheus())
+
+
+@app.get("/calls", response_class=JSONResponse)
+async def calls_page():
+    return {**calls.snapshot(), "realtime_pool": realtime_pool.stats()}
+
+
 @app.api_route("/incoming-call", methods=["GET", "POST"])
 async def handle_incoming_call(request: Request):
     response = VoiceResponse()
@@ -53,73 +129,88 @@ async def handle_incoming_call(request: Request):
     connect = Connect()
     connect.stream(url=f"wss://{host}/media-stream")
     response.append(connect)
-    return HTMLResponse(content=str(response), media_type="application/xml")
+    # The Realtime session for this call is connected while Twilio plays the greeting.
+    return HTMLResponse(
+        content=str(response),
+        media_type="application/xml",
+        background=BackgroundTask(realtime_pool.prewarm),
+    )
 
 
 @app.websocket("/media-stream")
 async def handle_media_stream(websocket: WebSocket):
     await websocket.accept()
+    call = calls.open()
     print("Twilio client connected to /media-stream")
 
-    openai_url = f"wss://api.openai.com/v1/realtime?model=gpt-realtime&temperature={TEMPERATURE}"
-    headers = {"Authorization": f"Bearer {OPENAI_API_KEY}"}
-
-    session = aiohttp.ClientSession()
     try:
-        print("Connecting to OpenAI Realtime WS...")
-        openai_ws = await session.ws_connect(openai_url, headers=headers, timeout=30)
+        openai_ws = await realtime_pool.acquire()
     except Exception as e:
         print("Не удалось подключиться к OpenAI Realtime WebSocket:", repr(e))
+        calls.close(call)
         await websocket.close()
-        await session.close()
         return
+    call.openai_connect_seconds = time.monotonic() - call.accepted_at
+    print(f"OpenAI Realtime session ready in {call.openai_connect_seconds * 1000:.0f} ms")
 
     try:
-        session_update = {
-            "type": "session.update",
-            "session": {
-                "type": "realtime",
-                "model": "gpt-realtime",
-                "output_modalities": ["audio"],
-                "audio": {
-                    "input": {
-                        "format": {"type": "audio/pcmu"},
-                        "turn_detection": {"type": "server_vad"}
-                    },
-                    "output": {
-                        "format": {"type": "audio/pcmu"},
-                        "voice": VOICE
-                    }
-                },
-                "instructions": SYSTEM_PROMPT_RU
-            }
-        }
-        await openai_ws.send_str(json.dumps(session_update))
-        print("Sent session.update to OpenAI")
-
         stream_sid = None
+        twilio_frames = TwilioFrameEncoder(None)
+        input_audio = AppendCoalescer(openai_ws.send_str, INPUT_COALESCE_MS, INPUT_COALESCE_BYTES)
+        voice_gate = VoiceGate(
+            threshold_db=VAD_GATE_THRESHOLD_DB,
+            noise_margin_db=VAD_GATE_NOISE_MARGIN_DB,
+            preroll_ms=VAD_GATE_PREROLL_MS,
+            hangover_ms=VAD_GATE_HANGOVER_MS,
+            barge_in_ms=VAD_GATE_BARGE_IN_MS,
+            keepalive_ms=VAD_GATE_KEEPALIVE_MS,
+        ) if VAD_GATE else None
+        call.coalescer = input_audio
+        call.gate = voice_gate
         latest_media_timestamp = 0
         last_assistant_item = None
+        # Item cut off by the caller: its remaining deltas are dropped
+        interrupted_item = None
+        response_active = False
+        # Confirmation timer of a local barge-in the server has not reported yet
+        unconfirmed_barge_in: asyncio.Task | None = None
         mark_queue = []
         response_start_timestamp_twilio = None
 
         async def receive_from_twilio():
-            nonlocal stream_sid, latest_media_timestamp
+            nonlocal stream_sid, twilio_frames, latest_media_timestamp
+            nonlocal unconfirmed_barge_in
             try:
                 async for message in websocket.iter_text():
-                    data = json.loads(message)
+                    data = loads(message)
                     evt = data.get("event")
                     if evt == "media":
-                        latest_media_timestamp = int(data['media'].get('timestamp', 0))
-                        audio_payload = data['media']['payload']
-                        audio_append = {"type": "input_audio_buffer.append", "audio": audio_payload}
-                        await openai_ws.send_str(json.dumps(audio_append))
+                        media = data['media']
+                        latest_media_timestamp = int(media.get('timestamp', 0))
+                        call.frames_in += 1
+                        call.bytes_in += payload_size(media['payload'])
+                        if voice_gate is None:
+                            await input_audio.add(media['payload'])
+                            continue
+                        frames, speech_started = voice_gate.process(a2b_base64(media['payload']))
+                        for frame in frames:
+                            await input_audio.add_frame(frame)
+                        if speech_started:
+                            print("Caller speech started (local VAD)")
+                            if last_assistant_item and unconfirmed_barge_in is None:
+                                onset = time.monotonic() - voice_gate.speech_ms / 1000
+                                if await handle_speech_started_event(onset, cancel_response=True):
+                                    unconfirmed_barge_in = asyncio.create_task(confirm_barge_in())
                     elif evt == "start":
                         stream_sid = data['start'].get('streamSid')
+                        twilio_frames = TwilioFrameEncoder(stream_sid)
+                        calls.set_stream_sid(call, stream_sid)
                         print("Stream started:", stream_sid)
                     elif evt == "mark":
                         if mark_queue:
                             mark_queue.pop(0)
+                    elif evt == "stop":
+                        await input_audio.flush()
             except WebSocketDisconnect:
                 print("Twilio disconnected (receive)")
             except Exception as e:
@@ -127,11 +218,12 @@ async def handle_media_stream(websocket: WebSocket):
 
         async def send_to_twilio():
             nonlocal stream_sid, last_assistant_item, response_start_timestamp_twilio
+            nonlocal response_active, unconfirmed_barge_in
             try:
                 async for msg in openai_ws:
                     if msg.type == aiohttp.WSMsgType.TEXT:
                         try:
-                            response = json.loads(msg.data)
+                            response = loads(msg.data)
                         except Exception:
                             continue
 
@@ -139,24 +231,40 @@ async def handle_media_stream(websocket: WebSocket):
                             print("OpenAI event:", response.get('type'))
 
                         if response.get('type') == 'response.output_audio.delta' and 'delta' in response:
-                            try:
-                                audio_payload = base64.b64encode(base64.b64decode(response['delta'])).decode('utf-8')
-                            except Exception:
-                                audio_payload = response['delta']
-
-                            audio_delta = {"event": "media", "streamSid": stream_sid, "media": {"payload": audio_payload}}
-                            await websocket.send_json(audio_delta)
+                            if interrupted_item is not None and response.get("item_id") == interrupted_item:
+                                # Already in flight when the response was cancelled
+                                continue
+                            # The base64 μ-law payload goes to Twilio as is.
+                            await websocket.send_text(twilio_frames.media(response['delta']))
+                            call.frames_out += 1
+                            call.bytes_out += payload_size(response['delta'])
+                            if call.first_audio_seconds is None:
+                                call.first_audio_seconds = time.monotonic() - call.accepted_at
+                                print(f"Time to first assistant audio: {call.first_audio_seconds * 1000:.0f} ms")
 
                             if response.get("item_id") and response["item_id"] != last_assistant_item:
                                 response_start_timestamp_twilio = latest_media_timestamp
                                 last_assistant_item = response["item_id"]
                                 mark_queue.append('responsePart')
-                                await send_mark(websocket, stream_sid)
+                                await send_mark(websocket, twilio_frames)
+
+                        elif response.get('type') == 'response.created':
+                            response_active = True
+                        elif response.get('type') == 'response.done':
+                            response_active = False
+                        elif response.get('type') == 'rate_limits.updated':
+                            calls.update_rate_limits(call, response.get('rate_limits'))
 
                         if response.get('type') == 'input_audio_buffer.speech_started':
                             print("Caller speech started (OpenAI event)")
-                            if last_assistant_item:
-                                await handle_speech_started_event()
+                            if unconfirmed_barge_in is not None:
+                                # The local gate has already handled this interruption.
+                                unconfirmed_barge_in.cancel()
+                                unconfirmed_barge_in = None
+                            elif last_assistant_item:
+                                # Reaction is timed from the local speech onset if the gate heard it
+                                speech_ms = voice_gate.speech_ms if voice_gate is not None else 0
+                                await handle_speech_started_event(time.monotonic() - speech_ms / 1000)
 
                     elif msg.type == aiohttp.WSMsgType.ERROR:
                         print("OpenAI WS error:", openai_ws.exception())
@@ -164,38 +272,64 @@ async def handle_media_stream(websocket: WebSocket):
             except Exception as e:
                 print("Error in send_to_twilio main loop:", repr(e))
 
-        async def handle_speech_started_event():
-            nonlocal response_start_timestamp_twilio, last_assistant_item
+        async def handle_speech_started_event(speech_onset: float, cancel_response: bool = False) -> bool:
+            """
+            Cut the assistant off. The server VAD cancels its response itself; a
+            local barge-in has to send response.cancel.
+
+            :return: Whether an interruption was handled
+            """
+            nonlocal response_start_timestamp_twilio, last_assistant_item, interrupted_item
             print("Handling speech started (interruption).")
             if mark_queue and response_start_timestamp_twilio is not None:
+                # Reset before awaiting, so a speech start reported meanwhile finds nothing to interrupt.
                 elapsed_time = latest_media_timestamp - response_start_timestamp_twilio
-                if last_assistant_item:
+                interrupted_item = last_assistant_item
+                mark_queue.clear()
+                last_assistant_item = None
+                response_start_timestamp_twilio = None
+
+                if cancel_response and response_active:
+                    await openai_ws.send_str(dumps({"type": "response.cancel"}))
+                if interrupted_item:
                     truncate_event = {
                         "type": "conversation.item.truncate",
-                        "item_id": last_assistant_item,
+                        "item_id": interrupted_item,
                         "content_index": 0,
                         "audio_end_ms": elapsed_time
                     }
-                    await openai_ws.send_str(json.dumps(truncate_event))
-
-                await websocket.send_json({"event": "clear", "streamSid": stream_sid})
-                mark_queue.clear()
-                last_assistant_item = None
-                response_start_timestamp_twilio = None
-
-        async def send_mark(connection, stream_sid_local):
-            if stream_sid_local:
-                mark_event = {"event": "mark", "streamSid": stream_sid_local, "mark": {"name": "responsePart"}}
-                await connection.send_json(mark_event)
+                    await openai_ws.send_str(dumps(truncate_event))
+
+                await websocket.send_text(twilio_frames.clear())
+                calls.record_interruption(call, time.monotonic() - speech_onset)
+                return True
+            return False
+
+        async def confirm_barge_in():
+            nonlocal unconfirmed_barge_in
+            await asyncio.sleep(VAD_GATE_BARGE_IN_CONFIRM_MS / 1000)
+            unconfirmed_barge_in = None
+            if not response_active:
+                # No speech_started from the server: the local gate reacted to noise.
+                print("Local barge-in not confirmed by OpenAI, resuming the answer")
+                await openai_ws.send_str(dumps({"type": "response.create"}))
+
+        async def send_mark(connection, frames):
+            if frames.stream_sid:
+                await connection.send_text(frames.mark("responsePart"))
 
         await asyncio.gather(receive_from_twilio(), send_to_twilio())
 
     finally:
+        input_audio.close()
+        if unconfirmed_barge_in is not None:
+            unconfirmed_barge_in.cancel()
+        calls.close(call)
+        print("Call finished:", call.snapshot())
         try:
             await openai_ws.close()
         except Exception:
             pass
-        await session.close()
         try:
             await websocket.close()
         except Exception:
@@ -0,0 +1,151 @@
+"""
+Media frame codec for the Twilio <-> OpenAI Realtime relay.
+
+Audio flows at 50 frames per second per call in each direction, so the
+per-frame work is kept to one JSON parse and one string concatenation:
+- Base64 payloads are passed through untouched. Twilio and Realtime both
+  use standard base64 of the same 8 kHz μ-law audio, so the payload never
+  needs to be decoded.
+- Outbound `media` and `input_audio_buffer.append` frames are built from
+  pre-built templates. Base64 never needs JSON escaping, and the streamSid
+  is escaped once per call.
+- Inbound frames are parsed with orjson when it is installed, falling back
+  to the stdlib json module.
+
+Input coalescing (`AppendCoalescer`): Twilio sends a 20 ms frame at a time.
+Frames are batched into one `input_audio_buffer.append` per `max_ms` of
+audio (or `max_bytes`, whichever is smaller), which means fewer WebSocket
+messages, JSON documents and syscalls towards OpenAI. A timer flushes a
+partial batch `max_ms` after its first frame, and `flush()` is called on
+Twilio's `stop`, so at most `max_ms` of latency is added. Twilio payloads
+carry base64 padding, so batched frames are decoded to μ-law bytes and
+encoded once per batch.
+
+`python -m benchmarks.media_codec` measures frames/sec per core against
+the previous json + base64 round-trip path.
+"""
+
+import asyncio
+import json
+from binascii import a2b_base64, b2a_base64
+from typing import Awaitable, Callable
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional speed-up
+    orjson = None
+
+if orjson is not None:
+    JSON_BACKEND = "orjson"
+    loads = orjson.loads
+
+    def dumps(obj) -> str:
+        return orjson.dumps(obj).decode()
+else:
+    JSON_BACKEND = "json"
+    loads = json.loads
+
+    def dumps(obj) -> str:
+        return json.dumps(obj, separators=(",", ":"), ensure_ascii=False)
+
+
+_APPEND_PREFIX = '{"type":"input_audio_buffer.append","audio":"'
+_APPEND_SUFFIX = '"}'
+
+
+def encode_append(payload: str) -> str:
+    """`input_audio_buffer.append` event for a base64 μ-law payload."""
+    return _APPEND_PREFIX + payload + _APPEND_SUFFIX
+
+
+def payload_size(payload: str) -> int:
+    """Decoded size of a base64 payload, without decoding it."""
+    return len(payload) * 3 // 4 - payload.endswith("=") - payload.endswith("==")
+
+
+# 8 kHz μ-law: one byte per sample
+ULAW_BYTES_PER_MS = 8
+
+
+class AppendCoalescer:
+    """Batches inbound μ-law frames of one call into fewer `input_audio_buffer.append` events."""
+
+    def __init__(self, send: Callable[[str], Awaitable], max_ms: int, max_bytes: int):
+        self.send = send
+        self.max_ms = max_ms
+        self.limit = min(max_ms * ULAW_BYTES_PER_MS, max_bytes) if max_ms > 0 and max_bytes > 0 else 0
+        self._buffer = bytearray()
+        self._timer: asyncio.TimerHandle | None = None
+        self._timer_flush: asyncio.Task | None = None
+        self.frames = 0
+        self.messages = 0
+
+    async def add(self, payload: str) -> None:
+        """Queue one base64 μ-law frame; sends when the batch is full."""
+        if not self.limit:
+            self.frames += 1
+            self.messages += 1
+            await self.send(encode_append(payload))
+            return
+        await self.add_frame(a2b_base64(payload))
+
+    async def add_frame(self, frame: bytes) -> None:
+        """Queue one raw μ-law frame (already decoded, e.g. by the voice gate)."""
+        self.frames += 1
+        if not self.limit:
+            self.messages += 1
+            await self.send(encode_append(b2a_base64(frame, newline=False).decode()))
+            return
+        self._buffer += frame
+        if len(self._buffer) >= self.limit:
+            await self.flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.max_ms / 1000, self._on_timer)
+
+    async def flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._buffer:
+            return
+        # Taken synchronously, so a timer flush and the next batch cannot reorder audio.
+        audio = b2a_base64(self._buffer, newline=False).decode()
+        self._buffer.clear()
+        self.messages += 1
+        await self.send(encode_append(audio))
+
+    def close(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self._timer_flush is not None:
+            self._timer_flush.cancel()
+
+    def _on_timer(self) -> None:
+        self._timer = None
+        self._timer_flush = asyncio.create_task(self.flush())
+        self._timer_flush.add_done_callback(_report_flush_error)
+
+
+def _report_flush_error(task: asyncio.Task) -> None:
+    if not task.cancelled() and task.exception() is not None:
+        print("Ошибка отправки аудио в OpenAI по таймеру:", repr(task.exception()))
+
+
+class TwilioFrameEncoder:
+    """Builds outbound Twilio frames for one stream; the streamSid is escaped once."""
+
+    __slots__ = ("stream_sid", "_media_prefix")
+
+    def __init__(self, stream_sid: str | None):
+        self.stream_sid = stream_sid
+        self._media_prefix = '{"event":"media","streamSid":' + json.dumps(stream_sid) + ',"media":{"payload":"'
+
+    def media(self, payload: str) -> str:
+        return self._media_prefix + payload + '"}}'
+
+    def mark(self, name: str) -> str:
+        return dumps({"event": "mark", "streamSid": self.stream_sid, "mark": {"name": name}})
+
+    def clear(self) -> str:
+        return dumps({"event": "clear", "streamSid": self.stream_sid})
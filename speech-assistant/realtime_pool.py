@@ -0,0 +1,216 @@
+"""
+Pool of pre-connected OpenAI Realtime WebSocket sessions.
+
+- One aiohttp.ClientSession per process, so TLS connections and DNS
+  lookups are reused.
+- The pool keeps `size` sockets that have already sent session.update and
+  received session.updated: a call gets a ready session without any
+  handshakes on its critical path.
+- While a socket waits in the pool, a drain task reads it: this answers
+  server pings and notices closed connections.
+- Sockets older than `max_age` are closed and replaced in the background.
+- `prewarm()` is called from /incoming-call: one extra socket is connected
+  per expected call, so the pool is not empty by the time /media-stream
+  arrives.
+- If the pool is empty, `acquire()` connects on the spot (old behaviour).
+"""
+
+import asyncio
+import json
+import time
+from collections import deque
+
+import aiohttp
+
+CONNECT_TIMEOUT = 30
+READY_TIMEOUT = 10
+# An /incoming-call not followed by /media-stream within this time is forgotten
+PREWARM_TTL = 30
+MAINTAIN_INTERVAL = 5
+
+
+class _Idle:
+    __slots__ = ("ws", "created_at", "drain")
+
+    def __init__(self, ws: aiohttp.ClientWebSocketResponse, created_at: float):
+        self.ws = ws
+        self.created_at = created_at
+        self.drain: asyncio.Task | None = None
+
+
+class RealtimePool:
+    def __init__(self, url: str, headers: dict, session_update: dict, size: int = 2, max_age: float = 300.0):
+        self.url = url
+        self.headers = headers
+        self.session_update = session_update
+        self.size = size
+        self.max_age = max_age
+
+        self.session: aiohttp.ClientSession | None = None
+        self._idle: deque[_Idle] = deque()
+        self._connecting = 0
+        self._expected: deque[float] = deque()
+        self._maintainer: asyncio.Task | None = None
+        self._tasks: set[asyncio.Task] = set()
+
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+        self.failed = 0
+
+    async def start(self) -> None:
+        self.session = aiohttp.ClientSession()
+        self._maintainer = asyncio.create_task(self._maintain())
+
+    async def close(self) -> None:
+        if self._maintainer is not None:
+            self._maintainer.cancel()
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        while self._idle:
+            await self._discard(self._idle.popleft())
+        if self.session is not None:
+            await self.session.close()
+
+    async def acquire(self) -> aiohttp.ClientWebSocketResponse:
+        """
+        Take a ready Realtime session (session.update already applied).
+
+        The socket belongs to the call from now on: the call closes it, it is
+        never returned to the pool.
+        """
+        if self._expected:
+            self._expected.popleft()
+        now = time.monotonic()
+        while self._idle:
+            idle = self._idle.popleft()
+            if idle.ws.closed or now - idle.created_at > self.max_age:
+                self.evicted += 1
+                await self._discard(idle)
+                continue
+            await self._stop_drain(idle)
+            if idle.ws.closed:
+                self.evicted += 1
+                continue
+            self.hits += 1
+            self._replenish()
+            return idle.ws
+
+        self.misses += 1
+        self._replenish()
+        return await self._connect()
+
+    async def prewarm(self) -> None:
+        """A call is coming: connect a socket for it without waiting for /media-stream."""
+        self._expected.append(time.monotonic())
+        self._replenish()
+
+    def stats(self) -> dict:
+        return {
+            "idle": len(self._idle),
+            "connecting": self._connecting,
+            "expected_calls": len(self._expected),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evicted": self.evicted,
+            "failed": self.failed,
+        }
+
+    def _target(self) -> int:
+        now = time.monotonic()
+        while self._expected and now - self._expected[0] > PREWARM_TTL:
+            self._expected.popleft()
+        return self.size + len(self._expected)
+
+    def _replenish(self) -> None:
+        missing = self._target() - len(self._idle) - self._connecting
+        for _ in range(max(0, missing)):
+            self._connecting += 1
+            self._background(self._add())
+
+    def _background(self, coro) -> None:
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._task_done)
+
+    def _task_done(self, task: asyncio.Task) -> None:
+        self._tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            print("Пул Realtime: ошибка фоновой задачи:", repr(task.exception()))
+
+    async def _add(self) -> None:
+        try:
+            ws = await self._connect()
+        except Exception as e:
+            self.failed += 1
+            print("Пул Realtime: не удалось подключиться:", repr(e))
+            return
+        finally:
+            self._connecting -= 1
+        idle = _Idle(ws, time.monotonic())
+        # The drain task is owned by the _Idle entry (cancelled on acquire or discard).
+        idle.drain = asyncio.create_task(self._drain(idle))
+        idle.drain.add_done_callback(self._drain_done)
+        self._idle.append(idle)
+
+    async def _connect(self) -> aiohttp.ClientWebSocketResponse:
+        ws = await self.session.ws_connect(self.url, headers=self.headers, timeout=CONNECT_TIMEOUT)
+        try:
+            await ws.send_str(json.dumps(self.session_update))
+            await asyncio.wait_for(self._wait_ready(ws), READY_TIMEOUT)
+        except BaseException:
+            await ws.close()
+            raise
+        return ws
+
+    @staticmethod
+    async def _wait_ready(ws: aiohttp.ClientWebSocketResponse) -> None:
+        async for msg in ws:
+            if msg.type != aiohttp.WSMsgType.TEXT:
+                break
+            event = json.loads(msg.data)
+            if event.get("type") == "session.updated":
+                return
+            if event.get("type") == "error":
+                raise RuntimeError(f"session.update отклонён: {event.get('error')}")
+        raise ConnectionError("Realtime WS закрыт до session.updated")
+
+    async def _drain(self, idle: _Idle) -> None:
+        # Server pings are answered inside receive()
+        async for msg in idle.ws:
+            if msg.type == aiohttp.WSMsgType.TEXT and json.loads(msg.data).get("type") == "error":
+                print("Пул Realtime: ошибка в ожидающей сессии:", msg.data)
+                break
+        await idle.ws.close()
+
+    @staticmethod
+    def _drain_done(task: asyncio.Task) -> None:
+        if not task.cancelled() and task.exception() is not None:
+            print("Пул Realtime: ошибка чтения ожидающей сессии:", repr(task.exception()))
+
+    async def _stop_drain(self, idle: _Idle) -> None:
+        if idle.drain is not None and not idle.drain.done():
+            idle.drain.cancel()
+            try:
+                await idle.drain
+            except asyncio.CancelledError:
+                pass
+
+    async def _discard(self, idle: _Idle) -> None:
+        await self._stop_drain(idle)
+        try:
+            await idle.ws.close()
+        except Exception:
+            pass
+
+    async def _maintain(self) -> None:
+        while True:
+            now = time.monotonic()
+            for idle in list(self._idle):
+                if idle.ws.closed or now - idle.created_at > self.max_age:
+                    self._idle.remove(idle)
+                    self.evicted += 1
+                    await self._discard(idle)
+            self._replenish()
+            await asyncio.sleep(MAINTAIN_INTERVAL)
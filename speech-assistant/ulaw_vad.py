@@ -0,0 +1,161 @@
+"""
+Local voice activity gate for the caller's 8 kHz μ-law audio.
+
+Level:
+- A frame's level is its mean power in dBFS. The power comes from one
+  NumPy lookup in a 256-entry table of squared G.711 sample values, so the
+  μ-law bytes are never expanded to PCM.
+- The noise floor follows the quietest frames: it drops immediately and
+  rises slowly, and more slowly still during speech. A frame is speech
+  if it is louder than both `threshold_db` and the noise floor plus
+  `noise_margin_db`.
+
+Gating:
+- Speech opens the gate. Up to `preroll_ms` of the preceding audio is
+  forwarded first, so the server VAD and the transcription get the onset
+  of the first word.
+- The gate closes after `hangover_ms` of silence. This must be longer
+  than the server VAD's silence_duration_ms (500 ms by default), so the
+  server still sees the end of the utterance.
+- While the gate is closed, frames are dropped; `keepalive_ms` > 0 keeps
+  one frame per that much silence.
+- After `barge_in_ms` of continuous speech the gate reports a local
+  speech start, once per utterance (re-armed by SPEECH_START_REARM_MS
+  of silence). This is usually well before the
+  server's input_audio_buffer.speech_started arrives.
+"""
+
+import math
+from collections import deque
+
+import numpy as np
+
+ULAW_BYTES_PER_MS = 8
+# Silence after which the next speech is reported as a new speech start
+SPEECH_START_REARM_MS = 300
+
+
+def _ulaw_to_linear() -> np.ndarray:
+    codes = ~np.arange(256, dtype=np.uint8)
+    exponent = (codes >> 4) & 0x07
+    mantissa = (codes & 0x0F).astype(np.int32)
+    magnitude = (((mantissa << 3) + 0x84) << exponent) - 0x84
+    return np.where(codes & 0x80, -magnitude, magnitude).astype(np.int16)
+
+
+ULAW_TO_LINEAR = _ulaw_to_linear()
+_SQUARED = (ULAW_TO_LINEAR.astype(np.float64) / 32768.0) ** 2
+
+
+def frame_level_db(frame: bytes) -> float:
+    """Mean power of a μ-law frame in dBFS."""
+    power = float(_SQUARED[np.frombuffer(frame, dtype=np.uint8)].mean()) if frame else 0.0
+    return 10.0 * math.log10(max(power, 1e-10))
+
+
+class VoiceGate:
+    def __init__(
+        self,
+        threshold_db: float = -45.0,
+        noise_margin_db: float = 9.0,
+        preroll_ms: int = 300,
+        hangover_ms: int = 800,
+        barge_in_ms: int = 120,
+        keepalive_ms: int = 0,
+        frame_ms: int = 20,
+    ):
+        self.threshold_db = threshold_db
+        self.noise_margin_db = noise_margin_db
+        self.hangover_ms = hangover_ms
+        self.barge_in_ms = barge_in_ms
+        self.keepalive_ms = keepalive_ms
+        self.noise_floor = threshold_db - noise_margin_db
+
+        self._preroll: deque[bytes] = deque(maxlen=max(1, math.ceil(preroll_ms / frame_ms)))
+        self._open = False
+        self._speech_ms = 0.0
+        self._silence_ms = 0.0
+        self._suppressed_ms = 0.0
+        self._announced = False
+
+        self.forwarded = 0
+        self.suppressed = 0
+        self.speech_starts = 0
+
+    def process(self, frame: bytes) -> tuple[list[bytes], bool]:
+        """
+        Gate one μ-law frame.
+
+        :param frame: Raw μ-law bytes (Twilio sends 20 ms = 160 bytes)
+        :return: Frames to forward now (pre-roll first), and whether the caller just started speaking
+        """
+        duration_ms = len(frame) / ULAW_BYTES_PER_MS
+        level = frame_level_db(frame)
+        speech = level > max(self.threshold_db, self.noise_floor + self.noise_margin_db)
+        self._track_noise(level, speech)
+
+        if speech:
+            self._speech_ms += duration_ms
+            self._silence_ms = 0.0
+        else:
+            self._speech_ms = 0.0
+            self._silence_ms += duration_ms
+            if self._silence_ms >= SPEECH_START_REARM_MS:
+                self._announced = False
+
+        started = False
+        if speech and self.barge_in_ms and not self._announced and self._speech_ms >= self.barge_in_ms:
+            self._announced = True
+            self.speech_starts += 1
+            started = True
+
+        if not self._open and speech:
+            self._open = True
+            out = list(self._preroll)
+            out.append(frame)
+            # The pre-roll was counted as suppressed while it was held back.
+            self.suppressed -= len(self._preroll)
+            self._preroll.clear()
+        elif self._open and self._silence_ms >= self.hangover_ms:
+            self._open = False
+            self._suppressed_ms = 0.0
+            out = self._suppress(frame, duration_ms)
+        elif self._open:
+            out = [frame]
+        else:
+            out = self._suppress(frame, duration_ms)
+
+        self.forwarded += len(out)
+        return out, started
+
+    @property
+    def open(self) -> bool:
+        return self._open
+
+    @property
+    def speech_ms(self) -> float:
+        """Length of the current run of speech frames (0 during silence)."""
+        return self._speech_ms
+
+    def stats(self) -> dict:
+        return {
+            "forwarded": self.forwarded,
+            "suppressed": self.suppressed,
+            "speech_starts": self.speech_starts,
+            "noise_floor_db": round(self.noise_floor, 1),
+        }
+
+    def _suppress(self, frame: bytes, duration_ms: float) -> list[bytes]:
+        self._suppressed_ms += duration_ms
+        if self.keepalive_ms and self._suppressed_ms >= self.keepalive_ms:
+            self._suppressed_ms = 0.0
+            return [frame]
+        self._preroll.append(frame)
+        self.suppressed += 1
+        return []
+
+    def _track_noise(self, level: float, speech: bool) -> None:
+        if level < self.noise_floor:
+            self.noise_floor = level
+        else:
+            self.noise_floor += (level - self.noise_floor) * (0.0005 if speech else 0.01)
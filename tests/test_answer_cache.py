@@ -0,0 +1,55 @@
+import asyncio
+import unittest
+
+from bot_core.answer_cache import AnswerCache
+
+
+class SingleFlightTest(unittest.IsolatedAsyncioTestCase):
+    async def test_waiter_survives_cancelled_leader(self):
+        cache = AnswerCache()
+        leader_started = asyncio.Event()
+        calls = 0
+
+        async def slow_factory() -> str:
+            nonlocal calls
+            calls += 1
+            leader_started.set()
+            await asyncio.sleep(60)
+            return "never"
+
+        async def fast_factory() -> str:
+            nonlocal calls
+            calls += 1
+            return "answer"
+
+        leader = asyncio.create_task(cache.get_or_create("ru", "Вопрос?", "fp", slow_factory))
+        await leader_started.wait()
+        waiter = asyncio.create_task(cache.get_or_create("ru", "вопрос", "fp", fast_factory))
+        await asyncio.sleep(0)
+
+        leader.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await leader
+        self.assertEqual(await waiter, "answer")
+        self.assertEqual(calls, 2)
+        self.assertEqual(await cache.get_or_create("ru", "вопрос", "fp", slow_factory), "answer")
+
+    async def test_waiter_gets_leader_answer(self):
+        cache = AnswerCache()
+        release = asyncio.Event()
+
+        async def factory() -> str:
+            await release.wait()
+            return "answer"
+
+        first = asyncio.create_task(cache.get_or_create("en", "Hi", "fp", factory))
+        second = asyncio.create_task(cache.get_or_create("en", "hi!", "fp", factory))
+        await asyncio.sleep(0)
+        release.set()
+        self.assertEqual(await asyncio.gather(first, second), ["answer", "answer"])
+        self.assertEqual(cache.stats()["misses"], 1)
+        self.assertEqual(cache.stats()["coalesced"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()